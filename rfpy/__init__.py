@@ -27,4 +27,5 @@ __author__ = 'Pascal Audet'
 from .rfdata import RFData
 from .hk import HkStack
 from .harmonics import Harmonics
-from .ccp import CCPimage
+from .ccp import CCPimage, CCPvolume
+from .rfarray import RFArray
@@ -0,0 +1,625 @@
+# Copyright 2019 Pascal Audet
+#
+# This file is part of RfPy.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Columnar storage of receiver functions. An
+:class:`~rfpy.archive.RFArchive` object gathers the receiver functions of
+one station, otherwise stored as one ``RF_Data.pkl`` file per event
+folder, into a single table of header values and a single
+memory-mappable array of waveforms, such that selections can be made
+without opening the event folders.
+
+"""
+
+import io
+import os
+import pickle
+import numpy as np
+from pathlib import Path
+from rfpy.rfarray import RFArray
+
+
+class RFArchive(object):
+    """
+    An RFArchive object reads and writes the receiver functions of one
+    station in the folder ``RF_ARCHIVE`` under the station data path
+    (e.g., ``P_DATA/NY.MMPY/RF_ARCHIVE``). The archive contains three
+    files:
+
+    - ``meta.npy``: structured array with one row per event, with the
+      event folder name (field ``key``) followed by the fields defined
+      in :attr:`~rfpy.rfarray.RFArray.columns`
+    - ``data.npy``: array of receiver functions (shape ``nevt, ncomp,
+      npts``), which is memory-mapped when reading
+    - ``header.npz``: sampling interval, time axis, channel names and
+      the manifest of event folders, i.e., the modification time of the
+      ``RF_Data.pkl`` file of each folder when the archive was written
+
+    Readers should only use the archive if it is current (see
+    :meth:`~rfpy.archive.RFArchive.is_current`), i.e., if no event folder
+    was added, removed or modified since.
+
+    Parameters
+    ----------
+    datapath : str or :class:`~pathlib.Path`
+        Path to the station data folder containing the event folders
+
+    """
+
+    columns = [('key', 'U32')] + RFArray.columns
+
+    def __init__(self, datapath):
+
+        self.datapath = Path(datapath)
+        self.path = self.datapath / 'RF_ARCHIVE'
+
+    def exists(self):
+        """
+        Method to check whether the archive exists.
+
+        """
+
+        return ((self.path / 'meta.npy').is_file() and
+                (self.path / 'data.npy').is_file() and
+                (self.path / 'header.npz').is_file())
+
+    def _folders_(self):
+        """
+        Returns the modification time (ns) of the ``RF_Data.pkl`` file of
+        each event folder under ``datapath``, keyed by folder name.
+
+        """
+
+        folders = {}
+        if not self.datapath.is_dir():
+            return folders
+
+        for folder in self.datapath.iterdir():
+
+            # Skip hidden folders and archive
+            if not folder.is_dir() or folder.name.startswith('.') or \
+                    folder == self.path:
+                continue
+
+            try:
+                folders[folder.name] = \
+                    (folder / "RF_Data.pkl").stat().st_mtime_ns
+            except OSError:
+                continue
+
+        return folders
+
+    def manifest(self):
+        """
+        Method to read the manifest of event folders stored with the
+        archive.
+
+        Returns
+        -------
+        folders : dict
+            Modification time (ns) of the ``RF_Data.pkl`` file of each
+            event folder, keyed by folder name. ``None`` if the archive
+            does not exist or has no manifest.
+
+        """
+
+        if not self.exists():
+            return None
+
+        header = np.load(self.path / 'header.npz')
+        if 'folders' not in header.files:
+            return None
+
+        return dict(zip([str(key) for key in header['folders']],
+                        [int(mtime) for mtime in header['mtimes']]))
+
+    def is_current(self):
+        """
+        Method to check whether the archive exists and matches the event
+        folders under ``datapath``, i.e., whether its manifest lists
+        exactly the folders containing a ``RF_Data.pkl`` file, with
+        unchanged modification times.
+
+        """
+
+        manifest = self.manifest()
+        if manifest is None:
+            return False
+
+        return manifest == self._folders_()
+
+    def write(self, keys, rfstreams, folders=None):
+        """
+        Method to write the archive from a list of receiver function
+        streams, replacing any existing archive.
+
+        Parameters
+        ----------
+        keys : list
+            List of event folder names
+        rfstreams : list
+            List of :class:`~obspy.core.Stream` objects containing the
+            receiver functions of each event (as in ``RF_Data.pkl``).
+            Items that are ``None`` (i.e., rejected events) are skipped.
+        folders : dict
+            Manifest of event folders the archive corresponds to (see
+            :meth:`~rfpy.archive.RFArchive.manifest`). Default is the
+            current state of ``datapath``.
+
+        """
+
+        if folders is None:
+            folders = self._folders_()
+
+        pairs = [(key, st) for key, st in zip(keys, rfstreams) if st]
+        pairs.sort(key=lambda pair: pair[0])
+        if len(pairs) == 0:
+            raise(Exception("No receiver functions to archive"))
+
+        npts = set([tr.stats.npts for key, st in pairs for tr in st])
+        if len(npts) > 1:
+            raise(Exception("Receiver functions have different lengths " +
+                            "and cannot be archived: " + str(npts)))
+
+        # Header values from first component of each event
+        rfarray = RFArray.from_stream([st[0] for key, st in pairs])
+        meta = np.zeros(len(pairs), dtype=self.columns)
+        meta['key'] = [key for key, st in pairs]
+        for name, dtype in RFArray.columns:
+            meta[name] = rfarray.meta[name]
+
+        data = np.array([[tr.data for tr in st] for key, st in pairs],
+                        dtype=float)
+        channels = np.array([tr.stats.channel for tr in pairs[0][1]])
+
+        # Write to temporary files and move, such that readers never
+        # see a partially written archive
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_meta = self.path / '.meta.npy'
+        tmp_data = self.path / '.data.npy'
+        np.save(tmp_meta, meta)
+        np.save(tmp_data, data)
+        os.replace(tmp_data, self.path / 'data.npy')
+        self._write_header_(rfarray.delta, rfarray.taxis, channels, folders)
+        os.replace(tmp_meta, self.path / 'meta.npy')
+
+    def _write_header_(self, delta, taxis, channels, folders):
+        """
+        Writes ``header.npz`` to a temporary file and moves it in place.
+
+        """
+
+        tmp_header = self.path / '.header.npz'
+        np.savez(tmp_header, delta=delta, taxis=taxis, channels=channels,
+                 folders=np.array(list(folders.keys()), dtype='U32'),
+                 mtimes=np.array(list(folders.values()), dtype=np.int64))
+        os.replace(tmp_header, self.path / 'header.npz')
+
+    def update(self, keys, rfstreams):
+        """
+        Method to add or replace events in the archive. If the archive
+        does not exist yet, or if event folders other than ``keys`` were
+        added, removed or modified since it was written, it is rebuilt
+        from all event folders with ``migrate``, such that it never holds
+        a subset of the events or outdated receiver functions.
+
+        Otherwise, events already in the archive are overwritten in place
+        and new events are appended, without reading or writing the other
+        rows. The whole archive is only rewritten if the number of rows
+        cannot simply grow (i.e., events are rejected, or new events do
+        not sort after the existing ones) or if the shape of the
+        receiver functions changes. The manifest in ``header.npz`` is
+        written last, such that the archive is not current while rows are
+        being written.
+
+        Parameters
+        ----------
+        keys : list
+            List of event folder names
+        rfstreams : list
+            List of :class:`~obspy.core.Stream` objects containing the
+            receiver functions of each event
+
+        """
+
+        folders = self._folders_()
+        manifest = self.manifest()
+        if manifest is None:
+            self.migrate()
+            return
+
+        # Other folders must be unchanged since the archive was written
+        for key in keys:
+            manifest.pop(key, None)
+        if manifest != dict([(key, mtime) for key, mtime in
+                             folders.items() if key not in keys]):
+            self.migrate()
+            return
+
+        if self._update_rows_(keys, rfstreams, folders):
+            return
+
+        new = dict(zip(keys, rfstreams))
+        meta = self.read_meta()
+        old = [key for key in meta['key'] if key not in new]
+        if len(old) > 0:
+            index = np.flatnonzero(np.isin(meta['key'], old))
+            oldstreams = [self.read(index, component=icomp).to_stream()
+                          for icomp in range(self.ncomp)]
+            for i, key in enumerate(old):
+                new[key] = [st[i] for st in oldstreams]
+
+        self.write(list(new.keys()), list(new.values()), folders=folders)
+
+    def _update_rows_(self, keys, rfstreams, folders):
+        """
+        Writes the receiver functions of ``keys`` over their rows of
+        ``meta.npy`` and ``data.npy`` through memory maps, and appends the
+        rows of new events at the end of both files. Returns ``False``,
+        without writing anything, if the whole archive must be rewritten
+        instead.
+
+        """
+
+        meta = self.read_meta()
+        header = np.load(self.path / 'header.npz')
+        channels = header['channels']
+
+        # Rejected events must not be in the archive
+        rejected = [key for key, st in zip(keys, rfstreams) if not st]
+        if np.any(np.isin(meta['key'], rejected)):
+            return False
+
+        pairs = [(key, st) for key, st in zip(keys, rfstreams) if st]
+        pairs.sort(key=lambda pair: pair[0])
+        if len(pairs) == 0:
+            self._write_header_(header['delta'], header['taxis'], channels,
+                                folders)
+            return True
+
+        # Shape and time axis of receiver functions must be unchanged
+        data = np.load(self.path / 'data.npy', mmap_mode='r')
+        nevt, ncomp, npts = data.shape
+        del data
+        for key, st in pairs:
+            if len(st) != ncomp or \
+                    any([tr.stats.npts != npts for tr in st]):
+                return False
+        rfarray = RFArray.from_stream([st[0] for key, st in pairs])
+        if rfarray.delta != float(header['delta']) or \
+                not np.array_equal(rfarray.taxis, header['taxis']):
+            return False
+
+        # New events must sort after existing ones, such that rows remain
+        # sorted by event folder name
+        index = dict(zip([str(key) for key in meta['key']], range(nevt)))
+        added = [key for key, st in pairs if key not in index]
+        if len(added) > 0 and nevt > 0 and added[0] <= meta['key'][-1]:
+            return False
+
+        rows = np.zeros(len(pairs), dtype=self.columns)
+        rows['key'] = [key for key, st in pairs]
+        for name, dtype in RFArray.columns:
+            rows[name] = rfarray.meta[name]
+        waveforms = np.array([[tr.data for tr in st] for key, st in pairs],
+                             dtype=float)
+
+        # Headers of both files must keep their size to append rows
+        nold = len(pairs) - len(added)
+        if len(added) > 0:
+            appends = [_append_header_(self.path / 'meta.npy', rows[nold:]),
+                       _append_header_(self.path / 'data.npy',
+                                       waveforms[nold:])]
+            if None in appends:
+                return False
+
+        # Overwrite existing rows in place
+        if nold > 0:
+            irow = [index[key] for key, st in pairs[0:nold]]
+            mmeta = np.lib.format.open_memmap(
+                self.path / 'meta.npy', mode='r+')
+            mmeta[irow] = rows[0:nold]
+            mmeta.flush()
+            del mmeta
+            mdata = np.lib.format.open_memmap(
+                self.path / 'data.npy', mode='r+')
+            mdata[irow] = waveforms[0:nold]
+            mdata.flush()
+            del mdata
+
+        # Append new rows
+        if len(added) > 0:
+            _append_(self.path / 'data.npy', waveforms[nold:], *appends[1])
+            _append_(self.path / 'meta.npy', rows[nold:], *appends[0])
+
+        self._write_header_(header['delta'], header['taxis'], channels,
+                            folders)
+
+        return True
+
+    def migrate(self):
+        """
+        Method to build the archive from the ``RF_Data.pkl`` files of all
+        event folders under ``datapath``.
+
+        Returns
+        -------
+        nevt : int
+            Number of events in the archive
+
+        """
+
+        keys = []
+        rfstreams = []
+        folders = {}
+
+        for folder in sorted(self.datapath.iterdir()):
+
+            # Skip hidden folders and archive
+            if not folder.is_dir() or folder.name.startswith('.') or \
+                    folder == self.path:
+                continue
+
+            filename = folder / "RF_Data.pkl"
+            if filename.is_file():
+                # Modification time before reading, such that a file
+                # modified while reading makes the archive out of date
+                folders[folder.name] = filename.stat().st_mtime_ns
+                file = open(filename, "rb")
+                rfstream = pickle.load(file)
+                file.close()
+                if rfstream:
+                    keys.append(folder.name)
+                    rfstreams.append(rfstream)
+
+        if len(keys) == 0:
+            return 0
+
+        self.write(keys, rfstreams, folders=folders)
+
+        return len(keys)
+
+    def read_meta(self):
+        """
+        Method to read the table of header values, without reading the
+        receiver functions.
+
+        Returns
+        -------
+        meta : :class:`~numpy.ndarray`
+            Structured array with one row per event
+
+        """
+
+        return np.load(self.path / 'meta.npy')
+
+    def query(self, phases=None, snr=None, snrh=None, cc=None, tstart=None,
+              tend=None, slowbound=None, bazbound=None):
+        """
+        Method to select events from the table of header values, without
+        reading the receiver functions. All criteria are evaluated at
+        once over the whole table. Criteria left to ``None`` are not
+        applied.
+
+        Parameters
+        ----------
+        phases : list
+            List of phase names to keep (e.g., ``['P', 'PP']``)
+        snr : float
+            Minimum SNR of the vertical (or longitudinal) component
+        snrh : float
+            Minimum SNR of the horizontal (or radial) component
+        cc : float
+            Minimum cross-correlation coefficient
+        tstart : :class:`~obspy.core.UTCDateTime`
+            Events must occur on a day starting after ``tstart``
+        tend : :class:`~obspy.core.UTCDateTime`
+            Events must occur on a day starting before ``tend``
+        slowbound : list
+            Minimum and maximum slowness (s/km)
+        bazbound : list
+            Minimum and maximum back-azimuth (degree)
+
+        Returns
+        -------
+        index : :class:`~numpy.ndarray`
+            Indices of the selected events, i.e., rows of ``meta.npy`` and
+            offsets along the first axis of ``data.npy``, to be passed to
+            ``read``
+
+        """
+
+        meta = self.read_meta()
+        keep = _select_(meta, phases, snr, snrh, cc, slowbound, bazbound)
+
+        # Dates at midnight from event folder names (YYYYMMDD_HHMMSS)
+        if tstart is not None or tend is not None:
+            date = meta['key'].astype('U8')
+            date = np.array([d[0:4]+'-'+d[4:6]+'-'+d[6:8] for d in date],
+                            dtype='datetime64[s]').astype(float)
+            if tstart is not None:
+                keep &= date > tstart.timestamp
+            if tend is not None:
+                keep &= date < tend.timestamp
+
+        return np.flatnonzero(keep)
+
+    @property
+    def ncomp(self):
+        """
+        Number of components stored for each event
+
+        """
+
+        return len(np.load(self.path / 'header.npz')['channels'])
+
+    def read(self, index=None, component=1):
+        """
+        Method to read the receiver functions of one component. The
+        waveforms are memory-mapped, such that only the selected events
+        are read from disk.
+
+        Parameters
+        ----------
+        index : :class:`~numpy.ndarray`
+            Indices (or boolean mask) of the events to read. Default reads
+            all events.
+        component : int
+            Index of component (0, 1 or 2, e.g., for ``ZRT`` alignment
+            the radial component is 1 and the transverse component is 2)
+
+        Returns
+        -------
+        rfarray : :class:`~rfpy.rfarray.RFArray`
+            Receiver functions of the selected events
+
+        """
+
+        meta = self.read_meta()
+        data = np.load(self.path / 'data.npy', mmap_mode='r')
+        header = np.load(self.path / 'header.npz')
+
+        if index is None:
+            index = np.arange(len(meta))
+
+        rfmeta = np.zeros(len(meta), dtype=RFArray.columns)
+        for name, dtype in RFArray.columns:
+            rfmeta[name] = meta[name]
+        rfmeta['channel'] = header['channels'][component]
+
+        return RFArray(data[index, component], rfmeta[index],
+                       float(header['delta']), header['taxis'])
+
+
+def accept(rfstream, phases=None, snr=None, snrh=None, cc=None,
+           slowbound=None, bazbound=None):
+    """
+    Function to apply the criteria of :meth:`~rfpy.archive.RFArchive.query`
+    to the receiver functions of one event folder (as stored in
+    ``RF_Data.pkl``). The header values of the first component are used,
+    i.e., the values stored in the archive, such that reading the event
+    folders selects the same events as querying an archive that is
+    current. Criteria left to ``None`` are not applied.
+
+    Parameters
+    ----------
+    rfstream : :class:`~obspy.core.Stream`
+        Receiver functions of one event
+    phases, snr, snrh, cc, slowbound, bazbound :
+        Selection criteria (see :meth:`~rfpy.archive.RFArchive.query`)
+
+    Returns
+    -------
+    accept : bool
+        Whether the event is selected (``False`` if ``rfstream`` is
+        ``None`` or empty, i.e., the event was rejected)
+
+    """
+
+    if not rfstream:
+        return False
+
+    meta = RFArray.from_stream(rfstream[0:1]).meta
+
+    return bool(_select_(meta, phases, snr, snrh, cc, slowbound,
+                         bazbound)[0])
+
+
+def _select_(meta, phases, snr, snrh, cc, slowbound, bazbound):
+    """
+    Returns the mask of rows of a table of header values that meet all
+    criteria, with inclusive thresholds and bounds. Missing values (NaN)
+    never meet a criterion.
+
+    """
+
+    keep = np.ones(len(meta), dtype=bool)
+
+    if phases is not None:
+        keep &= np.isin(meta['phase'], phases)
+    if snr is not None:
+        keep &= meta['snr'] >= snr
+    if snrh is not None:
+        keep &= meta['snrh'] >= snrh
+    if cc is not None:
+        keep &= meta['cc'] >= cc
+    if slowbound is not None:
+        keep &= (meta['slow'] >= slowbound[0]) & \
+            (meta['slow'] <= slowbound[1])
+    if bazbound is not None:
+        keep &= (meta['baz'] >= bazbound[0]) & \
+            (meta['baz'] <= bazbound[1])
+
+    return keep
+
+
+def _append_header_(filename, rows):
+    """
+    Returns the end of the data and the updated header of a ``.npy`` file
+    to which ``rows`` are appended along the first axis, or ``None`` if the
+    rows do not match the array in the file or if the updated header would
+    not fit in place of the existing one.
+
+    """
+
+    with open(filename, 'rb') as file:
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(file)
+        elif version == (2, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(file)
+        else:
+            return None
+        offset = file.tell()
+
+    if fortran or dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+        return None
+
+    header = io.BytesIO()
+    d = {'descr': np.lib.format.dtype_to_descr(dtype),
+         'fortran_order': False,
+         'shape': (shape[0] + len(rows),) + shape[1:]}
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(header, d)
+    else:
+        np.lib.format.write_array_header_2_0(header, d)
+    if header.tell() != offset:
+        return None
+
+    end = offset + int(np.prod(shape))*dtype.itemsize
+
+    return end, header.getvalue()
+
+
+def _append_(filename, rows, end, header):
+    """
+    Appends ``rows`` to a ``.npy`` file after the existing data, then
+    writes the updated header (see :func:`~rfpy.archive._append_header_`).
+
+    """
+
+    with open(filename, 'r+b') as file:
+        file.seek(end)
+        file.write(np.ascontiguousarray(rows).tobytes())
+        file.truncate()
+        file.seek(0)
+        file.write(header)
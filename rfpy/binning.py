@@ -30,6 +30,7 @@ bins, or both, or for all data, regardless of the x axis (time or depth).
 import numpy as np
 from obspy.core import Stream, Trace
 from scipy.signal import hilbert
+from rfpy import rfarray
 
 
 def bin(stream1, stream2=None, typ='baz', nbin=36+1, pws=False):
@@ -40,10 +41,10 @@ def bin(stream1, stream2=None, typ='baz', nbin=36+1, pws=False):
 
     Parameters
     ----------
-    stream1 : :class:`~obspy.core.Stream`
+    stream1 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream of equal-length seismograms to be stacked into
         a single trace.
-    stream2 : :class:`~obspy.core.Stream`
+    stream2 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Optionally stack a second stream in the same operation.
     dbaz : int
         Number of bazk-azimuth samples in bins
@@ -66,13 +67,13 @@ def bin(stream1, stream2=None, typ='baz', nbin=36+1, pws=False):
     if typ == 'baz':
         bmin = 0
         bmax = 360
-        stat = [stream1[i].stats.baz for i in range(len(stream1))]
+        stat = rfarray.get_column(stream1, 'baz')
     elif typ == 'slow':
-        stat = [stream1[i].stats.slow for i in range(len(stream1))]
+        stat = rfarray.get_column(stream1, 'slow')
         bmin = np.min(np.array(stat))
         bmax = np.max(np.array(stat))
     elif typ == 'dist':
-        stat = [stream1[i].stats.gac for i in range(len(stream1))]
+        stat = rfarray.get_column(stream1, 'gac')
         bmin = np.min(np.array(stat))
         bmax = np.max(np.array(stat))
 
@@ -82,6 +83,9 @@ def bin(stream1, stream2=None, typ='baz', nbin=36+1, pws=False):
     # Digitize stat
     ind = np.digitize(stat, bins)
 
+    # Exclude values outside of bins
+    ind = np.where((ind >= 0) & (ind < nbin), ind, -1)
+
     final_stream = []
 
     for stream in [stream1, stream2]:
@@ -89,52 +93,29 @@ def bin(stream1, stream2=None, typ='baz', nbin=36+1, pws=False):
             # Define empty streams
             binned_stream = Stream()
 
-            # Loop through bins
-            for i in range(nbin):
-
-                nb = 0
-                array = np.zeros(len(stream[0].data))
-                weight = np.zeros(len(stream[0].data), dtype=complex)
-
-                # Loop through stat
-                for j, tr in enumerate(stream):
-
-                    # If index of bins is equal to ind
-                    if i == ind[j]:
-
-                        nb += 1
-                        array += tr.data
-                        hilb = hilbert(tr.data)
-                        phase = np.arctan2(hilb.imag, hilb.real)
-                        weight += np.exp(1j*phase)
-                        
-                        continue
-
-                if nb > 0:
+            # Stack all bins at once
+            keys, counts, arrays = _stack_bins_(stream, ind, pws)
 
-                    # Average and update stats
-                    array /= nb
-                    weight = np.real(abs(weight/np.float(nb)))
+            for i, nb, array in zip(keys, counts, arrays):
 
-                    trace = Trace(header=stream[0].stats)
+                # Update stats
+                trace = Trace(header=stream[0].stats)
+                trace.stats.nbin = nb
+                if typ == 'baz':
+                    trace.stats.baz = bins[i]
+                    trace.stats.slow = None
                     trace.stats.nbin = nb
-                    if typ == 'baz':
-                        trace.stats.baz = bins[i]
-                        trace.stats.slow = None
-                        trace.stats.nbin = nb
-                    elif typ == 'slow': 
-                        trace.stats.slow = bins[i]
-                        trace.stats.baz = None
-                        trace.stats.nbin = nb
-                    elif typ == 'dist':
-                        trace.stats.dist = bins[i]
-                        trace.stats.slow = None
-                        trace.stats.baz = None
-                        trace.stats.nbin = nb
-                    if not pws:
-                        weight = np.ones(len(stream[0].data))
-                    trace.data = weight*array
-                    binned_stream.append(trace)
+                elif typ == 'slow':
+                    trace.stats.slow = bins[i]
+                    trace.stats.baz = None
+                    trace.stats.nbin = nb
+                elif typ == 'dist':
+                    trace.stats.dist = bins[i]
+                    trace.stats.slow = None
+                    trace.stats.baz = None
+                    trace.stats.nbin = nb
+                trace.data = array
+                binned_stream.append(trace)
 
             final_stream.append(binned_stream)
 
@@ -152,10 +133,10 @@ def bin_baz_slow(stream1, stream2=None, nbaz=36+1, nslow=20+1, pws=False):
 
     Parameters
     ----------
-    stream1 : :class:`~obspy.core.Stream`
+    stream1 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream of equal-length seismograms to be stacked into
         a single trace.
-    stream2 : :class:`~obspy.core.Stream`
+    stream2 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Optionally stack a second stream in the same operation.
     dbaz : int
         Number of bazk-azimuth samples in bins
@@ -177,13 +158,17 @@ def bin_baz_slow(stream1, stream2=None, nbaz=36+1, nslow=20+1, pws=False):
     slow_bins = np.linspace(0.04, 0.08, nslow)
 
     # Extract baz and slowness
-    baz = [stream1[i].stats.baz for i in range(len(stream1))]
-    slow = [stream1[i].stats.slow for i in range(len(stream1))]
+    baz = rfarray.get_column(stream1, 'baz')
+    slow = rfarray.get_column(stream1, 'slow')
 
     # Digitize baz and slowness
     ibaz = np.digitize(baz, baz_bins)
     islow = np.digitize(slow, slow_bins)
 
+    # Combine into a single bin index, excluding values outside of bins
+    valid = (ibaz >= 0) & (ibaz < nbaz) & (islow >= 0) & (islow < nslow)
+    ind = np.where(valid, ibaz*nslow + islow, -1)
+
     final_stream = []
 
     for stream in [stream1, stream2]:
@@ -191,43 +176,19 @@ def bin_baz_slow(stream1, stream2=None, nbaz=36+1, nslow=20+1, pws=False):
             # Define empty streams
             binned_stream = Stream()
 
-            # Loop through baz_bins
-            for i in range(nbaz):
-                for j in range(nslow):
-
-                    nbin = 0
-                    array = np.zeros(len(stream[0].data))
-                    weight = np.zeros(len(stream[0].data), dtype=complex)
-
-                    # Loop all traces
-                    for k, tr in enumerate(stream):
+            # Stack all bins at once
+            keys, counts, arrays = _stack_bins_(stream, ind, pws)
 
-                        # If index of baz_bins is equal to ibaz
-                        if i == ibaz[k] and j == islow[k]:
+            for key, nbin, array in zip(keys, counts, arrays):
 
-                            nbin += 1
-                            array += tr.data
-                            hilb = hilbert(tr.data)
-                            phase = np.arctan2(hilb.imag, hilb.real)
-                            weight += np.exp(1j*phase)
-                            
-                            continue
-
-                    if nbin > 0:
-
-                        # Average and update stats
-                        array /= nbin
-                        weight = np.real(abs(weight/nbin))
-
-                        trace = Trace(header=stream[0].stats)
-                        trace.stats.baz = baz_bins[i]
-                        trace.stats.slow = slow_bins[j]
-                        trace.stats.nbin = nbin
-
-                        if not pws:
-                            weight = np.ones(len(stream[0].data))
-                        trace.data = weight*array
-                        binned_stream.append(trace)
+                # Update stats
+                i, j = divmod(key, nslow)
+                trace = Trace(header=stream[0].stats)
+                trace.stats.baz = baz_bins[i]
+                trace.stats.slow = slow_bins[j]
+                trace.stats.nbin = nbin
+                trace.data = array
+                binned_stream.append(trace)
 
             final_stream.append(binned_stream)
 
@@ -244,10 +205,10 @@ def bin_all(stream1, stream2=None, pws=False):
 
     Parameters
     ----------
-    stream1 : :class:`~obspy.core.Stream`
+    stream1 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream of equal-length seismograms to be stacked into
         a single trace.
-    stream2 : :class:`~obspy.core.Stream`
+    stream2 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Optionally stack a second stream in the same operation.
     pws : bool
         Whether or not to perform phase-weighted stacking
@@ -267,16 +228,12 @@ def bin_all(stream1, stream2=None, pws=False):
             # Copy stats from stream1
             stats = stream[0].stats
 
-            # Initialize arrays
-            array = np.zeros(len(stream[0].data))
-            pweight = np.zeros(len(stream[0].data), dtype=complex)
-
-            # Get phase weights
-            for tr in stream:
-                array += tr.data
-                hilb = hilbert(tr.data)
-                phase = np.arctan2(hilb.imag, hilb.real)
-                pweight += np.exp(1j*phase)
+            # Get sum and phase weights of all traces at once
+            data = rfarray.get_data(stream)
+            array = np.sum(data, axis=0)
+            hilb = hilbert(data, axis=-1)
+            phase = np.arctan2(hilb.imag, hilb.real)
+            pweight = np.sum(np.exp(1j*phase), axis=0)
 
             # Normalize
             array = array/len(stream)
@@ -293,3 +250,37 @@ def bin_all(stream1, stream2=None, pws=False):
 
     return stack
 
+
+def _stack_bins_(stream, ind, pws=False):
+    """
+    Stack the traces of a stream that share the same bin index ``ind``
+    using grouped reductions over a single 2D array of data. Traces with
+    negative bin index are excluded. Returns the sorted bin indices that
+    contain at least one trace, the number of traces in each bin, and the
+    stacked data (shape ``nbins, npts``).
+
+    """
+
+    data = rfarray.get_data(stream)
+    ind = np.asarray(ind)
+    keep = ind >= 0
+    if not np.any(keep):
+        return [], [], []
+
+    # Sort traces by bin index
+    order = np.argsort(ind[keep], kind='stable')
+    data = data[keep][order]
+    keys, start, counts = np.unique(
+        ind[keep][order], return_index=True, return_counts=True)
+
+    # Average
+    array = np.add.reduceat(data, start, axis=0)/counts[:, None]
+
+    # Phase weights from all analytic signals at once
+    if pws:
+        hilb = hilbert(data, axis=-1)
+        phase = np.arctan2(hilb.imag, hilb.real)
+        weight = np.add.reduceat(np.exp(1j*phase), start, axis=0)
+        array *= np.real(abs(weight/counts[:, None]))
+
+    return keys, [int(count) for count in counts], array
@@ -30,9 +30,12 @@ import os
 import sys
 import pickle
 import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import scipy as sp
 from scipy.signal import hilbert
-from rfpy import binning
+from scipy.spatial import cKDTree
+from rfpy import binning, shift, rfarray
 import matplotlib.pyplot as plt
 from matplotlib import cm
 
@@ -128,17 +131,20 @@ class CCPimage(object):
         self.dz = dz
         self.dx = dx
 
-        # Get total length of grid from end points
-        xlength = haversine(self.xs_lat1, self.xs_lon1,
-                              self.xs_lat2, self.xs_lon2)
-
-        # number of cells laterally and vertically
-        self.nx = int(np.rint(xlength/self.dx))
+        # number of cells vertically
         self.nz = int(self.dep[-1]/self.dz)
-
-        self.xarray = np.arange(self.nx)*self.dx
         self.zarray = np.arange(self.nz)*self.dz
 
+        # Get total length of grid from end points, if defined
+        if None not in [self.xs_lat1, self.xs_lon1,
+                        self.xs_lat2, self.xs_lon2]:
+            xlength = haversine(self.xs_lat1, self.xs_lon1,
+                                self.xs_lat2, self.xs_lon2)
+
+            # number of cells laterally
+            self.nx = int(np.rint(xlength/self.dx))
+            self.xarray = np.arange(self.nx)*self.dx
+
         # Interpolate Vp and Vs models on depth grid
         if vs is None:
             vs = vp/vpvs
@@ -158,13 +164,16 @@ class CCPimage(object):
 
         Parameters
         ----------
-        rfstream : :class:`~obspy.core.Stream`
+        rfstream : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
             Stream object containing radial receiver functions for one station
 
         """
         if len(rfstream) > 0:
             # fftshift if the time axis starts at negative lags 
-            if rfstream[0].stats.taxis[0]<0.:
+            if isinstance(rfstream, rfarray.RFArray):
+                if rfstream.taxis[0] < 0.:
+                    rfstream.fftshift()
+            elif rfstream[0].stats.taxis[0]<0.:
                 for tr in rfstream:
                     tr.data = np.fft.fftshift(tr.data)
 
@@ -172,7 +181,7 @@ class CCPimage(object):
             self.is_ready_for_prep = True
 
     def prep_data(self, f1=0.05, f2ps=0.5, f2pps=0.25, f2pss=0.2,
-                  nbaz=36+1, nslow=40+1):
+                  nbaz=36+1, nslow=40+1, workers=1):
         """
         Method to pre-process the data and calculate the CCP points for each 
         of the receiver functions. Pre-processing includes the binning to
@@ -200,6 +209,10 @@ class CCPimage(object):
             Number of increments in the back-azimuth bins
         nslow : int
             Number of increments in the slowness bins
+        workers : int
+            Number of processes used to prepare the stations in parallel.
+            The results are merged in the order of ``radialRF``, such that
+            they do not depend on the number of processes.
 
         The following attributes are added to the object:
 
@@ -225,95 +238,27 @@ class CCPimage(object):
         if not self.is_ready_for_prep:
             raise(Exception("CCPimage not ready for pre-prep"))
 
-        ikey = 0
-        total_traces = 0
-
-        # Process streams one at a time
-        for RF in self.radialRF:
-
-            # Bin RFs into back-azimuth and slowness bins to speed up
-            # calculations
-            RFbin = binning.bin_baz_slow(
-                RF, nbaz=nbaz, nslow=nslow)[0]
-            n_traces = len(RFbin)
-            total_traces += n_traces
-
-            amp_ps_tr = np.empty([n_traces, self.nz])
-            amp_pps_tr = np.empty([n_traces, self.nz])
-            amp_pss_tr = np.empty([n_traces, self.nz])
-            lon_tr = np.empty([n_traces, self.nz])
-            lat_tr = np.empty([n_traces, self.nz])
-
-            st_ps = RFbin.copy()
-            st_pps = RFbin.copy()
-            st_pss = RFbin.copy()
-
-            # Filter Ps, Pps and Pss
-            st_ps.filter(
-                'bandpass', freqmin=f1, freqmax=f2ps,
-                corners=4, zerophase=True)
-            st_pps.filter(
-                'bandpass', freqmin=f1, freqmax=f2pps,
-                corners=4, zerophase=True)
-            st_pss.filter(
-                'bandpass', freqmin=f1, freqmax=f2pss,
-                corners=4, zerophase=True)
-            del RFbin
-
-            print("Station: "+st_ps[0].stats.station)
-            for itr in _progressbar(range(len(st_ps)), '', 25):
-
-                # Get raypath and travel time for all phases
-                tt_ps, tt_pps, tt_pss, plon, plat = \
-                    raypath(st_ps[itr], dep=self.zarray, vp=self.vp, vs=self.vs)
-
-                # Now get amplitude of RF at corresponding travel
-                # time along the raypath
-                lon_tr[itr, :] = plon
-                lat_tr[itr, :] = plat
-
-                amp_ps = []
-                amp_pps = []
-                amp_pss = []
-
-                # Loop through travel times and shift RFs to get amplitudes
-                for tt in tt_ps:
-                    a, phase = timeshift(st_ps[itr], tt)
-                    amp_ps.append(a)
-                amp_ps_tr[itr, :] = amp_ps
-
-                # Loop through travel times and shift RFs to get amplitudes
-                for tt in tt_pps:
-                    a, phase = timeshift(st_pps[itr], tt)
-                    amp_pps.append(a)
-                amp_pps_tr[itr, :] = amp_pps
-
-                # Loop through travel times and shift RFs to get amplitudes
-                for tt in tt_pss:
-                    a, phase = timeshift(st_pss[itr], tt)
-                    amp_pss.append(a)
-                amp_pss_tr[itr, :] = amp_pss
-
-            if ikey == 0:
-                amp_ps_depth = amp_ps_tr.transpose()
-                amp_pps_depth = amp_pps_tr.transpose()
-                amp_pss_depth = amp_pss_tr.transpose()
-                lon_depth = lon_tr.transpose()
-                lat_depth = lat_tr.transpose()
-
-            elif ikey > 0:
-                amp_ps_depth = np.concatenate(
-                    (amp_ps_depth, amp_ps_tr.transpose()), axis=1)
-                amp_pps_depth = np.concatenate(
-                    (amp_pps_depth, amp_pps_tr.transpose()), axis=1)
-                amp_pss_depth = np.concatenate(
-                    (amp_pss_depth, amp_pss_tr.transpose()), axis=1)
-                lon_depth = np.concatenate(
-                    (lon_depth, lon_tr.transpose()), axis=1)
-                lat_depth = np.concatenate(
-                    (lat_depth, lat_tr.transpose()), axis=1)
-
-            ikey += 1
+        prep = partial(
+            _prep_station_, f1=f1, f2ps=f2ps, f2pps=f2pps, f2pss=f2pss,
+            nbaz=nbaz, nslow=nslow, dep=self.zarray, vp=self.vp, vs=self.vs)
+
+        # Process streams one at a time or across a pool of processes
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(prep, self.radialRF))
+        else:
+            results = [prep(RF) for RF in self.radialRF]
+
+        amp_ps_depth, amp_pps_depth, amp_pss_depth, lon_depth, lat_depth = \
+            zip(*results)
+        del results
+
+        amp_ps_depth = np.concatenate(amp_ps_depth, axis=1)
+        amp_pps_depth = np.concatenate(amp_pps_depth, axis=1)
+        amp_pss_depth = np.concatenate(amp_pss_depth, axis=1)
+        lon_depth = np.concatenate(lon_depth, axis=1)
+        lat_depth = np.concatenate(lat_depth, axis=1)
+        total_traces = amp_ps_depth.shape[1]
 
         self.amp_ps_depth = amp_ps_depth
         self.amp_pps_depth = amp_pps_depth
@@ -330,8 +275,11 @@ class CCPimage(object):
         Method to project the raypaths onto the 2D profile for each of the three
         phases. The final grid is defined here, using the parameter ``dx`` in km.
         The horizontal extent is pre-determined from the start and end points of 
-        the profile. At the end of this step, the object contains the set of 
-        amplitudes at each of the 2D grid points, for each of the three phases.
+        the profile. Piercing points are assigned to their nearest grid node
+        all at once, and the amplitudes of each phase are sorted by grid cell
+        into flat arrays, along with the offset of each cell in these arrays
+        (compressed sparse row layout) and the number of amplitudes per cell,
+        such that all individual amplitudes are kept for stacking.
         The object is now ready for the methods ``ccp`` and/or ``gccp``, with 
         the corresponding flag updated.
 
@@ -339,15 +287,19 @@ class CCPimage(object):
 
         Other Parameters
         ----------------
+        xs_offsets : :class:`numpy.ndarray`
+            1D array of offsets (of length ``nz*nx + 1``) into the flat
+            amplitude arrays, such that the amplitudes of grid cell
+            ``(iz, ix)`` are found between ``xs_offsets[iz*nx + ix]`` and
+            ``xs_offsets[iz*nx + ix + 1]``
         xs_amps_ps : :class:`numpy.ndarray`
-            3D array of amplitudes (1D array of amplitudes at each grid cell)
-            for the Ps phase
+            1D array of amplitudes sorted by grid cell for the Ps phase
         xs_amps_pps : :class:`numpy.ndarray`
-            3D array of amplitudes (1D array of amplitudes at each grid cell)
-            for the Pps phase
+            1D array of amplitudes sorted by grid cell for the Pps phase
         xs_amps_pss : :class:`numpy.ndarray`
-            3D array of amplitudes (1D array of amplitudes at each grid cell)
-            for the Pss phase
+            1D array of amplitudes sorted by grid cell for the Pss phase
+        xs_count : :class:`numpy.ndarray`
+            2D array of number of amplitudes at each grid cell
         is_ready_for_ccp : boolean
             Flag specifying that the object is ready for the ccp() method
         is_ready_for_gccp : boolean
@@ -363,55 +315,22 @@ class CCPimage(object):
         xs_longitudes = np.asarray(
             np.linspace(self.xs_lon1, self.xs_lon2, self.nx))
 
-        xs_amps_ps = np.zeros((self.nz, self.nx, self.n_traces))
-        xs_amps_pps = np.zeros((self.nz, self.nx, self.n_traces))
-        xs_amps_pss = np.zeros((self.nz, self.nx, self.n_traces))
-
-        for iz in _progressbar(range(self.nz), '', 25):
-
-            for i_coor in range(self.n_traces):
-
-                lat_tr = self.lat_depth[iz, i_coor]
-                lon_tr = self.lon_depth[iz, i_coor]
-                distance_tests = np.empty(self.nx)
-
-                for i_xs in range(self.nx):
-                    lat_xs = xs_latitudes[i_xs]
-                    lon_xs = xs_longitudes[i_xs]
-                    distance_tests[i_xs] = haversine(
-                        lat_xs, lon_xs, lat_tr, lon_tr)
-
-                minimum_distance = np.amin(distance_tests)
-                ix = np.where(distance_tests ==
-                                  np.amin(distance_tests))[0][0]
-
-                nonzero_count = np.count_nonzero(
-                    xs_amps_ps[iz, ix, :])
-                new_amp_ps = self.amp_ps_depth[iz, i_coor]
-                if xs_amps_ps[iz, ix, 0] == 0.:
-                    xs_amps_ps[iz, ix, 0] = new_amp_ps
-                else:
-                    xs_amps_ps[iz, ix, nonzero_count] = new_amp_ps
-
-                nonzero_count = np.count_nonzero(
-                    xs_amps_pps[iz, ix, :])
-                new_amp_pps = self.amp_pps_depth[iz, i_coor]
-                if xs_amps_pps[iz, ix, 0] == 0.:
-                    xs_amps_pps[iz, ix, 0] = new_amp_pps
-                else:
-                    xs_amps_pps[iz, ix, nonzero_count] = new_amp_pps
-
-                nonzero_count = np.count_nonzero(
-                    xs_amps_pss[iz, ix, :])
-                new_amp_pss = self.amp_pss_depth[iz, i_coor]
-                if xs_amps_pss[iz, ix, 0] == 0.:
-                    xs_amps_pss[iz, ix, 0] = new_amp_pss
-                else:
-                    xs_amps_pss[iz, ix, nonzero_count] = new_amp_pss
-
-        self.xs_amps_ps = xs_amps_ps
-        self.xs_amps_pps = xs_amps_pps
-        self.xs_amps_pss = xs_amps_pss
+        # Nearest profile node for all piercing points at once
+        ix = _nearest_(xs_latitudes, xs_longitudes,
+                       self.lat_depth, self.lon_depth)
+
+        # Flat cell index (iz, ix) of each piercing point
+        icell = (np.arange(self.nz)[:, None]*self.nx + ix).ravel()
+        ncell = self.nz*self.nx
+
+        # Sort amplitudes by cell and store the offset of each cell
+        order = np.argsort(icell, kind='stable')
+        count = np.bincount(icell, minlength=ncell)
+        self.xs_offsets = np.concatenate(([0], np.cumsum(count)))
+        self.xs_count = count.reshape(self.nz, self.nx)
+        self.xs_amps_ps = self.amp_ps_depth.ravel()[order]
+        self.xs_amps_pps = self.amp_pps_depth.ravel()[order]
+        self.xs_amps_pss = self.amp_pss_depth.ravel()[order]
         self.is_ready_for_ccp = True
         self.is_ready_for_gccp = True
 
@@ -448,32 +367,50 @@ class CCPimage(object):
         xs_pps_avg = np.zeros((self.nz, self.nx))
         xs_pss_avg = np.zeros((self.nz, self.nx))
 
-        for iz in _progressbar(range(self.nz), '', 25):
+        # Average amplitudes in cells containing at least one value
+        nonzero = self.xs_count > 0
+        count = self.xs_count[nonzero]
+        xs_ps_avg[nonzero] = _cellsum_(
+            self.xs_offsets, self.xs_amps_ps)[nonzero.ravel()]/count
+        xs_pps_avg[nonzero] = _cellsum_(
+            self.xs_offsets, self.xs_amps_pps)[nonzero.ravel()]/count
+        xs_pss_avg[nonzero] = _cellsum_(
+            self.xs_offsets, self.xs_amps_pss)[nonzero.ravel()]/count
+
+        self.xs_ps_avg = xs_ps_avg
+        self.xs_pps_avg = xs_pps_avg
+        self.xs_pss_avg = xs_pss_avg
 
-            for ix in range(self.nx):
+    def cell_amplitudes(self, iz, ix, phase='ps'):
+        """
+        Method to extract all amplitudes that were binned into one grid
+        cell during ``prestack``.
 
-                nonzero_count = np.count_nonzero(self.xs_amps_ps[iz, ix, :])
-                if nonzero_count != 0:
-                    amps_ps = self.xs_amps_ps[iz, ix, 0:nonzero_count]
-                    xs_ps_avg[iz, ix] = np.mean(amps_ps)
+        Parameters
+        ----------
+        iz : int
+            Index of grid cell along depth axis
+        ix : int
+            Index of grid cell along profile
+        phase : str
+            Phase of interest (either `ps`, `pps` or `pss`)
+
+        Returns
+        -------
+        amps : :class:`numpy.ndarray`
+            1D array of amplitudes in the grid cell
 
-                nonzero_count = np.count_nonzero(self.xs_amps_pps[iz, ix, :])
-                if nonzero_count != 0:
-                    amps_pps = self.xs_amps_pps[iz, ix, 0:nonzero_count]
-                    xs_pps_avg[iz, ix] = np.mean(amps_pps)
+        """
 
-                nonzero_count = np.count_nonzero(self.xs_amps_pss[iz, ix, :])
-                if nonzero_count != 0:
-                    amps_pss = self.xs_amps_pss[iz, ix, 0:nonzero_count]
-                    xs_pss_avg[iz, ix] = np.mean(amps_pss)
+        if not self.is_ready_for_ccp:
+            raise(Exception("CCPimage not ready for ccp"))
+        if phase not in ['ps', 'pps', 'pss']:
+            raise(Exception("phase should be one of 'ps', 'pps' or 'pss'"))
 
-        self.xs_ps_avg = xs_ps_avg
-        self.xs_pps_avg = xs_pps_avg
-        self.xs_pss_avg = xs_pss_avg
+        icell = iz*self.nx + ix
+        amps = getattr(self, 'xs_amps_'+phase)
 
-        del self.xs_amps_ps
-        del self.xs_amps_pps
-        del self.xs_amps_pss
+        return amps[self.xs_offsets[icell]:self.xs_offsets[icell+1]]
 
     def gccp(self, wlen=15.):
         """
@@ -828,6 +765,316 @@ class CCPimage(object):
         plt.show()
 
 
+class CCPvolume(CCPimage):
+    """
+    A CCPvolume object contains attributes and methods to produce
+    Common Conversion Point (CCP) stacks for each of the three main phases
+    (Ps, Pps and Pss) on a regular 3D grid of latitude, longitude and depth.
+    The piercing points of all receiver functions are binned into the
+    volume once, after which any number of profiles and depth slices
+    can be extracted without processing the receiver functions again.
+    Data are loaded and prepared as for a
+    :class:`~rfpy.ccp.CCPimage` object (methods ``add_rfstream`` and
+    ``prep_data``).
+
+    Parameters
+    ----------
+    latbound : list
+        List of two floats with the minimum and maximum latitude of the grid
+    lonbound : list
+        List of two floats with the minimum and maximum longitude of the grid
+    dlat : float
+        Grid spacing in latitude (degrees)
+    dlon : float
+        Grid spacing in longitude (degrees)
+    weights : list
+        List of three floats with corresponding weights for the Ps, Pps
+        and Pss phases used during linear, weighted averaging
+    dep : :class:`~numpy.ndarray`
+        Array of depth values defining the 1D background seismic velocity model.
+    vp : :class:`~numpy.ndarray`
+        Array of Vp values defining the 1D background seismic velocity model
+    vpvs : float
+        Constant Vp/Vs ratio for the 1D model.
+
+    Other Parameters
+    ----------------
+    lat_array : :class:`~numpy.ndarray`
+        Latitudes of grid nodes
+    lon_array : :class:`~numpy.ndarray`
+        Longitudes of grid nodes
+    nlat : int
+        Number of grid nodes in latitude
+    nlon : int
+        Number of grid nodes in longitude
+
+    """
+
+    def __init__(self, latbound, lonbound, dlat=0.1, dlon=0.1,
+                 weights=[1., 3., -3.],
+                 dep=np.array([0., 4., 8., 14., 30., 35., 45., 110.]),
+                 vp=np.array([4.0, 5.9, 6.2, 6.3, 6.8, 7.2, 8.0, 8.1]),
+                 vs=None, vpvs=1.73, dz=1.):
+
+        CCPimage.__init__(self, weights=weights, dep=dep, vp=vp, vs=vs,
+                          vpvs=vpvs, dz=dz)
+
+        if not latbound[0] < latbound[1]:
+            raise(Exception("latbound should be increasing"))
+        if not lonbound[0] < lonbound[1]:
+            raise(Exception("lonbound should be increasing"))
+
+        self.dlat = dlat
+        self.dlon = dlon
+        self.nlat = int(np.rint((latbound[1] - latbound[0])/dlat)) + 1
+        self.nlon = int(np.rint((lonbound[1] - lonbound[0])/dlon)) + 1
+        self.lat_array = latbound[0] + np.arange(self.nlat)*dlat
+        self.lon_array = lonbound[0] + np.arange(self.nlon)*dlon
+
+    def prestack(self):
+        """
+        Method to bin the piercing points into the 3D grid for each of the
+        three phases. Each piercing point is assigned to its nearest grid
+        node directly from its coordinates; points outside of the grid are
+        discarded. The object is now ready for the methods ``ccp`` and/or
+        ``gccp``, with the corresponding flag updated.
+
+        The following attributes are added to the object:
+
+        Other Parameters
+        ----------------
+        vol_offsets : :class:`numpy.ndarray`
+            1D array of offsets (of length ``nz*nlat*nlon + 1``) into the
+            flat amplitude arrays, for each grid cell in C order
+        vol_amps_ps : :class:`numpy.ndarray`
+            1D array of amplitudes sorted by grid cell for the Ps phase
+        vol_amps_pps : :class:`numpy.ndarray`
+            1D array of amplitudes sorted by grid cell for the Pps phase
+        vol_amps_pss : :class:`numpy.ndarray`
+            1D array of amplitudes sorted by grid cell for the Pss phase
+        vol_count : :class:`numpy.ndarray`
+            3D array of number of amplitudes at each grid cell
+
+        """
+
+        if not self.is_ready_for_prestack:
+            raise(Exception("CCPvolume not ready for prestack"))
+
+        # Nearest grid node from regular grid spacing
+        ilat = np.rint(
+            (self.lat_depth - self.lat_array[0])/self.dlat).astype(int)
+        ilon = np.rint(
+            (self.lon_depth - self.lon_array[0])/self.dlon).astype(int)
+        iz = np.broadcast_to(np.arange(self.nz)[:, None], ilat.shape)
+        inside = ((ilat >= 0) & (ilat < self.nlat) &
+                  (ilon >= 0) & (ilon < self.nlon))
+
+        shape = (self.nz, self.nlat, self.nlon)
+        icell = np.ravel_multi_index(
+            (iz[inside], ilat[inside], ilon[inside]), shape)
+
+        # Sort amplitudes by cell and store the offset of each cell
+        order = np.argsort(icell, kind='stable')
+        count = np.bincount(icell, minlength=np.prod(shape))
+        self.vol_offsets = np.concatenate(([0], np.cumsum(count)))
+        self.vol_count = count.reshape(shape)
+        self.vol_amps_ps = self.amp_ps_depth[inside][order]
+        self.vol_amps_pps = self.amp_pps_depth[inside][order]
+        self.vol_amps_pss = self.amp_pss_depth[inside][order]
+        self.is_ready_for_ccp = True
+        self.is_ready_for_gccp = True
+
+        del self.amp_ps_depth
+        del self.amp_pps_depth
+        del self.amp_pss_depth
+        del self.lon_depth
+        del self.lat_depth
+
+    def ccp(self):
+        """
+        Method to average the amplitudes at each grid point to produce 3D
+        volumes for each of the three phases.
+
+        The following attributes are added to the object:
+
+        Other Parameters
+        ----------------
+        vol_ps_avg : :class:`numpy.ndarray`
+            3D array of stacked amplitudes for the Ps phase
+        vol_pps_avg : :class:`numpy.ndarray`
+            3D array of stacked amplitudes for the Pps phase
+        vol_pss_avg : :class:`numpy.ndarray`
+            3D array of stacked amplitudes for the Pss phase
+
+        """
+
+        if not self.is_ready_for_ccp:
+            raise(Exception("CCPvolume not ready for ccp"))
+
+        shape = self.vol_count.shape
+        nonzero = self.vol_count > 0
+        count = self.vol_count[nonzero]
+
+        avg = []
+        for amps in [self.vol_amps_ps, self.vol_amps_pps, self.vol_amps_pss]:
+            vol = np.zeros(shape)
+            vol[nonzero] = _cellsum_(
+                self.vol_offsets, amps).reshape(shape)[nonzero]/count
+            avg.append(vol)
+
+        self.vol_ps_avg, self.vol_pps_avg, self.vol_pss_avg = avg
+
+    def gccp(self, wlen=15.):
+        """
+        Method to smooth the averaged volumes in the horizontal directions
+        using a Gaussian function to simulate P-wave sensitivity kernels.
+
+        Parameters
+        ----------
+        wlen : float
+            Wavelength of the P-wave for smoothing (km).
+
+        The following attributes are added to the object:
+
+        Other Parameters
+        ----------------
+        vol_gauss_ps : :class:`numpy.ndarray`
+            3D array of stacked and Gaussian-filtered amplitudes for the
+            Ps phase
+        vol_gauss_pps : :class:`numpy.ndarray`
+            3D array of stacked and Gaussian-filtered amplitudes for the
+            Pps phase
+        vol_gauss_pss : :class:`numpy.ndarray`
+            3D array of stacked and Gaussian-filtered amplitudes for the
+            Pss phase
+
+        """
+
+        if not self.is_ready_for_gccp:
+            raise(Exception("CCPvolume not ready for gccp"))
+        if not hasattr(self, 'vol_ps_avg'):
+            self.ccp()
+
+        import scipy.ndimage as ndimage
+
+        # Grid spacing in km
+        lat2km = 111.
+        dlat = self.dlat*lat2km
+        dlon = self.dlon*lat2km*np.cos(np.radians(np.mean(self.lat_array)))
+        sigma = (0, wlen/dlat, wlen/dlon)
+
+        self.vol_gauss_ps = ndimage.gaussian_filter(
+            self.vol_ps_avg, sigma=sigma)
+        self.vol_gauss_pps = ndimage.gaussian_filter(
+            self.vol_pps_avg, sigma=sigma)
+        self.vol_gauss_pss = ndimage.gaussian_filter(
+            self.vol_pss_avg, sigma=sigma)
+
+    def profile(self, coord_start, coord_end, dx=2.5, typ='ccp'):
+        """
+        Method to extract a 2D profile from the volume by bilinear
+        interpolation of the averaged volumes between grid nodes. The
+        returned object can be stacked and plotted with the methods
+        ``linear_stack``, ``phase_weighted_stack``, ``plot_ccp`` and
+        ``plot_gccp``.
+
+        Parameters
+        ----------
+        coord_start : list
+            List of two floats corresponding to the (latitude, longitude)
+            pair for the start point of the profile
+        coord_end : list
+            List of two floats corresponding to the (latitude, longitude)
+            pair for the end point of the profile
+        dx : float
+            Horizontal cell size of the profile (km)
+        typ : str
+            Type of phase stacks to extract (either `ccp` or `gccp`)
+
+        Returns
+        -------
+        ccpimage : :class:`~rfpy.ccp.CCPimage`
+            Object containing the stacks of the three phases along the
+            profile
+
+        """
+
+        if typ == 'ccp':
+            if not hasattr(self, 'vol_ps_avg'):
+                self.ccp()
+            vols = [self.vol_ps_avg, self.vol_pps_avg, self.vol_pss_avg]
+        elif typ == 'gccp':
+            if not hasattr(self, 'vol_gauss_ps'):
+                self.gccp()
+            vols = [self.vol_gauss_ps, self.vol_gauss_pps, self.vol_gauss_pss]
+        else:
+            raise(Exception("typ should be either 'ccp' or 'gccp'"))
+
+        ccpimage = CCPimage(coord_start=coord_start, coord_end=coord_end,
+                            weights=self.weights, dx=dx, dz=self.dz)
+        ccpimage.dep = self.dep
+        ccpimage.vp = self.vp
+        ccpimage.vs = self.vs
+        ccpimage.nz = self.nz
+        ccpimage.zarray = self.zarray
+
+        xs_latitudes = np.linspace(
+            ccpimage.xs_lat1, ccpimage.xs_lat2, ccpimage.nx)
+        xs_longitudes = np.linspace(
+            ccpimage.xs_lon1, ccpimage.xs_lon2, ccpimage.nx)
+
+        xs = []
+        for vol in vols:
+            interp = sp.interpolate.RegularGridInterpolator(
+                (self.lat_array, self.lon_array), np.moveaxis(vol, 0, -1),
+                bounds_error=False, fill_value=0.)
+            xs.append(interp(
+                np.column_stack((xs_latitudes, xs_longitudes))).transpose())
+
+        if typ == 'ccp':
+            ccpimage.xs_ps_avg, ccpimage.xs_pps_avg, ccpimage.xs_pss_avg = xs
+        else:
+            ccpimage.xs_gauss_ps, ccpimage.xs_gauss_pps, \
+                ccpimage.xs_gauss_pss = xs
+
+        return ccpimage
+
+    def depth_slice(self, depth, typ='ccp'):
+        """
+        Method to extract a depth slice from the volume, as the linear,
+        weighted sum of the three phases at the grid depth nearest to
+        ``depth``.
+
+        Parameters
+        ----------
+        depth : float
+            Depth of the slice (km)
+        typ : str
+            Type of phase stacks to use (either `ccp` or `gccp`)
+
+        Returns
+        -------
+        slice : :class:`~numpy.ndarray`
+            2D array of amplitudes (shape ``nlat, nlon``)
+
+        """
+
+        if typ == 'ccp':
+            if not hasattr(self, 'vol_ps_avg'):
+                self.ccp()
+            vols = [self.vol_ps_avg, self.vol_pps_avg, self.vol_pss_avg]
+        elif typ == 'gccp':
+            if not hasattr(self, 'vol_gauss_ps'):
+                self.gccp()
+            vols = [self.vol_gauss_ps, self.vol_gauss_pps, self.vol_gauss_pss]
+        else:
+            raise(Exception("typ should be either 'ccp' or 'gccp'"))
+
+        iz = int(np.argmin(np.abs(self.zarray - depth)))
+
+        return sum([vol[iz]*w for vol, w in zip(vols, self.weights)])
+
+
 def ppoint_distance(tr, delta_z, vs):
     """
     Calculate horizontal distance for interval delta_z and velocity vs
@@ -926,37 +1173,89 @@ def timeshift(tr, tt):
     ----------
     tr : :class:`~obspy.core.Trace`
         Single trace object to migrate to depth
-    tt : float
-        Travel time (sec)
+    tt : float or :class:`~numpy.ndarray`
+        Travel time(s) (sec). If an array is given, all shifts are
+        calculated at once from the same Fourier transform.
+
+    Returns
+    -------
+    amp : float or :class:`~numpy.ndarray`
+        Amplitude of the shifted trace at zero
+    hilb_tt_phase : float or :class:`~numpy.ndarray`
+        Instantaneous phase of the trace at the nearest sample to tt
 
     """
 
-    # Define frequencies
-    nt = int(tr.stats.npts)
     dt = tr.stats.delta
-    freq = np.fft.fftfreq(int(nt), d=dt)
 
     # Hilbert transform and instantaneous phase
     hilb = hilbert(tr.data)
-    hilb_index = np.rint(tt/dt)
-    hilb_tt = hilb[int(hilb_index)]
+    hilb_index = np.rint(np.asarray(tt)/dt).astype(int)
+    hilb_tt = hilb[hilb_index]
     hilb_tt_phase = np.arctan2(hilb_tt.imag, hilb_tt.real)
 
-    # Fourier transform
-    ftr = np.fft.fft(tr.data)
+    # Fourier timeshift theorem - take first sample from shifted trace
+    amp = shift.Shifter(tr.data, dt).sample(tt)
+
+    return amp, hilb_tt_phase
+
 
-    # Shift using Fourier transform
-    for i in range(len(freq)):
-        # Fourier timeshift theorem
-        ftr[i] = ftr[i]*np.exp(2.*np.pi*1j*freq[i]*tt)
+def _prep_station_(RF, f1, f2ps, f2pps, f2pss, nbaz, nslow, dep, vp, vs):
+    """
+    Bin, filter and migrate the receiver functions of one station. Returns
+    the amplitudes of the Ps, Pps and Pss phases and the longitude and
+    latitude of the piercing points, as arrays of shape ``nz, n_traces``.
 
-    # Back to time domain (inverse Fourier transform)
-    rtr = np.fft.ifft(ftr)
+    """
 
-    # Take first sample from trace (convert to real value)
-    amp = np.real(rtr[0])
+    # Bin RFs into back-azimuth and slowness bins to speed up
+    # calculations
+    RFbin = binning.bin_baz_slow(
+        RF, nbaz=nbaz, nslow=nslow)[0]
+
+    st_ps = RFbin.copy()
+    st_pps = RFbin.copy()
+    st_pss = RFbin.copy()
+
+    # Filter Ps, Pps and Pss
+    st_ps.filter(
+        'bandpass', freqmin=f1, freqmax=f2ps,
+        corners=4, zerophase=True)
+    st_pps.filter(
+        'bandpass', freqmin=f1, freqmax=f2pps,
+        corners=4, zerophase=True)
+    st_pss.filter(
+        'bandpass', freqmin=f1, freqmax=f2pss,
+        corners=4, zerophase=True)
+    del RFbin
+
+    print("Station: "+st_ps[0].stats.station)
+
+    # Get raypaths and travel times for all traces and phases
+    tt_ps, tt_pps, tt_pss, lon_tr, lat_tr = \
+        raypaths(st_ps, dep=dep, vp=vp, vs=vs)
+
+    # Now get amplitude of RFs at corresponding travel
+    # times along the raypaths (shape nz, n_traces)
+    return (_amplitudes_(st_ps, tt_ps),
+            _amplitudes_(st_pps, tt_pps),
+            _amplitudes_(st_pss, tt_pss),
+            lon_tr.transpose(),
+            lat_tr.transpose())
+
+
+def _amplitudes_(stream, tt):
+    """
+    Sample the amplitudes of all traces of a stream at travel times
+    ``tt`` (shape ``ntr, nz``), using a single oversampled analytic
+    signal per trace. Returns an array of shape ``nz, ntr``.
 
-    return amp, hilb_tt_phase
+    """
+
+    data = rfarray.get_data(stream)
+    asig, dt = shift.analytic(data, stream[0].stats.delta)
+
+    return np.real(shift.sample(asig, tt.transpose(), dt))
 
 
 def raypath(tr, dep=None, vp=None, vs=None):
@@ -967,8 +1266,6 @@ def raypath(tr, dep=None, vp=None, vs=None):
     ----------
     tr : :class:`~obspy.core.Trace`
         Single trace object to migrate to depth
-    nz : int
-        Number of layers in interpolation
     dep : :class:`~numpy.ndarray`
         Depth array for velocity model
     vp : :class:`~numpy.ndarray`
@@ -978,42 +1275,88 @@ def raypath(tr, dep=None, vp=None, vs=None):
 
     """
 
+    ttps, ttpps, ttpss, plon, plat = _raypath_(
+        tr.stats.slow, tr.stats.baz, tr.stats.stla, tr.stats.stlo,
+        dep, vp, vs)
+
+    return ttps[0], ttpps[0], ttpss[0], plon[0], plat[0]
+
+
+def raypaths(stream, dep=None, vp=None, vs=None):
+    """
+    Calculate travel times through velocity model for all phases of
+    interest and all traces of a stream at once
+
+    Parameters
+    ----------
+    stream : :class:`~obspy.core.Stream`
+        Stream of receiver functions to migrate to depth
+    dep : :class:`~numpy.ndarray`
+        Depth array for velocity model
+    vp : :class:`~numpy.ndarray`
+        P-wave velocity array for velocity model
+    vs : :class:`~numpy.ndarray`
+        S-wave velocity array for velocity model
+
+    Returns
+    -------
+    ttps, ttpps, ttpss : :class:`~numpy.ndarray`
+        Travel times of the Ps, Pps and Pss phases (shape ``ntr, nz``)
+    plon, plat : :class:`~numpy.ndarray`
+        Longitude and latitude of piercing points (shape ``ntr, nz``)
+
+    """
+
+    slow = rfarray.get_column(stream, 'slow')
+    baz = rfarray.get_column(stream, 'baz')
+    stla = rfarray.get_column(stream, 'stla')
+    stlo = rfarray.get_column(stream, 'stlo')
+
+    return _raypath_(slow, baz, stla, stlo, dep, vp, vs)
+
+
+def _raypath_(slow, baz, stla, stlo, dep, vp, vs):
+    """
+    Calculate travel times and piercing points from cumulative sums
+    over the layers of the velocity model. Station and ray parameters
+    are scalars or 1D arrays (one value per trace).
+
+    """
+
     # Get exact depth parameters
     delta_z = dep[1] - dep[0]
-    nz = len(dep)
-
-    # Define arrays with zeros
-    plat = np.zeros(nz)
-    plon = np.zeros(nz)
-    ttps = np.zeros(nz)
-    ttpps = np.zeros(nz)
-    ttpss = np.zeros(nz)
-
-    # Now loop through all depths
-    for iz in range(nz):
-
-        # Initialize travel time and distance counters
-        dtps = 0.
-        dtpps = 0.
-        dtpss = 0.
-        delta_x = 0.
-
-        # Sum over depths from 0 to iz
-        for i in range(iz):
-            dtps += ttime(tr, delta_z, vp[i], vs[i], 'Ps')
-            dtpps += ttime(tr, delta_z, vp[i], vs[i], 'Pps')
-            dtpss += ttime(tr, delta_z, vp[i], vs[i], 'Pss')
-            delta_x += ppoint_distance(tr, delta_z, vs[i])
-
-        # Get piercing point from distance
-        plo, pla = ppoint(tr, delta_x)
-
-        # Assign values to arrays
-        ttps[iz] = dtps
-        ttpps[iz] = dtpps
-        ttpss[iz] = dtpss
-        plon[iz] = plo
-        plat[iz] = pla
+
+    slow = np.atleast_1d(slow)[:, None]
+    stla = np.atleast_1d(stla)[:, None]
+    stlo = np.atleast_1d(stlo)[:, None]
+    baz = np.atleast_1d(baz)[:, None]*np.pi/180.
+
+    # Vertical slownesses in each layer (shape ntr, nz)
+    qs = np.sqrt((1./vs[None, :])**2 - slow**2)
+    qp = np.sqrt((1./vp[None, :])**2 - slow**2)
+
+    # Travel time and horizontal distance across each layer
+    dtps = delta_z*(qs - qp)
+    dtpps = delta_z*(qs + qp)
+    dtpss = 2.*delta_z*qs
+    delta_x = delta_z*np.tan(np.arcsin(slow*vs[None, :]))
+
+    # Sum over depths from 0 to iz (excluded)
+    def _cumsum(x):
+        csum = np.zeros(x.shape)
+        csum[:, 1:] = np.cumsum(x[:, :-1], axis=1)
+        return csum
+
+    ttps = _cumsum(dtps)
+    ttpps = _cumsum(dtpps)
+    ttpss = _cumsum(dtpss)
+    dist = _cumsum(delta_x)
+
+    # Get piercing point from distance
+    lat2km = 111.
+    lon2km = 90.
+    plat = dist*np.sin(-baz+np.pi/2.)/lat2km + stla
+    plon = dist*np.cos(-baz+np.pi/2.)/lon2km + stlo
 
     return ttps, ttpps, ttpss, plon, plat
 
@@ -1035,6 +1378,55 @@ def haversine(lat, lon, xs_lat, xs_lon):  # great-circle distance (kilometres)
     return np.abs(distance)
 
 
+def _cellsum_(offsets, amps):
+    """
+    Sum flat amplitudes over the grid cells defined by ``offsets``
+
+    """
+
+    icell = np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+
+    return np.bincount(icell, weights=amps, minlength=len(offsets)-1)
+
+
+def _nearest_(xs_lat, xs_lon, lat, lon):
+    """
+    Find the index of the nearest grid node for each point, using a
+    KD-tree on Cartesian coordinates of the unit sphere. The chord
+    distance increases monotonically with the great-circle distance, so
+    the nearest node is the same as with :func:`~rfpy.ccp.haversine`.
+
+    Parameters
+    ----------
+    xs_lat : :class:`~numpy.ndarray`
+        Latitudes of grid nodes
+    xs_lon : :class:`~numpy.ndarray`
+        Longitudes of grid nodes
+    lat : :class:`~numpy.ndarray`
+        Latitudes of points (any shape)
+    lon : :class:`~numpy.ndarray`
+        Longitudes of points (same shape as ``lat``)
+
+    Returns
+    -------
+    ind : :class:`~numpy.ndarray`
+        Index of nearest grid node (same shape as ``lat``)
+
+    """
+
+    def _xyz(lat, lon):
+        lat = np.radians(np.ravel(lat))
+        lon = np.radians(np.ravel(lon))
+        return np.column_stack((np.cos(lat)*np.cos(lon),
+                                np.cos(lat)*np.sin(lon),
+                                np.sin(lat)))
+
+    tree = cKDTree(_xyz(xs_lat, xs_lon))
+    dist, ind = tree.query(_xyz(lat, lon))
+
+    return ind.reshape(np.shape(lat))
+
+
 def _progressbar(it, prefix="", size=60, file=sys.stdout):
     """
     Show progress bar while looping in for loop
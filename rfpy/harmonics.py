@@ -26,7 +26,9 @@ Harmonic decomposition module.
 
 # Import modules and functions
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from obspy.core import Stream, Trace
+from rfpy import rfarray
 import matplotlib.pyplot as plt
 
 
@@ -51,10 +53,10 @@ class Harmonics(object):
 
     Parameters
     ----------
-    radialRF : :class:`~obspy.core.Stream`
+    radialRF : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream object containing the radial-component receiver function
         seismograms
-    transvRF : :class:`~obspy.core.Stream`
+    transvRF : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream object containing the transverse-component receiver function
         seismograms
     azim : float
@@ -94,7 +96,11 @@ class Harmonics(object):
             raise TypeError("__init__() missing 1 required positional argument: 'transvRF'")
 
         # fftshift if the time axis starts at negative lags
-        if radialRF[0].stats.taxis[0]<0.:
+        if isinstance(radialRF, rfarray.RFArray):
+            if radialRF.taxis[0] < 0.:
+                radialRF.fftshift()
+                transvRF.fftshift()
+        elif radialRF[0].stats.taxis[0]<0.:
             for tr in radialRF:
                 tr.data = np.fft.fftshift(tr.data)
             for tr in transvRF:
@@ -141,11 +147,8 @@ class Harmonics(object):
         print('Decomposing receiver functions into baz harmonics')
 
         # Some integers
-        nbin = len(self.radialRF)
-        nz = len(self.radialRF[0].data)
         naz = 180
-        daz = np.float(360/naz)
-        deg2rad = np.pi/180.
+        daz = float(360/naz)
 
         # Define depth range over which to calculate azimuth
         indmin = int(xmin/self.radialRF[0].stats.delta)
@@ -154,80 +157,30 @@ class Harmonics(object):
         # Copy stream stats
         str_stats = self.radialRF[0].stats
 
-        # Initialize work arrays
-        C0 = np.zeros((nz, naz))
-        C1 = np.zeros((nz, naz))
-        C2 = np.zeros((nz, naz))
-        C3 = np.zeros((nz, naz))
-        C4 = np.zeros((nz, naz))
-
-        # Loop over each depth step
-        for iz in range(nz):
-
-            # Build matrices OBS and H for each azimuth
-            for iaz in range(naz):
-
-                # Initialize work arrays
-                OBS = np.zeros(2*nbin)
-                H = np.zeros((2*nbin, 5))
-
-                azim = iaz*daz
-
-                # Radial component
-                for irow, trace in enumerate(self.radialRF):
-
-                    baz = trace.stats.baz
-                    OBS[irow] = trace.data[iz]
-                    H[irow, 0] = 1.0
-                    H[irow, 1] = np.cos(deg2rad*(baz-azim))
-                    H[irow, 2] = np.sin(deg2rad*(baz-azim))
-                    H[irow, 3] = np.cos(2.*deg2rad*(baz-azim))
-                    H[irow, 4] = np.sin(2.*deg2rad*(baz-azim))
-
-                shift = 90.
-
-                # Transverse component
-                for irow, trace in enumerate(self.transvRF):
-
-                    baz = trace.stats.baz
-                    OBS[irow+nbin] = trace.data[iz]
-                    H[irow+nbin, 0] = 0.0
-                    H[irow+nbin, 1] = np.cos(deg2rad*(baz+shift-azim))
-                    H[irow+nbin, 2] = np.sin(deg2rad*(baz+shift-azim))
-                    H[irow+nbin, 3] = np.cos(2.*deg2rad*(baz+shift/2.0-azim))
-                    H[irow+nbin, 4] = np.sin(2.*deg2rad*(baz+shift/2.0-azim))
-
-                # Solve system of equations with truncated SVD
-                u, s, v = np.linalg.svd(H)
-                s[s < 0.001] = 0.
-                CC = np.linalg.solve(s[:, None] * v, u.T.dot(OBS)[:5])
-
-                # Fill up arrays
-                C0[iz, iaz] = np.float(CC[0])
-                C1[iz, iaz] = np.float(CC[1])
-                C2[iz, iaz] = np.float(CC[2])
-                C3[iz, iaz] = np.float(CC[3])
-                C4[iz, iaz] = np.float(CC[4])
+        # Build matrices OBS (all samples) and H (all azimuths)
+        OBS = _observations_(self.radialRF, self.transvRF)
+        H = _design_(_bazs_(self.radialRF), _bazs_(self.transvRF),
+                     np.arange(naz)*daz)
+
+        # Solve system of equations for all samples and azimuths at once
+        # (shape naz, 5, nz)
+        CC = np.matmul(_solver_(H), OBS)
 
         # Minimize variance of third component over specific depth range to
         # find azim
-        C1var = np.zeros(naz)
-        for iaz in range(naz):
-            C1var[iaz] = np.sqrt(np.mean(np.square(C1[indmin:indmax, iaz])))
+        C1var = np.sqrt(np.mean(np.square(CC[:, 1, indmin:indmax]), axis=-1))
         indaz = np.argmin(C1var)
 
-        C0var = np.sqrt(np.mean(np.square(C0[indmin:indmax, indaz])))
-        C1var = np.sqrt(np.mean(np.square(C1[indmin:indmax, indaz])))
-        C2var = np.sqrt(np.mean(np.square(C2[indmin:indmax, indaz])))
-        C3var = np.sqrt(np.mean(np.square(C3[indmin:indmax, indaz])))
-        C4var = np.sqrt(np.mean(np.square(C4[indmin:indmax, indaz])))
+        C0var, C1var, C2var, C3var, C4var = np.sqrt(
+            np.mean(np.square(CC[indaz, :, indmin:indmax]), axis=-1))
+        C0, C1, C2, C3, C4 = CC[indaz]
 
         # Put back into traces
-        A = Trace(data=C0[:, indaz], header=str_stats)
-        B1 = Trace(data=C1[:, indaz], header=str_stats)
-        B2 = Trace(data=C2[:, indaz], header=str_stats)
-        C1 = Trace(data=C3[:, indaz], header=str_stats)
-        C2 = Trace(data=C4[:, indaz], header=str_stats)
+        A = Trace(data=C0, header=str_stats)
+        B1 = Trace(data=C1, header=str_stats)
+        B2 = Trace(data=C2, header=str_stats)
+        C1 = Trace(data=C3, header=str_stats)
+        C2 = Trace(data=C4, header=str_stats)
 
         # Put all treaces into stream
         self.hstream = Stream(traces=[A, B1, B2, C1, C2])
@@ -260,63 +213,15 @@ class Harmonics(object):
         print('Decomposing receiver functions into baz harmonics for azimuth = ',
               azim)
 
-        # Some integers
-        nbin = len(self.radialRF)
-        nz = len(self.radialRF[0].data)
-        deg2rad = np.pi/180.
-
         # Copy stream stats
         str_stats = self.radialRF[0].stats
 
-        # Initialize work arrays
-        C0 = np.zeros(nz)
-        C1 = np.zeros(nz)
-        C2 = np.zeros(nz)
-        C3 = np.zeros(nz)
-        C4 = np.zeros(nz)
-
-        # Loop over each depth step
-        for iz in range(nz):
-
-            # Initialize working arrays
-            OBS = np.zeros(2*nbin)
-            H = np.zeros((2*nbin, 5))
-
-            # Radial component
-            for irow, trace in enumerate(self.radialRF):
-
-                baz = trace.stats.baz
-                OBS[irow] = trace.data[iz]
-                H[irow, 0] = 1.0
-                H[irow, 1] = np.cos(deg2rad*(baz-azim))
-                H[irow, 2] = np.sin(deg2rad*(baz-azim))
-                H[irow, 3] = np.cos(2.*deg2rad*(baz-azim))
-                H[irow, 4] = np.sin(2.*deg2rad*(baz-azim))
-
-            shift = 90.
-
-            # Transverse component
-            for irow, trace in enumerate(self.transvRF):
-
-                baz = trace.stats.baz
-                OBS[irow+nbin] = trace.data[iz]
-                H[irow+nbin, 0] = 0.0
-                H[irow+nbin, 1] = np.cos(deg2rad*(baz+shift-azim))
-                H[irow+nbin, 2] = np.sin(deg2rad*(baz+shift-azim))
-                H[irow+nbin, 3] = np.cos(2.*deg2rad*(baz+shift/2.0-azim))
-                H[irow+nbin, 4] = np.sin(2.*deg2rad*(baz+shift/2.0-azim))
-
-            # Solve system of equations with truncated SVD
-            u, s, v = np.linalg.svd(H)
-            s[s < 0.001] = 0.
-            CC = np.linalg.solve(s[:, None] * v, u.T.dot(OBS)[:5])
-
-            # Fill up arrays
-            C0[iz] = np.float(CC[0])
-            C1[iz] = np.float(CC[1])
-            C2[iz] = np.float(CC[2])
-            C3[iz] = np.float(CC[3])
-            C4[iz] = np.float(CC[4])
+        # Build matrices OBS (all samples) and H
+        OBS = _observations_(self.radialRF, self.transvRF)
+        H = _design_(_bazs_(self.radialRF), _bazs_(self.transvRF), azim)
+
+        # Solve system of equations for all samples at once
+        C0, C1, C2, C3, C4 = np.dot(_solver_(H), OBS)
 
         # Put back into traces
         A = Trace(data=C0, header=str_stats)
@@ -328,7 +233,118 @@ class Harmonics(object):
         # Put all traces into stream
         self.hstream = Stream(traces=[A, B1, B2, C1, C2])
 
-    def forward(self, baz_list=None):
+    def bootstrap(self, nboot=200, method='bootstrap', find_azim=True,
+                  xmin=None, xmax=None, percentiles=[2.5, 97.5],
+                  workers=1, seed=None):
+        """
+        Method to estimate the uncertainty of the harmonics and of the
+        orientation ``azim`` by resampling the receiver functions, either
+        with replacement (bootstrap) or leaving one receiver function out
+        at a time (jackknife). Resampling is implemented as integer weights
+        on the rows of a single design matrix built once, and the harmonics
+        along all trial azimuths are obtained by rotating the harmonics
+        along azimuth 0, such that each resample requires only one small
+        factorization.
+
+        Parameters
+        ----------
+        nboot : int
+            Number of bootstrap resamples (ignored for the jackknife,
+            which uses one resample per receiver function)
+        method : str
+            Resampling method (either `bootstrap` or `jackknife`)
+        find_azim : bool
+            Whether to search for ``azim`` in each resample (as in
+            ``dcomp_find_azim``) or to keep ``azim`` fixed
+            (as in ``dcomp_fix_azim``). In each resample, the 180 degree
+            ambiguity of ``azim`` is resolved against the current value of
+            ``azim``, which should therefore be obtained first with
+            ``dcomp_find_azim``.
+        xmin : float
+            Minimum x axis value over which to calculate ``azim``
+        xmax : float
+            Maximum x axis value over which to calculate ``azim``
+        percentiles : list
+            Lower and upper percentiles of the envelopes
+        workers : int
+            Number of processes over which to spread the resamples
+        seed : int
+            Seed of the random number generator
+
+        Attributes
+        ----------
+        hstream_low : :class:`~obspy.core.Stream`
+            Stream containing the lower percentile of the 5 harmonics
+        hstream_high : :class:`~obspy.core.Stream`
+            Stream containing the upper percentile of the 5 harmonics
+        azim_boot : :class:`~numpy.ndarray`
+            Distribution of ``azim`` over all resamples
+
+        Note
+        ----
+        Jackknife resamples are scaled by ``sqrt(n-1)`` around their mean
+        before calculating the percentiles, such that their spread is
+        consistent with the jackknife estimate of the variance.
+
+        """
+
+        if not xmin:
+            xmin = self.xmin
+        if not xmax:
+            xmax = self.xmax
+        if method not in ['bootstrap', 'jackknife']:
+            raise(Exception("method should be either 'bootstrap' or " +
+                            "'jackknife'"))
+
+        nbin = len(self.radialRF)
+
+        # Weights of each receiver function in each resample
+        if method == 'bootstrap':
+            rng = np.random.default_rng(seed)
+            weights = rng.multinomial(
+                nbin, np.ones(nbin)/nbin, size=nboot).astype(float)
+        else:
+            weights = 1. - np.eye(nbin)
+
+        # Define depth range over which to calculate azimuth
+        indmin = int(xmin/self.radialRF[0].stats.delta)
+        indmax = int(xmax/self.radialRF[0].stats.delta)
+
+        # Build matrices OBS and H once, along azimuth 0
+        OBS = _observations_(self.radialRF, self.transvRF)
+        H = _design_(_bazs_(self.radialRF), _bazs_(self.transvRF), 0.)
+
+        args = (H, OBS, find_azim, self.azim, indmin, indmax)
+
+        print()
+        print('Resampling ('+method+') '+str(len(weights)) +
+              ' decompositions into baz harmonics')
+
+        if workers > 1:
+            chunks = np.array_split(weights, workers)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    _resample_, chunks, *[[arg]*workers for arg in args]))
+            CC = np.concatenate([res[0] for res in results])
+            azims = np.concatenate([res[1] for res in results])
+        else:
+            CC, azims = _resample_(weights, *args)
+
+        if method == 'jackknife':
+            CC = CC.mean(axis=0) + np.sqrt(nbin - 1.)*(CC - CC.mean(axis=0))
+
+        low, high = np.percentile(CC, percentiles, axis=0)
+
+        # Copy stream stats
+        str_stats = self.radialRF[0].stats
+
+        self.hstream_low = Stream(
+            traces=[Trace(data=data, header=str_stats) for data in low])
+        self.hstream_high = Stream(
+            traces=[Trace(data=data, header=str_stats) for data in high])
+        self.azim_boot = azims
+
+    def forward(self, baz_list=None, dense=False):
         """
         Method to forward calculate radial and transverse component
         receiver functions given the 5 pre-determined harmonics and
@@ -338,18 +354,21 @@ class Harmonics(object):
 
         Parameters
         ----------
-        baz_list : list
+        baz_list : list or :class:`~numpy.ndarray`
             List of back-azimuth directions over which to calculate
             the receiver functions. If no list is specified, the method
             will use the same back-azimuths as those in the original
             receiver function streams
+        dense : bool
+            Whether to store the receiver functions as 2D arrays
+            (shape ``nbaz, nz``) instead of streams
 
         Attributes
         ----------
-        radial_forward : :class:`~obspy.core.Stream`
-            Stream containing the radial receiver functions
-        transv_forward : :class:`~obspy.core.Stream`
-            Stream containing the transverse receiver functions
+        radial_forward : :class:`~obspy.core.Stream` or :class:`~numpy.ndarray`
+            Stream (or 2D array) containing the radial receiver functions
+        transv_forward : :class:`~obspy.core.Stream` or :class:`~numpy.ndarray`
+            Stream (or 2D array) containing the transverse receiver functions
 
 
         """
@@ -357,65 +376,41 @@ class Harmonics(object):
         if not hasattr(self, 'hstream'):
             raise(Exception("Decomposition has not been performed yet"))
 
-        if not baz_list:
+        if baz_list is None:
             print("Warning: no BAZ specified - using all baz from " +
                   "stored streams")
-            baz_list = [tr.stats.baz for tr in self.radialRF]
-        if not isinstance(baz_list, list):
-            baz_list = [baz_list]
-
-        # Some constants
-        nz = len(self.hstream[0].data)
-        deg2rad = np.pi/180.
-
-        # Copy traces
-        self.radial_forward = Stream()
-        self.transv_forward = Stream()
-
-        for baz in baz_list:
-            trR = Trace(header=self.hstream[0].stats)
-            trT = Trace(header=self.hstream[0].stats)
+            baz_list = _bazs_(self.radialRF)
+        baz_list = np.atleast_1d(np.asarray(baz_list, dtype=float))
+        nbaz = len(baz_list)
 
-            # Loop over each time/depth step
-            for iz in range(nz):
+        # Matrix of harmonics (shape 5, nz)
+        X = np.array([tr.data for tr in self.hstream])
 
-                # Initialize working arrays
-                X = np.zeros(5)
-                H = np.zeros((2, 5))
+        # Calculate product B = H*X for all back-azimuths at once
+        H = _design_(baz_list, baz_list, self.azim)
+        B = np.dot(H, X)
 
-                # Fill up X array
-                X[0] = hstream[0].data[iz]
-                X[1] = hstream[1].data[iz]
-                X[2] = hstream[2].data[iz]
-                X[3] = hstream[3].data[iz]
-                X[4] = hstream[4].data[iz]
+        # Extract receiver functions
+        radial = B[:nbaz]
+        transv = -B[nbaz:]
 
-                # Fill up H arrays (for V and H)
-                H[0, 0] = 1.0
-                H[0, 1] = np.cos(deg2rad*(baz-self.azim))
-                H[0, 2] = np.sin(deg2rad*(baz-self.azim))
-                H[0, 3] = np.cos(2.*deg2rad*(baz-self.azim))
-                H[0, 4] = np.sin(2.*deg2rad*(baz-self.azim))
+        if dense:
+            self.radial_forward = radial
+            self.transv_forward = transv
+            return
 
-                shift = 90.
-
-                H[1, 0] = 0.0
-                H[1, 1] = np.cos(deg2rad*(baz+shift-self.azim))
-                H[1, 2] = np.sin(deg2rad*(baz+shift-self.azim))
-                H[1, 3] = np.cos(2.*deg2rad*(baz+shift/2.0-self.azim))
-                H[1, 4] = np.sin(2.*deg2rad*(baz+shift/2.0-self.azim))
-
-                # Calculate dot product B = H*X
-                B = np.dot(H, X)
+        self.radial_forward = Stream()
+        self.transv_forward = Stream()
 
-                # Extract receiver functions
-                trR.data[iz] = B[0]
-                trT.data[iz] = -B[1]
+        for baz, dataR, dataT in zip(baz_list, radial, transv):
+            trR = Trace(data=dataR, header=self.hstream[0].stats)
+            trT = Trace(data=dataT, header=self.hstream[0].stats)
+            trR.stats.baz = baz
+            trT.stats.baz = baz
 
             self.radial_forward.append(trR)
             self.transv_forward.append(trT)
 
-
     def plot(self, ymax=30., scale=10., save=False, title=None, form='png'):
         """
         Method to plot the 5 harmonic components.
@@ -494,3 +489,142 @@ class Harmonics(object):
         output = open(file, 'wb')
         pickle.dump(self, output)
         output.close()
+
+
+def _bazs_(stream):
+    """
+    Back-azimuths of all traces in a stream
+
+    """
+
+    return rfarray.get_column(stream, 'baz')
+
+
+def _observations_(radialRF, transvRF):
+    """
+    Matrix of observations with the radial then transverse receiver
+    functions along the rows (shape ``2*nbin, nz``)
+
+    """
+
+    return np.concatenate((rfarray.get_data(radialRF),
+                           rfarray.get_data(transvRF)))
+
+
+def _design_(bazR, bazT, azim):
+    """
+    Design matrix of the harmonic decomposition for back-azimuths ``bazR``
+    (radial) and ``bazT`` (transverse), oriented along one or several
+    azimuths ``azim`` (shape ``azim.shape + (nR + nT, 5)``)
+
+    """
+
+    deg2rad = np.pi/180.
+    shift = 90.
+
+    azim = np.asarray(azim, dtype=float)[..., None]
+
+    # Radial component
+    HR = np.stack(np.broadcast_arrays(
+        np.ones(1),
+        np.cos(deg2rad*(bazR-azim)),
+        np.sin(deg2rad*(bazR-azim)),
+        np.cos(2.*deg2rad*(bazR-azim)),
+        np.sin(2.*deg2rad*(bazR-azim))), axis=-1)
+
+    # Transverse component
+    HT = np.stack(np.broadcast_arrays(
+        np.zeros(1),
+        np.cos(deg2rad*(bazT+shift-azim)),
+        np.sin(deg2rad*(bazT+shift-azim)),
+        np.cos(2.*deg2rad*(bazT+shift/2.0-azim)),
+        np.sin(2.*deg2rad*(bazT+shift/2.0-azim))), axis=-1)
+
+    return np.concatenate((HR, HT), axis=-2)
+
+
+def _solver_(H):
+    """
+    Generalized inverse of design matrices ``H`` from a truncated SVD
+    (shape ``..., 5, nrow``), such that the harmonics of any set of
+    observations ``OBS`` are obtained with a single product
+    ``_solver_(H) @ OBS``
+
+    """
+
+    u, s, v = np.linalg.svd(H, full_matrices=False)
+    s[s < 0.001] = 0.
+
+    return np.linalg.solve(s[..., :, None]*v, np.swapaxes(u, -1, -2))
+
+
+def _rotate_(CC, azim):
+    """
+    Rotate harmonics ``CC`` (shape ``5, ...``) obtained along azimuth 0 to
+    harmonics along one or several azimuths ``azim`` (shape
+    ``azim.shape + (5, ...)``). The design matrix along ``azim`` is the
+    design matrix along 0 times an orthogonal matrix, such that the
+    truncated SVD solutions are related by the same rotation.
+
+    """
+
+    deg2rad = np.pi/180.
+
+    azim = np.asarray(azim, dtype=float)
+    azim = azim.reshape(azim.shape + (1,)*(CC.ndim - 1))
+    ca = np.cos(deg2rad*azim)
+    sa = np.sin(deg2rad*azim)
+    c2a = np.cos(2.*deg2rad*azim)
+    s2a = np.sin(2.*deg2rad*azim)
+
+    return np.stack(np.broadcast_arrays(
+        CC[0],
+        CC[1]*ca + CC[2]*sa,
+        -CC[1]*sa + CC[2]*ca,
+        CC[3]*c2a + CC[4]*s2a,
+        -CC[3]*s2a + CC[4]*c2a), axis=azim.ndim - CC.ndim + 1)
+
+
+def _resample_(weights, H, OBS, find_azim, azim, indmin, indmax):
+    """
+    Harmonic decompositions for resamples of the receiver functions given
+    as weights (shape ``nres, nbin``). ``H`` and ``OBS`` are the design
+    matrix along azimuth 0 and matrix of observations. Returns the
+    harmonics (shape ``nres, 5, nz``) and azimuths (shape ``nres``).
+
+    The RMS of the B1 component is the same along ``azim`` and
+    ``azim + 180``, where the first-order harmonics change sign. The
+    search is therefore done over [0, 180), and of the two equivalent
+    azimuths, the one closest to the reference ``azim`` (i.e., the
+    estimate from all receiver functions) is kept, such that the
+    harmonics of all resamples have consistent signs.
+
+    """
+
+    naz = 180
+    daz = float(360/naz)
+    azims = np.arange(naz//2)*daz
+
+    CC = np.zeros((len(weights), 5, OBS.shape[-1]))
+    azim_res = np.full(len(weights), float(azim))
+
+    for ires, w in enumerate(weights):
+
+        # Duplicating rows is equivalent to weighting by square root
+        # of counts in the least-squares sense
+        w = np.sqrt(np.concatenate((w, w)))[:, None]
+        C0 = np.dot(_solver_(w*H), w*OBS)
+
+        if find_azim:
+            C1 = _rotate_(C0[:, indmin:indmax], azims)[:, 1]
+            C1var = np.sqrt(np.mean(np.square(C1), axis=-1))
+            azim1 = np.argmin(C1var)*daz
+            azim2 = azim1 + 180.
+            if abs((azim2 - azim + 180.) % 360. - 180.) < \
+                    abs((azim1 - azim + 180.) % 360. - 180.):
+                azim1 = azim2
+            azim_res[ires] = azim1
+
+        CC[ires] = _rotate_(C0, azim_res[ires])
+
+    return CC, azim_res
@@ -30,8 +30,8 @@ The stacks are obtained from the median weighted by the phase of individual sign
 
 import numpy as np
 from obspy.core import Stream, Trace, AttribDict
-from scipy.signal import hilbert
 from scipy import stats
+from rfpy import shift, rfarray
 import sys
 from matplotlib import pyplot as plt
 
@@ -57,10 +57,10 @@ class HkStack(object):
 
     Parameters
     ----------
-    rfV1 : :class:`~obspy.core.Stream`
+    rfV1 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream object containing the radial-component receiver function
         seismograms 
-    rfV2 : :class:`~obspy.core.Stream`
+    rfV2 : :class:`~obspy.core.Stream` or :class:`~rfpy.rfarray.RFArray`
         Stream object containing the radial-component receiver function
         seismograms (typically filtered at lower frequencies)
     strike : float
@@ -87,6 +87,15 @@ class HkStack(object):
     phases : list
         List of 3 strings ('ps', 'pps', 'pss') corresponding to the thre phases
         of interest (`do not modify this attribute`)
+    strikebound : list
+        List of 2 floats that determine the range of strike angles to search
+        (upper bound excluded)
+    dstrike : float
+        Spacing between adjacent strike search values
+    dipbound : list
+        List of 2 floats that determine the range of dip angles to search
+    ddip : float
+        Spacing between adjacent dip search values
 
     """
 
@@ -104,7 +113,13 @@ class HkStack(object):
             file.close()
 
         # fftshift if the time axis starts at negative lags
-        if rfV1[0].stats.taxis[0] < 0.:
+        if isinstance(rfV1, rfarray.RFArray):
+            if rfV1.taxis[0] < 0.:
+                nn = rfV1.data.shape[-1]
+                rfV1.fftshift(int(nn/2))
+                if rfV2:
+                    rfV2.fftshift(int(nn/2))
+        elif rfV1[0].stats.taxis[0] < 0.:
             nn = rfV1[0].stats.npts
             for tr in rfV1:
                 tr.data = np.fft.fftshift(tr.data)[0:int(nn/2)]
@@ -127,6 +142,10 @@ class HkStack(object):
         self.dh = 0.5
         self.weights = [0.5, 2., -1.]
         self.phases = ['ps', 'pps', 'pss']
+        self.strikebound = [0., 360.]
+        self.dstrike = 10.
+        self.dipbound = [0., 30.]
+        self.ddip = 5.
 
     def stack(self, vp=None):
         """
@@ -174,42 +193,20 @@ class HkStack(object):
         H = np.arange(self.hbound[0], self.hbound[1] + self.dh, self.dh)
         k = np.arange(self.kbound[0], self.kbound[1] + self.dk, self.dk)
 
-        # Initialize arrays
-        weight = np.complex(0.)
-        amp = np.zeros(len(self.rfV1))
-        sig = np.zeros((len(H), len(k), len(self.phases)))
-        pws = np.zeros((len(H), len(k), len(self.phases)))
-
-        for ih in _progressbar(range(len(H)), 'Computing: ', 15):
-            for ik, kk in enumerate(k):
-                for ip, ph in enumerate(self.phases):
-                    for i in range(len(self.rfV1)):
-
-                        if self.rfV2 and (ph == 'pps' or ph == 'pss'):
-                            rfV = self.rfV2[i].copy()
-                        else:
-                            rfV = self.rfV1[i].copy()
-
-                        # Calculate move out for each phase and get
-                        # median value, weighted by instantaneous phase (pws)
-                        tt = _dtime_(rfV, H[ih], kk, vp, ph)
-                        trace = _timeshift_(rfV, tt)
-                        thilb = hilbert(trace)
-                        tphase = np.arctan2(thilb.imag, thilb.real)
-                        weight += np.exp(1j*tphase[0])
-                        amp[i] = trace[0]
-
-                        # ### Attempt at speeding things up
-                        # ind = (np.abs(rfV.stats.taxis - tt)).argmin()
-                        # trace = rfV.copy()
-                        # thilb = hilbert(trace.data)
-                        # tphase = np.arctan2(thilb.imag, thilb.real)
-                        # weight += np.exp(1j*tphase[ind])
-                        # amp[i] = trace.data[ind]
-
-                    weight = abs(weight/len(self.rfV1))**4
-                    sig[ih, ik, ip] = np.var(amp)*np.real(weight)
-                    pws[ih, ik, ip] = np.median(amp)*np.real(weight)
+        # Analytic signals and slowness values are calculated once for
+        # each stream, and moveout times for unit thickness once for
+        # each phase (travel times scale linearly with H)
+        signals = self._signals()
+        tt1 = []
+        for ph in self.phases:
+            asig, slow, baz, dt = signals[ph]
+            tt1.append(_dtime_(slow, 1., k[:, None], vp, ph))
+
+        # Get median values along move out, weighted by instantaneous
+        # phase (pws)
+        sig, pws = _stack_(
+            signals, self.phases, tt1, H,
+            _progressbar(range(len(H)), 'Computing: ', 15))
 
         self.pws = pws
         self.sig = sig
@@ -274,39 +271,127 @@ class HkStack(object):
         H = np.arange(self.hbound[0], self.hbound[1] + self.dh, self.dh)
         k = np.arange(self.kbound[0], self.kbound[1] + self.dk, self.dk)
 
-        # Initialize arrays
-        weight = np.complex(0.)
-        amp = np.zeros(len(self.rfV1))
-        sig = np.zeros((len(H), len(k), len(self.phases)))
-        pws = np.zeros((len(H), len(k), len(self.phases)))
-
-        for ih in _progressbar(range(len(H)), 'Computing: ', 15):
-            for ik, kk in enumerate(k):
-                for ip, ph in enumerate(self.phases):
-                    for i in range(len(self.rfV1)):
-
-                        if self.rfV2 and (ph == 'pps' or ph == 'pss'):
-                            rfV = self.rfV2[i].copy()
-                        else:
-                            rfV = self.rfV1[i].copy()
-
-                        # Calculate move out for each phase and get
-                        # median value, weighted by instantaneous phase (pws)
-                        tt = _dtime_dip_(
-                            rfV, H[ih], kk, vp, ph, self.strike, self.dip)
-                        trace = _timeshift_(rfV, tt)
-                        thilb = hilbert(trace)
-                        tphase = np.arctan2(thilb.imag, thilb.real)
-                        weight += np.exp(1j*tphase[0])
-                        amp[i] = trace[0]
-
-                    weight = abs(weight/np.float(len(self.rfV1)))**4
-                    sig[ih, ik, ip] = np.var(amp)*np.real(weight)
-                    pws[ih, ik, ip] = np.median(amp)*np.real(weight)
+        # Vector normal to the dipping interface is calculated once,
+        # and the incident slowness vectors once for each trace
+        n = _normal_(self.strike, self.dip)
+        signals = self._signals()
+        tt1 = []
+        for ph in self.phases:
+            asig, slow, baz, dt = signals[ph]
+            pinc = _pinc_(slow, baz)
+            tt1.append(_dtime_dip_(pinc, n, 1., k[:, None], vp, ph))
+
+        # Get median values along move out, weighted by instantaneous
+        # phase (pws)
+        sig, pws = _stack_(
+            signals, self.phases, tt1, H,
+            _progressbar(range(len(H)), 'Computing: ', 15))
 
         self.pws = pws
         self.sig = sig
 
+    def search_dip(self, vp=None, typ='sum'):
+        """
+        Method to calculate Hk stacks from radial receiver functions
+        over a grid of strike and dip angles of the Moho, and find the
+        orientation that maximizes the final stack. The analytic signals
+        and incident slowness vectors of the receiver functions are
+        calculated once and shared by all orientations.
+
+        Note
+        ----
+        The search grid is defined by the attributes ``strikebound``,
+        ``dstrike``, ``dipbound`` and ``ddip``. Once the search is done,
+        the ``strike``, ``dip``, ``pws`` and ``sig`` attributes are set to
+        those of the best-fitting orientation, such that the methods
+        ``average`` and ``plot`` can be used as after ``stack_dip``.
+
+        Parameters
+        ----------
+        vp : float
+            Mean crust P-wave velocity (km/s).
+        typ : str
+            How the phase-weigthed stacks should be combined to find
+            the best orientation. Available options are: weighted sum
+            (``typ=sum``) or product (``typ=product``).
+
+        Attributes
+        ----------
+        strikes : :class:`~numpy.ndarray`
+            Array of strike angles searched
+        dips : :class:`~numpy.ndarray`
+            Array of dip angles searched
+        pws_dip : :class:`~numpy.ndarray`
+            Array of phase stacks for each orientation
+            (shape ``nH, nk, nstrike, ndip, nph``)
+        sig_dip : :class:`~numpy.ndarray`
+            Variance of phase stacks for each orientation
+            (shape ``nH, nk, nstrike, ndip, nph``)
+        dip_stack : :class:`~numpy.ndarray`
+            Final stack for each orientation (shape ``nH, nk, nstrike, ndip``)
+        strike : float
+            Strike angle of the best-fitting orientation
+        dip : float
+            Dip angle of the best-fitting orientation
+
+        """
+
+        # P-wave velocity
+        if not vp:
+            try:
+                vp = self.rfV1[0].stats.vp
+            except:
+                vp = self.vp
+
+        # Initialize arrays based on bounds
+        H = np.arange(self.hbound[0], self.hbound[1] + self.dh, self.dh)
+        k = np.arange(self.kbound[0], self.kbound[1] + self.dk, self.dk)
+        strikes = np.arange(
+            self.strikebound[0], self.strikebound[1], self.dstrike)
+        dips = np.arange(
+            self.dipbound[0], self.dipbound[1] + self.ddip, self.ddip)
+
+        # Initialize arrays
+        nor = [(istr, idip) for istr in range(len(strikes))
+               for idip in range(len(dips))]
+        sig = np.zeros((len(H), len(k), len(strikes), len(dips),
+                        len(self.phases)))
+        pws = np.zeros((len(H), len(k), len(strikes), len(dips),
+                        len(self.phases)))
+
+        # Analytic signals and incident slowness vectors are calculated
+        # once for all orientations
+        signals = self._signals()
+        pinc = []
+        for ph in self.phases:
+            asig, slow, baz, dt = signals[ph]
+            pinc.append(_pinc_(slow, baz))
+
+        for iorient in _progressbar(range(len(nor)), 'Computing: ', 15):
+            istr, idip = nor[iorient]
+
+            n = _normal_(strikes[istr], dips[idip])
+            tt1 = []
+            for ip, ph in enumerate(self.phases):
+                tt1.append(_dtime_dip_(pinc[ip], n, 1., k[:, None], vp, ph))
+
+            sig[:, :, istr, idip, :], pws[:, :, istr, idip, :] = _stack_(
+                signals, self.phases, tt1, H)
+
+        # Final stack and best-fitting orientation
+        stack = _combine_(pws.copy(), self.weights, typ)
+        ind = np.unravel_index(np.nanargmax(stack), stack.shape)
+
+        self.strikes = strikes
+        self.dips = dips
+        self.pws_dip = pws
+        self.sig_dip = sig
+        self.dip_stack = stack
+        self.strike = strikes[ind[2]]
+        self.dip = dips[ind[3]]
+        self.pws = pws[:, :, ind[2], ind[3], :]
+        self.sig = sig[:, :, ind[2], ind[3], :]
+
     def average(self, typ='sum', q=0.05, err_method='amp'):
         """
         Method to combine the phase-weighted stacks to produce a final
@@ -332,34 +417,8 @@ class HkStack(object):
         H = np.arange(self.hbound[0], self.hbound[1] + self.dh, self.dh)
         k = np.arange(self.kbound[0], self.kbound[1] + self.dk, self.dk)
 
-        # Multiply pws by weights
-        ps = self.pws[:, :, 0]*self.weights[0]
-        try:
-            pps = self.pws[:, :, 1]*self.weights[1]
-        except:
-            pps = None
-        try:
-            pss = self.pws[:, :, 2]*self.weights[2]
-        except:
-            pss = None
-
         # Get stacks
-        if typ == 'sum':
-            stack = (ps + pps + pss)
-        elif typ == 'product':
-            # Zero out negative values
-            ps[ps < 0] = 0.
-            if self.weights[1] != 0.:
-                pps[pps < 0] = 0.
-            else:
-                pps = 1.
-            if self.weights[2] != 0.:
-                pss[pss < 0] = 0.
-            else:
-                pss = 1.
-            stack = ps*pps*pss
-        else:
-            raise(Exception("'typ' must be either 'sum' or 'product'"))
+        stack = _combine_(self.pws, self.weights, typ)
 
         self.typ = typ
 
@@ -570,6 +629,29 @@ class HkStack(object):
         pickle.dump(self, output)
         output.close()
 
+    def _signals(self):
+        """
+        Internal method to obtain the analytic signals, slowness and
+        back-azimuth values of the receiver functions used to stack each
+        phase, such that they are calculated only once per stack.
+        """
+
+        ntr = len(self.rfV1)
+        st1 = _rfarrays_(self.rfV1, ntr)
+        if self.rfV2:
+            st2 = _rfarrays_(self.rfV2, ntr)
+        else:
+            st2 = st1
+
+        signals = {}
+        for ph in self.phases:
+            if ph == 'pps' or ph == 'pss':
+                signals[ph] = st2
+            else:
+                signals[ph] = st1
+
+        return signals
+
     def _residuals(self):
         """ 
         Internal method to obtain residuals between observed and predicted
@@ -637,15 +719,15 @@ def _dof(st):
     return dof_max
 
 
-def _dtime_(trace, z, r, vp, ph):
+def _dtime_(slow, z, r, vp, ph):
     """
-    Method to calculate travel time for different scattered phases
+    Method to calculate travel time for different scattered phases.
+    Arguments can be scalars or arrays that broadcast against each
+    other (e.g., ``r`` with shape ``(nk, 1)`` and ``slow`` with shape
+    ``(ntr,)`` to obtain travel times on the whole grid at once).
 
     """
 
-    # Horizontal slowness
-    slow = trace.stats.slow
-
     # Vertical slownesses
     c1 = np.sqrt((r/vp)**2 - slow**2)
     c2 = np.sqrt((1./vp)**2 - slow**2)
@@ -660,37 +742,61 @@ def _dtime_(trace, z, r, vp, ph):
     return tt
 
 
-def _dtime_dip_(trace, z, r, vp, ph, strike, dip):
+def _normal_(strike, dip):
+    """
+    Function to calculate the vector normal to a dipping interface
+
+    """
+
+    dip = dip*np.pi/180.
+    strike = strike*np.pi/180.
+
+    n = np.array([
+        np.sin(strike)*np.sin(dip),
+        -np.cos(strike)*np.sin(dip),
+        np.cos(dip)])
+
+    return n
+
+
+def _pinc_(slow, baz):
+    """
+    Function to calculate the slowness vectors of incident P waves
+    (shape ``3, ntr``) from horizontal slowness and back-azimuth values
+
+    """
+
+    ai = 8.1
+
+    slow = np.asarray(slow)
+    theta = np.asarray(baz)*np.pi/180. + np.pi
+
+    pinc = np.array([
+        slow*np.cos(theta),
+        slow*np.sin(theta),
+        -np.sqrt(1./(ai*ai) - slow*slow)])
+
+    return pinc
+
+
+def _dtime_dip_(pinc, n, z, r, vp, ph):
     """
     Method to calculate travel time for different scattered phases
-    using strike and dip angles
+    using the vector normal to the dipping interface (``n``, see
+    :func:`~rfpy.hk._normal_`) and incident slowness vectors (``pinc``,
+    see :func:`~rfpy.hk._pinc_`). The last axis of ``pinc`` corresponds
+    to the traces, and ``z`` and ``r`` can be arrays that broadcast
+    against it to obtain the whole travel time tensor in one call.
 
     """
 
     # Initialize some parameters
-    n = np.zeros(3)
-    pinc = np.zeros(3)
     ai = 8.1
     br = vp/r
-
-    # Get vector normal to dipping interface
-    dip = dip*np.pi/180.
-    strike = strike*np.pi/180.
-    n[0] = np.sin(strike)*np.sin(dip)
-    n[1] = -np.cos(strike)*np.sin(dip)
-    n[2] = np.cos(dip)
-
-    # Horizontal slowness
-    slow = trace.stats.slow
-    # Back-azimuth
-    baz = trace.stats.baz
+    a = vp*vp
 
     # Assemble constants of incident wave
     c1 = n[2]
-    theta = baz*np.pi/180.+np.pi
-    pinc[0] = slow*np.cos(theta)
-    pinc[1] = slow*np.sin(theta)
-    pinc[2] = -np.sqrt(1./(ai*ai) - slow*slow)
 
     # Calculate scalar product n * pinc
     ndotpi = n[0]*pinc[0] + n[1]*pinc[1] + n[2]*pinc[2]
@@ -698,52 +804,129 @@ def _dtime_dip_(trace, z, r, vp, ph, strike, dip):
     c2 = 1./(ai*ai) - ndotpi**2
 
     if ph == 'ps':
-        a = vp*vp
         tt = z*(c1*(np.sqrt(r*r/a - c2) - np.sqrt(1./a - c2)))
 
     elif ph == 'pps':
-        pref = pinc - ndotpi*n - np.sqrt(1./(vp*vp)-c2)*n
+        qp = np.sqrt(1./a - c2)
+        pref = [pinc[i] - ndotpi*n[i] - qp*n[i] for i in range(3)]
         pref[2] = -pref[2]
-        ndotpr = n[0]*pref[0]+n[1]*pref[1]+n[2]*pref[2]
-        c4 = 1./(vp*vp) - ndotpr**2
-        c3 = 2.*pref[2] - 2.*n[2]*ndotpr
-        a = vp*vp
+        ndotpr = n[0]*pref[0] + n[1]*pref[1] + n[2]*pref[2]
+        c4 = 1./a - ndotpr**2
         tt = z*(c1*(np.sqrt(r*r/a - c4) + np.sqrt(1./a - c4)))
 
     elif ph == 'pss':
-        tt = 2.*z*c1
-        pref = pinc - ndotpi*n - np.sqrt(1./(vp*vp) - c2)*n
+        qp = np.sqrt(1./a - c2)
+        pref = [pinc[i] - ndotpi*n[i] - qp*n[i] for i in range(3)]
         pref[2] = np.sqrt(1./(br*br) - pref[0]*pref[0] - pref[1]*pref[1])
         ndotpr = n[0]*pref[0] + n[1]*pref[1] + n[2]*pref[2]
         c6 = 1./(br*br) - ndotpr**2
-        a = vp*vp
         tt = z*(2.*c1*np.sqrt(r*r/a - c6))
 
     return tt
 
 
-def _timeshift_(trace, tt):
+def _combine_(pws, weights, typ):
+    """
+    Function to combine the phase-weighted stacks (phase index along the
+    last axis) into a final stack, using either a weighted sum or a
+    product of positive values
+
+    """
+
+    # Multiply pws by weights
+    ps = pws[..., 0]*weights[0]
+    try:
+        pps = pws[..., 1]*weights[1]
+    except:
+        pps = None
+    try:
+        pss = pws[..., 2]*weights[2]
+    except:
+        pss = None
+
+    # Get stacks
+    if typ == 'sum':
+        stack = (ps + pps + pss)
+    elif typ == 'product':
+        # Zero out negative values
+        ps[ps < 0] = 0.
+        if weights[1] != 0.:
+            pps[pps < 0] = 0.
+        else:
+            pps = 1.
+        if weights[2] != 0.:
+            pss[pss < 0] = 0.
+        else:
+            pss = 1.
+        stack = ps*pps*pss
+    else:
+        raise(Exception("'typ' must be either 'sum' or 'product'"))
+
+    return stack
+
+
+def _stack_(signals, phases, tt1, H, iterator=None):
+    """
+    Function to calculate the phase-weighted stacks (shape
+    ``nH, nk, nph``) from the moveout times of each phase for unit
+    thickness (shape ``nk, ntr``). ``iterator`` optionally wraps the
+    loop over thickness values (e.g., with a progress bar).
+
+    """
+
+    nk = tt1[0].shape[0]
+    sig = np.zeros((len(H), nk, len(phases)))
+    pws = np.zeros((len(H), nk, len(phases)))
+
+    if iterator is None:
+        iterator = range(len(H))
+
+    for ih in iterator:
+        for ip, ph in enumerate(phases):
+            asig, slow, baz, dt = signals[ph]
+            sig[ih, :, ip], pws[ih, :, ip] = _pws_(
+                asig, H[ih]*tt1[ip], dt)
+
+    return sig, pws
+
+
+def _rfarrays_(stream, ntr, nover=8):
     """
-    Function to shift traces in time given travel time
+    Function to extract the analytic signals, slowness and back-azimuth
+    values and sampling interval from the first ``ntr`` traces of a
+    stream. The signals are oversampled ``nover`` times by Fourier
+    interpolation (shape ``ntr, nover*npts``), such that subsequent
+    linear interpolation approximates a Fourier time shift.
 
     """
 
-    # Define frequencies
-    nt = trace.stats.npts
-    dt = trace.stats.delta
-    freq = np.fft.fftfreq(nt, d=dt)
+    data = rfarray.get_data(stream[0:ntr])
+    asig, dt = shift.analytic(data, stream[0].stats.delta, nover)
+    slow = rfarray.get_column(stream[0:ntr], 'slow')
+    baz = rfarray.get_column(stream[0:ntr], 'baz')
+
+    return asig, slow, baz, dt
+
+
+def _pws_(asig, tt, dt):
+    """
+    Function to calculate the variance and median of the amplitudes
+    sampled at travel times tt, weighted by the coherence of their
+    instantaneous phase. The traces are stacked along the last axis.
+
+    """
 
-    # Fourier transform
-    ftrace = np.fft.fft(trace.data)
+    samp = shift.sample(asig, tt, dt)
+    amp = np.real(samp)
 
-    # Shift
-    for i in range(len(freq)):
-        ftrace[i] = ftrace[i]*np.exp(2.*np.pi*1j*freq[i]*tt)
+    # Phase weight
+    weight = np.exp(1j*np.angle(samp))
+    weight = np.abs(np.mean(weight, axis=-1))**4
 
-    # Back Fourier transform
-    rtrace = np.real(np.fft.ifft(ftrace))
+    sig = np.var(amp, axis=-1)*weight
+    pws = np.median(amp, axis=-1)*weight
 
-    return rtrace
+    return sig, pws
 
 
 def _progressbar(it, prefix="", size=60, file=sys.stdout):
@@ -0,0 +1,232 @@
+# Copyright 2019 Pascal Audet
+#
+# This file is part of RfPy.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Array-backed container for receiver functions. A
+:class:`~rfpy.rfarray.RFArray` object stores the receiver functions of one
+station as a single contiguous 2D array, together with a structured
+array of the header values used during analysis, such that the back-azimuth,
+slowness, etc. of all receiver functions are available as arrays.
+
+The functions :func:`~rfpy.rfarray.get_data` and
+:func:`~rfpy.rfarray.get_column` return the same arrays from either an
+:class:`~rfpy.rfarray.RFArray` or a :class:`~obspy.core.Stream` object.
+
+"""
+
+import numpy as np
+from obspy.core import Stream, Trace, Stats, UTCDateTime
+
+
+class RFArray(object):
+    """
+    An RFArray object contains equal-length receiver functions as a 2D
+    array, with one row per receiver function, and their header values
+    as columns of a structured array. Indexing with an integer returns a
+    :class:`~obspy.core.Trace` whose data is a view into the 2D array,
+    whereas indexing with a slice, an array of indices or a boolean mask
+    returns a new RFArray object.
+
+    Parameters
+    ----------
+    data : :class:`~numpy.ndarray`
+        Array of receiver functions (shape ``ntr, npts``)
+    meta : :class:`~numpy.ndarray`
+        Structured array of header values (shape ``ntr``), with fields
+        defined in ``RFArray.columns``
+    delta : float
+        Sampling interval (sec)
+    taxis : :class:`~numpy.ndarray`
+        Time axis of the receiver functions (sec)
+
+    """
+
+    columns = [('baz', float), ('slow', float), ('gac', float),
+               ('snr', float), ('snrh', float), ('cc', float),
+               ('stla', float), ('stlo', float),
+               ('evla', float), ('evlo', float),
+               ('vp', float), ('vs', float), ('time', float),
+               ('network', 'U8'), ('station', 'U8'), ('location', 'U8'),
+               ('channel', 'U8'), ('phase', 'U8')]
+
+    def __init__(self, data, meta, delta, taxis=None):
+
+        self.data = np.ascontiguousarray(data, dtype=float)
+        self.meta = meta
+        self.delta = delta
+        if taxis is None:
+            taxis = np.arange(self.data.shape[-1])*delta
+        self.taxis = taxis
+
+    @classmethod
+    def from_stream(cls, stream):
+        """
+        Method to create an RFArray object from a
+        :class:`~obspy.core.Stream` object. The data of all traces are
+        copied into a single contiguous array.
+
+        Parameters
+        ----------
+        stream : :class:`~obspy.core.Stream`
+            Stream of equal-length receiver functions
+
+        Returns
+        -------
+        rfarray : :class:`~rfpy.rfarray.RFArray`
+            Array-backed receiver functions
+
+        """
+
+        meta = np.zeros(len(stream), dtype=cls.columns)
+        for name, dtype in cls.columns:
+            if dtype is float:
+                meta[name] = np.nan
+
+        for i, tr in enumerate(stream):
+            for name, dtype in cls.columns:
+                if name == 'time':
+                    meta[name][i] = tr.stats.starttime.timestamp
+                elif name in tr.stats and tr.stats[name] is not None:
+                    meta[name][i] = tr.stats[name]
+
+        data = np.array([tr.data for tr in stream], dtype=float)
+        taxis = stream[0].stats.get('taxis', None)
+
+        return cls(data, meta, stream[0].stats.delta, taxis)
+
+    def to_stream(self):
+        """
+        Method to convert the RFArray object into a
+        :class:`~obspy.core.Stream` object. The data of each trace is a
+        view into the 2D array (i.e., no data is copied).
+
+        Returns
+        -------
+        stream : :class:`~obspy.core.Stream`
+            Stream of receiver functions
+
+        """
+
+        return Stream(traces=[self[i] for i in range(len(self))])
+
+    def copy(self):
+        """
+        Method to return a deep copy of the RFArray object.
+
+        """
+
+        return RFArray(self.data.copy(), self.meta.copy(), self.delta,
+                       np.copy(self.taxis))
+
+    def fftshift(self, npts=None):
+        """
+        Method to fftshift the receiver functions in place, such that the
+        time axis starts at zero lag, and optionally keep only the first
+        ``npts`` samples.
+
+        Parameters
+        ----------
+        npts : int
+            Number of samples to keep
+
+        """
+
+        self.data = np.fft.fftshift(self.data, axes=-1)[:, 0:npts]
+        self.taxis = np.arange(self.data.shape[-1])*self.delta
+
+    def stats(self, i):
+        """
+        Method to obtain the header of one receiver function as a
+        :class:`~obspy.core.Stats` object. Missing header values (NaN)
+        are left out, as in the traces the RFArray was created from.
+
+        Parameters
+        ----------
+        i : int
+            Index of receiver function
+
+        """
+
+        stats = Stats()
+        stats.delta = self.delta
+        stats.npts = self.data.shape[-1]
+        for name, dtype in self.columns:
+            value = self.meta[name][i]
+            if name == 'time':
+                stats.starttime = UTCDateTime(float(value))
+            elif dtype is float:
+                if not np.isnan(value):
+                    stats[name] = float(value)
+            else:
+                stats[name] = str(value)
+        stats.taxis = self.taxis
+        stats.is_rf = True
+
+        return stats
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Trace(data=self.data[index], header=self.stats(index))
+        return RFArray(self.data[index], self.meta[index], self.delta,
+                       self.taxis)
+
+
+def get_data(stream):
+    """
+    Function to obtain the data of all receiver functions as a 2D array
+    (shape ``ntr, npts``) from an :class:`~rfpy.rfarray.RFArray` or a
+    :class:`~obspy.core.Stream` object.
+
+    """
+
+    if isinstance(stream, RFArray):
+        return stream.data
+
+    return np.array([tr.data for tr in stream])
+
+
+def get_column(stream, name):
+    """
+    Function to obtain one header value of all receiver functions as a
+    1D array from an :class:`~rfpy.rfarray.RFArray` or a
+    :class:`~obspy.core.Stream` object. Raises an exception if the
+    header value is missing for any receiver function.
+
+    """
+
+    if isinstance(stream, RFArray):
+        column = stream.meta[name]
+        if column.dtype.kind == 'f':
+            nmiss = int(np.sum(np.isnan(column)))
+            if nmiss > 0:
+                raise(Exception("Header value '{0}' missing for {1} of "
+                                "{2} receiver functions".format(
+                                    name, nmiss, len(column))))
+        return column
+
+    return np.array([tr.stats[name] for tr in stream])
@@ -23,8 +23,10 @@
 # -*- coding: utf-8 -*-
 from math import ceil
 import numpy as np
+from functools import lru_cache
+from scipy.signal import iirfilter, sosfilt
 from obspy import Trace, Stream, UTCDateTime
-from rfpy import utils
+from rfpy import utils, traveltime
 
 
 class Meta(object):
@@ -77,7 +79,6 @@ class Meta(object):
 
         from obspy.geodetics.base import gps2dist_azimuth as epi
         from obspy.geodetics import kilometer2degrees as k2d
-        from obspy.taup import TauPyModel
 
         # Extract event 4D parameters
         self.time = event.origins[0].time
@@ -109,26 +110,14 @@ class Meta(object):
         if self.gac > gacmin and self.gac < gacmax:
 
             # Get travel time info
-            tpmodel = TauPyModel(model='iasp91')
-
-            # Get Travel times (Careful: here dep is in meters)
-            arrivals = tpmodel.get_travel_times(
-                distance_in_degree=self.gac,
-                source_depth_in_km=self.dep,
-                phase_list=[phase])
-            if len(arrivals) > 1:
-                print("arrival has many entries: ", len(arrivals))
-            elif len(arrivals) == 0:
-                print("no arrival found")
+            arrival = traveltime.arrival(self.gac, self.dep, phase=phase)
+            if arrival is None:
                 self.accept = False
                 return
 
-            arrival = arrivals[0]
-
             # Attributes from parameters
-            self.ttime = arrival.time
-            self.slow = arrival.ray_param_sec_degree/111.
-            self.inc = arrival.incident_angle
+            self.ttime, rayp, self.inc = arrival
+            self.slow = rayp/111.
             self.phase = phase
             self.accept = True
         else:
@@ -214,12 +203,10 @@ class RFData(object):
         """
         from obspy.geodetics.base import gps2dist_azimuth as epi
         from obspy.geodetics import kilometer2degrees as k2d
-        from obspy.taup import TauPyModel
         from obspy.core.event.event import Event
 
         if event == 'demo' or event == 'Demo':
             from obspy.clients.fdsn import Client
-            from obspy.core import UTCDateTime
             client = Client()
             # Get catalogue using deployment start and end
             event = client.get_events(
@@ -650,223 +637,9 @@ class RFData(object):
             Stream containing the receiver function traces
 
         """
-        if not self.meta.accept:
-            return
-
-        def _npow2(x):
-            return 1 if x == 0 else 2**(x-1).bit_length()
-
-        def _pad(array, n):
-            tmp = np.zeros(n)
-            tmp[:array.shape[0]] = array
-            return tmp
-
-        def _gauss_filt(dt, nft, f0):
-            df = 1./(nft*dt)
-            nft21 = int(0.5*nft + 1)
-            f = df*np.arange(nft21)
-            w = 2.*np.pi*f
-            gauss = np.zeros(nft)
-            gauss[:nft21] = np.exp(-0.25*(w/f0)**2.)/dt
-            gauss[nft21:] = np.flip(gauss[1:nft21-1])
-            return gauss
-
-        def _decon(parent, daughter1, daughter2, noise_parent, noise_daughter1, nn, method):
-            # Get length, zero padding parameters and frequencies
-            dt = parent.stats.delta
-
-            # Wiener or Water level deconvolution
-            if method == 'wiener' or method == 'water' or method == "wiener_audet_bssa2010":
-
-                # npad = _npow2(nn*2)
-                npad = nn
-                freqs = np.fft.fftfreq(npad, d=dt)
-
-                # Fourier transform
-                Fp = np.fft.fft(parent.data, n=npad)
-                Fd1 = np.fft.fft(daughter1.data, n=npad)
-                Fd2 = np.fft.fft(daughter2.data, n=npad)
-                Fpn = np.fft.fft(noise_parent.data, n=npad)
-                Fd1n = np.fft.fft(noise_daughter1.data, n=npad)
-
-                # Auto and cross spectra
-                Spp = np.real(Fp*np.conjugate(Fp))
-                Sd1p = Fd1*np.conjugate(Fp)
-                Sd2p = Fd2*np.conjugate(Fp)
-                Snpp = np.real(Fpn*np.conjugate(Fpn))
-                Snd1d1 = np.real(Fd1n*np.conjugate(Fd1n))
-                Snpd1 = np.abs(Fd1n*np.conjugate(Fpn))
-
-                # Final processing depends on method
-                if method == 'wiener':
-                    Sdenom = Spp + Snpp
-                # Wiener ad-hoc deconvolution in Audet 2010 - BSSA
-                elif method == "wiener_audet_bssa2010":         
-                    Sdenom = Spp + 0.25*Snpp + 0.25*Snd1d1 + 0.5*Snpd1
-                elif method == 'water':
-                    phi = np.amax(Spp)*wlevel
-                    Sdenom = Spp
-                    Sdenom[Sdenom < phi] = phi
-
-            # Multitaper deconvolution
-            elif method == 'multitaper':
-
-                from spectrum import dpss
-
-                npad = nn
-                # Re-check length and pad with zeros if necessary
-                if not np.allclose(
-                        [tr.stats.npts for tr in [parent,
-                                                  daughter1,
-                                                  daughter2,
-                                                  noise_parent]], npad):
-                    parent.data = _pad(parent.data, npad)
-                    daughter1.data = _pad(daughter1.data, npad)
-                    daughter2.data = _pad(daughter2.data, npad)
-                    noise_parent.data = _pad(noise_parent.data, npad)
-
-                freqs = np.fft.fftfreq(npad, d=dt)
-
-                NW = 2.5
-                Kmax = int(NW*2-2)
-                [tapers, eigenvalues] = dpss(npad, NW, Kmax)
-
-                # Get multitaper spectrum of data
-                Fp = np.fft.fft(np.multiply(tapers.transpose(),
-                                            parent.data))
-                Fd1 = np.fft.fft(np.multiply(tapers.transpose(),
-                                             daughter1.data))
-                Fd2 = np.fft.fft(np.multiply(tapers.transpose(),
-                                             daughter2.data))
-                Fn = np.fft.fft(np.multiply(tapers.transpose(),
-                                            noise_parent.data))
-
-                # Auto and cross spectra
-                Spp = np.sum(np.real(Fp*np.conjugate(Fp)), axis=0)
-                Sd1p = np.sum(Fd1*np.conjugate(Fp), axis=0)
-                Sd2p = np.sum(Fd2*np.conjugate(Fp), axis=0)
-                Snn = np.sum(np.real(Fn*np.conjugate(Fn)), axis=0)
-
-                # Denominator
-                Sdenom = Spp + Snn
-
-            else:
-                print("Method not implemented")
-                pass
-
-            # Apply Gaussian filter?
-            if gfilt:
-                gauss = _gauss_filt(dt, npad, gfilt)
-                gnorm = np.sum(gauss)*(freqs[1]-freqs[0])*dt
-            else:
-                gauss = np.ones(npad)
-                gnorm = 1.
-
-            # Copy traces
-            rfp = parent.copy()
-            rfd1 = daughter1.copy()
-            rfd2 = daughter2.copy()
-
-            # Spectral division and inverse transform
-            rfp.data = np.fft.ifftshift(np.real(np.fft.ifft(
-                gauss*Spp/Sdenom))/gnorm)
-            rfd1.data = np.fft.ifftshift(np.real(np.fft.ifft(
-                gauss*Sd1p/Sdenom))/gnorm)
-            rfd2.data = np.fft.ifftshift(np.real(np.fft.ifft(
-                gauss*Sd2p/Sdenom))/gnorm)
-
-            return rfp, rfd1, rfd2
-
-        if not self.meta.rotated:
-            print("Warning: Data have not been rotated yet - rotating now")
-            self.rotate(vp=vp, vs=vs, align=align)
-
-        if not self.meta.snr:
-            print("Warning: SNR has not been calculated - " +
-                  "calculating now using default")
-            self.calc_snr()
-
-        if hasattr(self, 'rf'):
-            print("Warning: Data have been deconvolved already - passing")
-            return
-
-        # Get the name of components (order is critical here)
-        cL = self.meta.align[0]
-        cQ = self.meta.align[1]
-        cT = self.meta.align[2]
-
-        # Define signal and noise
-        trL = self.data.select(component=cL)[0].copy()
-        trQ = self.data.select(component=cQ)[0].copy()
-        trT = self.data.select(component=cT)[0].copy()
-        trNl = self.data.select(component=cL)[0].copy()
-        trNq = self.data.select(component=cQ)[0].copy()
-
-        if phase == 'P' or 'PP':
-
-            # Get signal length (i.e., seismogram to deconvolve) from trace length
-            dts = len(trL.data)*trL.stats.delta/2.
-            nn = int(round((dts-5.)*trL.stats.sampling_rate)) + 1
-
-            # Signal window (-5. to dts-10 sec)
-            sig_left = self.meta.time+self.meta.ttime-5.
-            sig_right = self.meta.time+self.meta.ttime+dts-10.
-
-            # Trim signal traces
-            [tr.trim(sig_left, sig_right, nearest_sample=False, 
-                pad=nn, fill_value=0.) for tr in [trL, trQ, trT]]
-
-            # Noise window (-dts to -5. sec)
-            noise_left = self.meta.time+self.meta.ttime-dts
-            noise_right = self.meta.time+self.meta.ttime-5.
-
-            # Trim noise traces
-            [tr.trim(noise_left, noise_right, nearest_sample=False, 
-                pad=nn, fill_value=0.) for tr in [trNl, trNq]]
-
-        elif phase == 'S' or 'SKS':
-
-            # Get signal length (i.e., seismogram to deconvolve) from trace length
-            dts = len(trL.data)*trL.stats.delta/2.
-
-            # Trim signal traces (-5. to dts-10 sec)
-            trL.trim(self.meta.time+self.meta.ttime+25.-dts/2.,
-                     self.meta.time+self.meta.ttime+25.)
-            trQ.trim(self.meta.time+self.meta.ttime+25.-dts/2.,
-                     self.meta.time+self.meta.ttime+25.)
-            trT.trim(self.meta.time+self.meta.ttime+25.-dts/2.,
-                     self.meta.time+self.meta.ttime+25.)
-            
-            # Trim noise traces (-dts to -5 sec)
-            trNl.trim(self.meta.time+self.meta.ttime-dts,
-                      self.meta.time+self.meta.ttime-dts/2.)
-            trNq.trim(self.meta.time+self.meta.ttime-dts,
-                      self.meta.time+self.meta.ttime-dts/2.)
-
-        # Taper traces - only necessary processing after trimming
-        [tr.taper(max_percentage=0.05, max_length=2.) 
-         for tr in [trL, trQ, trT, trNl, trNq]]
-
-        # Pre-filter waveforms before deconvolution
-        if pre_filt:
-            [tr.filter('bandpass', freqmin=pre_filt[0], freqmax=pre_filt[1],
-                       corners=2, zerophase=True) 
-             for tr in [trL, trQ, trT, trNl, trNq]]
-
-        # Deconvolve
-        if phase == 'P' or 'PP':
-            rfL, rfQ, rfT = _decon(trL, trQ, trT, trNl, trNq, nn, method)
-
-        elif phase == 'S' or 'SKS':
-            rfQ, rfL, rfT = _decon(trQ, trL, trT, trNq, trNl, nn, method)
-
-        # Update stats of streams
-        rfL.stats.channel = 'RF' + self.meta.align[0]
-        rfQ.stats.channel = 'RF' + self.meta.align[1]
-        rfT.stats.channel = 'RF' + self.meta.align[2]
-
-        self.rf = Stream(traces=[rfL, rfQ, rfT])
-
+        deconvolve([self], phase=phase, vp=vp, vs=vs, align=align,
+                   method=method, pre_filt=pre_filt, gfilt=gfilt,
+                   wlevel=wlevel)
 
     def calc_cc(self):
 
@@ -960,3 +733,364 @@ class RFData(object):
         output = open(file, 'wb')
         pickle.dump(self, output)
         output.close()
+
+
+@lru_cache(maxsize=None)
+def _gauss_filt_(dt, nft, f0):
+    """
+    Returns the (cached) Gaussian filter of center frequency ``f0`` for
+    ``nft`` frequencies.
+
+    """
+
+    df = 1./(nft*dt)
+    nft21 = int(0.5*nft + 1)
+    f = df*np.arange(nft21)
+    w = 2.*np.pi*f
+    gauss = np.zeros(nft)
+    gauss[:nft21] = np.exp(-0.25*(w/f0)**2.)/dt
+    gauss[nft21:] = np.flip(gauss[1:nft21-1])
+    gauss.flags.writeable = False
+    return gauss
+
+
+@lru_cache(maxsize=None)
+def _taper_(npts, sampling_rate):
+    """
+    Returns the (cached) taper applied to traces of ``npts`` samples before
+    deconvolution, as obtained with :meth:`~obspy.core.Trace.taper`.
+
+    """
+
+    tr = Trace(data=np.ones(npts), header={'sampling_rate': sampling_rate})
+    taper = tr.taper(max_percentage=0.05, max_length=2.).data
+    taper.flags.writeable = False
+    return taper
+
+
+@lru_cache(maxsize=None)
+def _dpss_(npts, NW, Kmax):
+    """
+    Returns the (cached) Slepian tapers used in multitaper deconvolution.
+
+    """
+
+    from spectrum import dpss
+
+    tapers, eigenvalues = dpss(npts, NW, Kmax)
+    tapers = np.asarray(tapers).T
+    tapers.flags.writeable = False
+    return tapers
+
+
+def _bandpass_(data, freqmin, freqmax, df):
+    """
+    Applies a zero-phase, 2-corner Butterworth bandpass filter along the
+    last axis of ``data``, as :meth:`~obspy.core.Trace.filter`.
+
+    """
+
+    fe = 0.5*df
+    if freqmax/fe - 1.0 > -1e-6:
+        print("Warning: High corner frequency of pre-filter is at or " +
+              "above Nyquist - applying a high-pass instead")
+        sos = iirfilter(2, freqmin/fe, btype='highpass', ftype='butter',
+                        output='sos')
+    else:
+        sos = iirfilter(2, [freqmin/fe, freqmax/fe], btype='band',
+                        ftype='butter', output='sos')
+    data = np.flip(sosfilt(sos, data, axis=-1), axis=-1)
+    return np.flip(sosfilt(sos, data, axis=-1), axis=-1)
+
+
+def _fit_(data, n):
+    """
+    Zero-pads or truncates arrays along the last axis to ``n`` samples.
+
+    """
+
+    out = np.zeros(data.shape[:-1] + (n,))
+    nmin = min(n, data.shape[-1])
+    out[..., :nmin] = data[..., :nmin]
+    return out
+
+
+def _windows_(rfdata, phase):
+    """
+    Returns the signal and noise windows of one event, which are used in
+    deconvolution.
+
+    Returns
+    -------
+    sig : list
+        List of :class:`~obspy.core.Trace` objects of signal windows
+        (L, Q and T components)
+    noise : list
+        List of :class:`~obspy.core.Trace` objects of noise windows
+        (L and Q components)
+    nn : int
+        Number of samples of receiver functions
+
+    """
+
+    meta = rfdata.meta
+
+    # Get the name of components (order is critical here)
+    cL = meta.align[0]
+    cQ = meta.align[1]
+    cT = meta.align[2]
+
+    # Define signal and noise
+    trL = rfdata.data.select(component=cL)[0].copy()
+    trQ = rfdata.data.select(component=cQ)[0].copy()
+    trT = rfdata.data.select(component=cT)[0].copy()
+    trNl = rfdata.data.select(component=cL)[0].copy()
+    trNq = rfdata.data.select(component=cQ)[0].copy()
+
+    # Get signal length (i.e., seismogram to deconvolve) from trace length
+    dts = len(trL.data)*trL.stats.delta/2.
+    nn = int(round((dts-5.)*trL.stats.sampling_rate)) + 1
+
+    if phase == 'P' or 'PP':
+
+        # Signal window (-5. to dts-10 sec)
+        sig_left = meta.time+meta.ttime-5.
+        sig_right = meta.time+meta.ttime+dts-10.
+
+        # Trim signal traces
+        [tr.trim(sig_left, sig_right, nearest_sample=False,
+            pad=nn, fill_value=0.) for tr in [trL, trQ, trT]]
+
+        # Noise window (-dts to -5. sec)
+        noise_left = meta.time+meta.ttime-dts
+        noise_right = meta.time+meta.ttime-5.
+
+        # Trim noise traces
+        [tr.trim(noise_left, noise_right, nearest_sample=False,
+            pad=nn, fill_value=0.) for tr in [trNl, trNq]]
+
+    elif phase == 'S' or 'SKS':
+
+        # Trim signal traces (-5. to dts-10 sec)
+        trL.trim(meta.time+meta.ttime+25.-dts/2.,
+                 meta.time+meta.ttime+25.)
+        trQ.trim(meta.time+meta.ttime+25.-dts/2.,
+                 meta.time+meta.ttime+25.)
+        trT.trim(meta.time+meta.ttime+25.-dts/2.,
+                 meta.time+meta.ttime+25.)
+
+        # Trim noise traces (-dts to -5 sec)
+        trNl.trim(meta.time+meta.ttime-dts,
+                  meta.time+meta.ttime-dts/2.)
+        trNq.trim(meta.time+meta.ttime-dts,
+                  meta.time+meta.ttime-dts/2.)
+
+    return [trL, trQ, trT], [trNl, trNq], nn
+
+
+def decon(parent, daughter1, daughter2, noise_parent, noise_daughter1, dt,
+          method='wiener', gfilt=None, wlevel=0.01):
+    """
+    Function to deconvolve the daughter components of many events at once
+    using the parent component as the source wavelet. All arrays have the
+    same shape ``nevt, npts`` and are transformed together along the last
+    axis.
+
+    Parameters
+    ----------
+    parent : :class:`~numpy.ndarray`
+        Parent (source) component signal windows
+    daughter1 : :class:`~numpy.ndarray`
+        First daughter component signal windows
+    daughter2 : :class:`~numpy.ndarray`
+        Second daughter component signal windows
+    noise_parent : :class:`~numpy.ndarray`
+        Parent component noise windows
+    noise_daughter1 : :class:`~numpy.ndarray`
+        First daughter component noise windows
+    dt : float
+        Sampling interval (sec)
+    method : str
+        Method for deconvolution. Options are 'wiener',
+        'wiener_audet_bssa2010', 'water' or 'multitaper'
+    gfilt : float
+        Center frequency of Gaussian filter (Hz)
+    wlevel : float
+        Water level used in ``method='water'``
+
+    Returns
+    -------
+    rfp : :class:`~numpy.ndarray`
+        Deconvolved parent components (shape ``nevt, npts``)
+    rfd1 : :class:`~numpy.ndarray`
+        Receiver functions of first daughter components
+    rfd2 : :class:`~numpy.ndarray`
+        Receiver functions of second daughter components
+
+    """
+
+    npad = parent.shape[-1]
+    freqs = np.fft.fftfreq(npad, d=dt)
+
+    # Wiener or Water level deconvolution
+    if method == 'wiener' or method == 'water' or \
+            method == "wiener_audet_bssa2010":
+
+        # Fourier transform
+        Fp = np.fft.fft(parent, axis=-1)
+        Fd1 = np.fft.fft(daughter1, axis=-1)
+        Fd2 = np.fft.fft(daughter2, axis=-1)
+        Fpn = np.fft.fft(noise_parent, axis=-1)
+        Fd1n = np.fft.fft(noise_daughter1, axis=-1)
+
+        # Auto and cross spectra
+        Spp = np.real(Fp*np.conjugate(Fp))
+        Sd1p = Fd1*np.conjugate(Fp)
+        Sd2p = Fd2*np.conjugate(Fp)
+        Snpp = np.real(Fpn*np.conjugate(Fpn))
+        Snd1d1 = np.real(Fd1n*np.conjugate(Fd1n))
+        Snpd1 = np.abs(Fd1n*np.conjugate(Fpn))
+
+        # Final processing depends on method
+        if method == 'wiener':
+            Sdenom = Spp + Snpp
+        # Wiener ad-hoc deconvolution in Audet 2010 - BSSA
+        elif method == "wiener_audet_bssa2010":
+            Sdenom = Spp + 0.25*Snpp + 0.25*Snd1d1 + 0.5*Snpd1
+        elif method == 'water':
+            phi = np.amax(Spp, axis=-1, keepdims=True)*wlevel
+            Spp = np.maximum(Spp, phi)
+            Sdenom = Spp
+
+    # Multitaper deconvolution
+    elif method == 'multitaper':
+
+        NW = 2.5
+        Kmax = int(NW*2-2)
+        tapers = _dpss_(npad, NW, Kmax)
+
+        # Get multitaper spectrum of data
+        Fp = np.fft.fft(tapers*parent[..., None, :], axis=-1)
+        Fd1 = np.fft.fft(tapers*daughter1[..., None, :], axis=-1)
+        Fd2 = np.fft.fft(tapers*daughter2[..., None, :], axis=-1)
+        Fn = np.fft.fft(tapers*noise_parent[..., None, :], axis=-1)
+
+        # Auto and cross spectra
+        Spp = np.sum(np.real(Fp*np.conjugate(Fp)), axis=-2)
+        Sd1p = np.sum(Fd1*np.conjugate(Fp), axis=-2)
+        Sd2p = np.sum(Fd2*np.conjugate(Fp), axis=-2)
+        Snn = np.sum(np.real(Fn*np.conjugate(Fn)), axis=-2)
+
+        # Denominator
+        Sdenom = Spp + Snn
+
+    else:
+        raise(Exception("Method not implemented: " + str(method)))
+
+    # Apply Gaussian filter?
+    if gfilt:
+        gauss = _gauss_filt_(dt, npad, gfilt)
+        gnorm = np.sum(gauss)*(freqs[1]-freqs[0])*dt
+    else:
+        gauss = 1.
+        gnorm = 1.
+
+    # Spectral division and inverse transform
+    rfp = np.fft.ifftshift(np.real(np.fft.ifft(
+        gauss*Spp/Sdenom, axis=-1))/gnorm, axes=-1)
+    rfd1 = np.fft.ifftshift(np.real(np.fft.ifft(
+        gauss*Sd1p/Sdenom, axis=-1))/gnorm, axes=-1)
+    rfd2 = np.fft.ifftshift(np.real(np.fft.ifft(
+        gauss*Sd2p/Sdenom, axis=-1))/gnorm, axes=-1)
+
+    return rfp, rfd1, rfd2
+
+
+def deconvolve(rfdatas, phase='P', vp=None, vs=None, align=None,
+               method='wiener', pre_filt=None, gfilt=None, wlevel=0.01):
+    """
+    Function to deconvolve the three-component data of many
+    :class:`~rfpy.rfdata.RFData` objects at once (see
+    :meth:`~rfpy.rfdata.RFData.deconvolve`). Events with equal window
+    lengths and sampling rates (e.g., all events of a station) are tapered,
+    filtered and deconvolved together with :func:`~rfpy.rfdata.decon`.
+
+    Parameters
+    ----------
+    rfdatas : list
+        List of :class:`~rfpy.rfdata.RFData` objects
+
+    Other parameters are as in :meth:`~rfpy.rfdata.RFData.deconvolve`.
+
+    Attributes
+    ----------
+    rf : :class:`~obspy.core.Stream`
+        Stream containing the receiver function traces, added to each
+        :class:`~rfpy.rfdata.RFData` object
+
+    """
+
+    # Signal and noise windows of each event, grouped by lengths
+    groups = {}
+
+    for rfdata in rfdatas:
+
+        if not rfdata.meta.accept:
+            continue
+
+        if not rfdata.meta.rotated:
+            print("Warning: Data have not been rotated yet - rotating now")
+            rfdata.rotate(vp=vp, vs=vs, align=align)
+
+        if not rfdata.meta.snr:
+            print("Warning: SNR has not been calculated - " +
+                  "calculating now using default")
+            rfdata.calc_snr()
+
+        if hasattr(rfdata, 'rf'):
+            print("Warning: Data have been deconvolved already - passing")
+            continue
+
+        sig, noise, nn = _windows_(rfdata, phase)
+        key = (sig[0].stats.npts, noise[0].stats.npts,
+               sig[0].stats.sampling_rate, nn)
+        groups.setdefault(key, []).append((rfdata, sig, noise))
+
+    for (nsig, nnoise, sr, nn), group in groups.items():
+
+        sig = np.array([[tr.data for tr in item[1]] for item in group])
+        noise = np.array([[tr.data for tr in item[2]] for item in group])
+
+        # Taper traces - only necessary processing after trimming
+        sig = sig*_taper_(nsig, sr)
+        noise = noise*_taper_(nnoise, sr)
+
+        # Pre-filter waveforms before deconvolution
+        if pre_filt:
+            sig = _bandpass_(sig, pre_filt[0], pre_filt[1], sr)
+            noise = _bandpass_(noise, pre_filt[0], pre_filt[1], sr)
+
+        # Fit to length of receiver functions
+        sig = _fit_(sig, nn)
+        noise = _fit_(noise, nn)
+
+        # Deconvolve
+        if phase == 'P' or 'PP':
+            rfL, rfQ, rfT = decon(
+                sig[:, 0], sig[:, 1], sig[:, 2], noise[:, 0], noise[:, 1],
+                1./sr, method=method, gfilt=gfilt, wlevel=wlevel)
+
+        elif phase == 'S' or 'SKS':
+            rfQ, rfL, rfT = decon(
+                sig[:, 1], sig[:, 0], sig[:, 2], noise[:, 1], noise[:, 0],
+                1./sr, method=method, gfilt=gfilt, wlevel=wlevel)
+
+        for i, (rfdata, trs, noise) in enumerate(group):
+
+            # Update data and stats of traces
+            for tr, data, comp in zip(trs, [rfL, rfQ, rfT], rfdata.meta.align):
+                tr.data = data[i]
+                tr.stats.channel = 'RF' + comp
+
+            rfdata.rf = Stream(traces=trs)
+
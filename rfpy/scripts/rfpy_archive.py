@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Copyright 2019 Pascal Audet
+#
+# This file is part of RfPy.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Import modules and functions
+from argparse import ArgumentParser
+import stdb
+from rfpy import archive
+from pathlib import Path
+
+
+def get_archive_arguments(argv=None):
+    """
+    Get Options from :class:`~optparse.OptionParser` objects.
+
+    This function is used to build RF archives from existing data on disk
+
+    """
+
+    parser = ArgumentParser(
+        usage="%(prog)s [arguments] <station database>",
+        description="Script used to gather the receiver functions " +
+        "stored in the event folders of each station (as produced by " +
+        "rfpy_calc or rfpy_recalc) into a single per-station archive " +
+        "(folder RF_ARCHIVE), which is then read by rfpy_plot, " +
+        "rfpy_harmonics, rfpy_hk and rfpy_ccp. Existing archives are " +
+        "rebuilt from the event folders.")
+
+    # General Settings
+    parser.add_argument(
+        "indb",
+        help="Station Database to process from.",
+        type=str)
+    parser.add_argument(
+        "--keys",
+        action="store",
+        type=str,
+        dest="stkeys",
+        default="",
+        help="Specify a comma separated list of station keys for " +
+        "which to perform the analysis. These must be " +
+        "contained within the station database. Partial keys will " +
+        "be used to match against those in the dictionary. For " +
+        "instance, providing IU will match with all stations in " +
+        "the IU network [Default processes all stations in the database]")
+    parser.add_argument(
+        "-L", "--long-name",
+        action="store_true",
+        dest="lkey",
+        default=False,
+        help="Force folder names to use long-key form (NET.STN.CHN). " +
+        "Default behaviour uses short key form (NET.STN) for the folder " +
+        "names, regardless of the key type of the database."
+    )
+    parser.add_argument(
+        "--phase",
+        action="store",
+        type=str,
+        dest="phase",
+        default='allP',
+        help="Specify the phase name to use. Options are 'P', 'PP', " +
+        "'allP', 'S', 'SKS' or 'allS'. [Default 'allP']")
+
+    args = parser.parse_args(argv)
+
+    # create station key list
+    if len(args.stkeys) > 0:
+        args.stkeys = args.stkeys.split(',')
+
+    if args.phase not in ['P', 'PP', 'allP', 'S', 'SKS', 'allS']:
+        parser.error(
+            "Error: choose between 'P', 'PP', 'allP', 'S', 'SKS' and 'allS'.")
+
+    return args
+
+
+def main():
+
+    print()
+    print("##############################################################################")
+    print("#                                                                            #")
+    print("#         __                                          _      _               #")
+    print("#  _ __  / _| _ __   _   _          __ _  _ __   ___ | |__  (_)__   __  ___  #")
+    print("# | '__|| |_ | '_ \\ | | | |        / _` || '__| / __|| '_ \\ | |\\ \\ / / / _ \\ #")
+    print("# | |   |  _|| |_) || |_| |       | (_| || |   | (__ | | | || | \\ V / |  __/ #")
+    print("# |_|   |_|  | .__/  \\__, | _____  \\__,_||_|    \\___||_| |_||_|  \\_/   \\___| #")
+    print("#            |_|     |___/ |_____|                                           #")
+    print("#                                                                            #")
+    print("##############################################################################")
+    print()
+
+    # Run Input Parser
+    args = get_archive_arguments()
+
+    # Load Database
+    db, stkeys = stdb.io.load_db(fname=args.indb, keys=args.stkeys)
+
+    # Loop over station keys
+    for stkey in list(stkeys):
+
+        # Construct Folder Name
+        stfld = stkey
+        if not args.lkey:
+            stfld = stkey.split('.')[0]+"."+stkey.split('.')[1]
+
+        # Define path to see if it exists
+        if args.phase in ['P', 'PP', 'allP']:
+            datapath = Path('P_DATA') / stfld
+        elif args.phase in ['S', 'SKS', 'allS']:
+            datapath = Path('S_DATA') / stfld
+        if not datapath.is_dir():
+            print('Path to ' + str(datapath) + ' doesn`t exist - continuing')
+            continue
+
+        rfarchive = archive.RFArchive(datapath)
+        nevt = rfarchive.migrate()
+
+        print("|  {0:>12s}: {1:6d} events archived".format(stfld, nevt))
+
+
+if __name__ == "__main__":
+
+    # Run main program
+    main()
@@ -30,10 +30,15 @@ import stdb
 from obspy.clients.fdsn import Client
 from obspy import Catalog, UTCDateTime
 from http.client import IncompleteRead
-from rfpy import utils, RFData
+from rfpy import utils, RFData, archive
 from pathlib import Path
 from argparse import ArgumentParser
 from os.path import exists as exist
+from io import StringIO
+from contextlib import redirect_stdout, nullcontext
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from obspy import UTCDateTime
 from numpy import nan
 
@@ -95,6 +100,16 @@ def get_calc_arguments(argv=None):
         "Default behaviour uses short key form (NET.STN) for the folder " +
         "names, regardless of the key type of the database."
     )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        dest="workers",
+        default=1,
+        help="Specify integer number of processes used to download and " +
+        "process the events of each station in parallel. Output of " +
+        "each event is printed once the event is processed, in the " +
+        "order of processing. [Default 1]")
 
     # Server Settings
     ServerGroup = parser.add_argument_group(
@@ -138,7 +153,9 @@ def get_calc_arguments(argv=None):
         "day-long sac or mseed files of data already downloaded. " +
         "If data exists for a seismogram is already present on disk, " +
         "it is selected preferentially over downloading " +
-        "the data using the Client interface")
+        "the data using the Client interface. Directory listings " +
+        "are cached in ~/.cache/rfpy and only re-read for folders " +
+        "modified since the last run.")
     DataGroup.add_argument(
     	"--dtype",
     	action="store",
@@ -167,6 +184,17 @@ def get_calc_arguments(argv=None):
         "search for local data (sometimes for CN stations " +
         "the dictionary name for a station may disagree with that " +
         "in the filename. [Default Network used]")
+    DataGroup.add_argument(
+        "--cache-size",
+        action="store",
+        type=float,
+        dest="cachesize",
+        default=512.,
+        help="Specify the maximum size (in MB) of decoded day files " +
+        "kept in memory by each process. Only the data window of each " +
+        "event is decoded, unless the day file is read again by another " +
+        "event, in which case it is decoded whole and kept. Set to 0 to " +
+        "disable. [Default 512]")
     DataGroup.add_argument(
         "--save-Z12",
         action="store_true",
@@ -490,9 +518,232 @@ def get_calc_arguments(argv=None):
             "Error: 'method' should be either 'wiener', 'water' or " +
             "'multitaper', or 'wiener_audet_bssa2010'")
 
+    if args.workers < 1:
+        parser.error(
+            "Error: --workers should be a positive integer")
+
+    if args.cachesize < 0.:
+        parser.error(
+            "Error: --cache-size should be positive or zero")
+
     return args
 
 
+def _print_event_(rfdata, nevK, inum, nevtT, stkey, args):
+    """
+    Prints event information.
+
+    """
+
+    print(" ")
+    print("*"*50)
+    print("* #{0:d} ({1:d}/{2:d}):  {3:13s} {4}".format(
+        nevK, inum, nevtT, rfdata.meta.time.strftime(
+            "%Y%m%d_%H%M%S"), stkey))
+    if args.verb:
+        print("*   Phase: {}".format(args.phase))
+        print("*   Origin Time: " +
+              rfdata.meta.time.strftime("%Y-%m-%d %H:%M:%S"))
+        print(
+            "*   Lat: {0:6.2f};        Lon: {1:7.2f}".format(
+                rfdata.meta.lat, rfdata.meta.lon))
+        print(
+            "*   Dep: {0:6.2f} km;     Mag: {1:3.1f}".format(
+                rfdata.meta.dep, rfdata.meta.mag))
+        print(
+            "*   Dist: {0:7.2f} km;".format(rfdata.meta.epi_dist) +
+            "   Epi dist: {0:6.2f} deg\n".format(rfdata.meta.gac) +
+            "*   Baz:  {0:6.2f} deg;".format(rfdata.meta.baz) +
+            "   Az: {0:6.2f} deg".format(rfdata.meta.az))
+
+
+def _process_event_(rfdata, datapath, data_client, stalcllist, args):
+    """
+    Downloads the data of one event, calculates the receiver functions and
+    saves them to disk.
+
+    Returns
+    -------
+    done : bool
+        Whether the output files have been written
+    rfstream : :class:`~obspy.core.Stream`
+        Receiver functions (``None`` if rejected)
+
+    """
+
+    # Event Folder
+    timekey = rfdata.meta.time.strftime("%Y%m%d_%H%M%S")
+    evtdir = datapath / timekey
+    RFfile = evtdir / 'RF_Data.pkl'
+    ZNEfile = evtdir / 'ZNE_Data.pkl'
+    metafile = evtdir / 'Meta_Data.pkl'
+    stafile = evtdir / 'Station_Data.pkl'
+
+    # Get data
+    has_data = rfdata.download_data(
+        client=data_client, dts=args.dts, stdata=stalcllist,
+        ndval=args.ndval, dtype=args.dtype, new_sr=args.new_sampling_rate,
+        returned=True, verbose=args.verb)
+
+    if not has_data:
+        return False, None
+
+    # Create Folder if it doesn't exist
+    if not evtdir.exists():
+        evtdir.mkdir(parents=True)
+
+    # Save ZNE Traces
+    pickle.dump(rfdata.data, open(ZNEfile, "wb"))
+
+    # Save Z12 if components exist
+    if hasattr(rfdata, "dataZ12"):
+        Z12file = evtdir / 'Z12_Data.pkl'
+        pickle.dump(rfdata.dataZ12, open(Z12file, "wb"))
+
+    # Rotate from ZNE to 'align' ('ZRT', 'LQT', or 'PVH')
+    rfdata.rotate(vp=args.vp, vs=args.vs, align=args.align)
+
+    # Calculate snr over dt_snr seconds
+    rfdata.calc_snr(
+        dt=args.dt_snr, fmin=args.fmin, fmax=args.fmax)
+    if args.verb:
+        print("* SNR: {}".format(rfdata.meta.snr))
+
+    # Make sure no processing happens for NaNs
+    if np.isnan(rfdata.meta.snr):
+        if args.verb:
+            print("* SNR NaN...Skipping")
+        print("*"*50)
+        return False, None
+
+    # Deconvolve data
+    rfdata.deconvolve(
+        vp=args.vp, vs=args.vs,
+        align=args.align, method=args.method,
+        gfilt=args.gfilt, wlevel=args.wlevel,
+        pre_filt=args.pre_filt)
+
+    # Get cross-correlation QC
+    rfdata.calc_cc()
+    if args.verb:
+        print("* CC: {}".format(rfdata.meta.cc))
+
+    # Convert to Stream
+    rfstream = rfdata.to_stream()
+
+    # Save event meta data
+    pickle.dump(rfdata.meta, open(metafile, "wb"))
+
+    # Save Station Data
+    pickle.dump(rfdata.sta, open(stafile, "wb"))
+
+    # Save RF Traces
+    pickle.dump(rfstream, open(RFfile, "wb"))
+
+    # Update
+    if args.verb:
+        print("* Wrote Output Files to: ")
+        print("*     "+str(evtdir))
+    print("*"*50)
+
+    return True, rfstream
+
+
+def _calc_event_(rfdata, nevK, inum, nevtT, stkey, datapath, data_client,
+                 stalcllist, args, buffered=True):
+    """
+    Processes one event with ``_process_event_``, such that it can run in
+    a separate process. If ``buffered``, printed output is returned
+    instead of printed; otherwise it is printed as the event is processed
+    and an empty log is returned. Errors are reported without
+    interrupting the other events.
+
+    Returns
+    -------
+    done : bool
+        Whether the output files have been written
+    rfstream : :class:`~obspy.core.Stream`
+        Receiver functions (``None`` if rejected)
+    log : str
+        Printed output
+
+    """
+
+    utils.set_day_cache(int(args.cachesize*1024**2))
+
+    log = StringIO()
+    with redirect_stdout(log) if buffered else nullcontext():
+        _print_event_(rfdata, nevK, inum, nevtT, stkey, args)
+        try:
+            done, rfstream = _process_event_(
+                rfdata, datapath, data_client, stalcllist, args)
+        except Exception as e:
+            print("* Error: {0}".format(e))
+            print("*"*50)
+            done, rfstream = False, None
+
+    return done, rfstream, log.getvalue()
+
+
+def _order_by_day_(rfdatas, dts):
+    """
+    Groups events whose data windows start on the same day, keeping the
+    order in which each day first appears, such that the day files read
+    from local data are reused from cache by consecutive events.
+
+    Returns
+    -------
+    order : list
+        Indices of ``rfdatas`` in order of processing
+
+    """
+
+    days = {}
+    for i, rfdata in enumerate(rfdatas):
+        tstart = rfdata.meta.time + rfdata.meta.ttime - dts
+        days.setdefault(tstart.strftime("%Y%j"), []).append(i)
+
+    return [i for day in days.values() for i in day]
+
+
+def _screen_catalog_(cat, sta, datapath, args, margin=1.):
+    """
+    Screens the catalogue before creating any per-event object. Epicentral
+    distances of all events are approximated on a sphere in one pass and
+    events out of the distance range (plus a ``margin`` in degrees, since
+    the exact test is done in :class:`~rfpy.rfdata.Meta`) or with existing
+    receiver functions (unless overwriting) are rejected.
+
+    Returns
+    -------
+    keep : :class:`~numpy.ndarray`
+        Whether each event of the catalogue passes the screening
+    counts : dict
+        Number of events rejected for each reason
+
+    """
+
+    from obspy.geodetics import locations2degrees
+
+    # Origin coordinates of all events
+    evla = np.array([ev.origins[0].latitude for ev in cat], dtype=float)
+    evlo = np.array([ev.origins[0].longitude for ev in cat], dtype=float)
+
+    gac = locations2degrees(sta.latitude, sta.longitude, evla, evlo)
+    keep = (gac > args.mindist - margin) & (gac < args.maxdist + margin)
+    counts = {'distance': int(np.sum(~keep)), 'processed': 0}
+
+    # Events with existing receiver functions
+    if not args.ovr:
+        for iev in np.flatnonzero(keep):
+            timekey = cat[iev].origins[0].time.strftime("%Y%m%d_%H%M%S")
+            if (datapath / timekey / 'RF_Data.pkl').exists():
+                keep[iev] = False
+                counts['processed'] += 1
+
+    return keep, counts
+
+
 def main():
 
     print()
@@ -667,11 +918,27 @@ def main():
             stalcllist = []
         print("|===============================================|")
 
+        # Screen catalogue
+        keep, counts = _screen_catalog_(cat, sta, datapath, args)
+        print("|  Screening: {0:5d} events to process           |".format(
+            int(np.sum(keep))))
+        print("|    Out of distance range: {0:5d}               |".format(
+            counts['distance']))
+        print("|    Already processed:     {0:5d}               |".format(
+            counts['processed']))
+        print("|===============================================|")
+
         # Select order of processing
         if args.reverse:
             ievs = range(0, nevtT)
         else:
             ievs = range(nevtT-1, -1, -1)
+        ievs = [iev for iev in ievs if keep[iev]]
+
+        # Events to process
+        rfdatas = []
+        nevKs = []
+        inums = []
 
         # Read through catalogue
         for iev in ievs:
@@ -687,121 +954,79 @@ def main():
                 ev, gacmin=args.mindist, gacmax=args.maxdist,
                 phase=args.phase, returned=True)
 
-            # Define time stamp
-            yr = str(rfdata.meta.time.year).zfill(4)
-            jd = str(rfdata.meta.time.julday).zfill(3)
-            hr = str(rfdata.meta.time.hour).zfill(2)
-
             # If event is accepted (data exists)
             if accept:
 
-                # Display Event Info
                 nevK = nevK + 1
                 if args.reverse:
                     inum = iev + 1
                 else:
                     inum = nevtT - iev + 1
-                print(" ")
-                print("*"*50)
-                print("* #{0:d} ({1:d}/{2:d}):  {3:13s} {4}".format(
-                    nevK, inum, nevtT, rfdata.meta.time.strftime(
-                        "%Y%m%d_%H%M%S"), stkey))
-                if args.verb:
-                    print("*   Phase: {}".format(args.phase))
-                    print("*   Origin Time: " +
-                          rfdata.meta.time.strftime("%Y-%m-%d %H:%M:%S"))
-                    print(
-                        "*   Lat: {0:6.2f};        Lon: {1:7.2f}".format(
-                            rfdata.meta.lat, rfdata.meta.lon))
-                    print(
-                        "*   Dep: {0:6.2f} km;     Mag: {1:3.1f}".format(
-                            rfdata.meta.dep, rfdata.meta.mag))
-                    print(
-                        "*   Dist: {0:7.2f} km;".format(rfdata.meta.epi_dist) +
-                        "   Epi dist: {0:6.2f} deg\n".format(rfdata.meta.gac) +
-                        "*   Baz:  {0:6.2f} deg;".format(rfdata.meta.baz) +
-                        "   Az: {0:6.2f} deg".format(rfdata.meta.az))
-
-                # Event Folder
-                timekey = rfdata.meta.time.strftime("%Y%m%d_%H%M%S")
-                evtdir = datapath / timekey
-                RFfile = evtdir / 'RF_Data.pkl'
-                ZNEfile = evtdir / 'ZNE_Data.pkl'
-                metafile = evtdir / 'Meta_Data.pkl'
-                stafile = evtdir / 'Station_Data.pkl'
-
-                # Check if RF data already exist and overwrite has been set
-                if evtdir.exists():
-                    if RFfile.exists():
-                        if not args.ovr:
-                            continue
-
-                # Get data
-                has_data = rfdata.download_data(
-                    client=data_client, dts=args.dts, stdata=stalcllist,
-                    ndval=args.ndval, dtype=args.dtype, new_sr=args.new_sampling_rate,
-                    returned=True, verbose=args.verb)
-
-                if not has_data:
-                    continue
-
-                # Create Folder if it doesn't exist
-                if not evtdir.exists():
-                    evtdir.mkdir(parents=True)
-
-                # Save ZNE Traces
-                pickle.dump(rfdata.data, open(ZNEfile, "wb"))
-
-                # Save Z12 if components exist
-                if hasattr(rfdata, "dataZ12"):
-                    Z12file = evtdir / 'Z12_Data.pkl'
-                    pickle.dump(rfdata.dataZ12, open(Z12file, "wb"))
-
-                # Rotate from ZNE to 'align' ('ZRT', 'LQT', or 'PVH')
-                rfdata.rotate(vp=args.vp, vs=args.vs, align=args.align)
-
-                # Calculate snr over dt_snr seconds
-                rfdata.calc_snr(
-                    dt=args.dt_snr, fmin=args.fmin, fmax=args.fmax)
-                if args.verb:
-                    print("* SNR: {}".format(rfdata.meta.snr))
-
-                # Make sure no processing happens for NaNs
-                if np.isnan(rfdata.meta.snr):
-                    if args.verb:
-                        print("* SNR NaN...Skipping")
-                    print("*"*50)
-                    continue
-
-                # Deconvolve data
-                rfdata.deconvolve(
-                    vp=args.vp, vs=args.vs,
-                    align=args.align, method=args.method,
-                    gfilt=args.gfilt, wlevel=args.wlevel,
-                    pre_filt=args.pre_filt)
-
-                # Get cross-correlation QC
-                rfdata.calc_cc()
-                if args.verb:
-                    print("* CC: {}".format(rfdata.meta.cc))
-
-                # Convert to Stream
-                rfstream = rfdata.to_stream()
-
-                # Save event meta data
-                pickle.dump(rfdata.meta, open(metafile, "wb"))
-
-                # Save Station Data
-                pickle.dump(rfdata.sta, open(stafile, "wb"))
-
-                # Save RF Traces
-                pickle.dump(rfstream, open(RFfile, "wb"))
-
-                # Update
-                if args.verb:
-                    print("* Wrote Output Files to: ")
-                    print("*     "+str(evtdir))
-                print("*"*50)
+
+                rfdatas.append(rfdata)
+                nevKs.append(nevK)
+                inums.append(inum)
+
+        # Process events sharing a day together when using local data
+        chunksize = 1
+        if len(stalcllist) > 0:
+            order = _order_by_day_(rfdatas, args.dts)
+            rfdatas = [rfdatas[i] for i in order]
+            nevKs = [nevKs[i] for i in order]
+            inums = [inums[i] for i in order]
+            # Contiguous chunks of events for each process
+            chunksize = max(1, len(rfdatas)//(4*args.workers))
+
+        # Process events, in parallel if requested. Results are returned
+        # in the order of processing
+        calc = partial(
+            _calc_event_, nevtT=nevtT, stkey=stkey, datapath=datapath,
+            data_client=data_client, stalcllist=stalcllist, args=args)
+
+        # Receiver functions to add to station archive
+        rfkeys = []
+        rfstreams = []
+
+        if args.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=args.workers)
+            results = pool.map(calc, rfdatas, nevKs, inums,
+                               chunksize=chunksize)
+        else:
+            # Print output directly as each event is processed
+            pool = None
+            results = map(partial(calc, buffered=False),
+                          rfdatas, nevKs, inums)
+
+        nres = 0
+        try:
+            for rfdata, (done, rfstream, log) in zip(rfdatas, results):
+                nres += 1
+                print(log, end='')
+                if done:
+                    rfkeys.append(
+                        rfdata.meta.time.strftime("%Y%m%d_%H%M%S"))
+                    rfstreams.append(rfstream)
+
+        # A worker process died (e.g., killed when out of memory): the
+        # events without results are lost, but those already processed
+        # are kept
+        except BrokenProcessPool as e:
+            print("* Error: {0}".format(e))
+            print("* {0} events lost, run again to process them:".format(
+                len(rfdatas) - nres))
+            for rfdata in rfdatas[nres:]:
+                print("*   " + rfdata.meta.time.strftime("%Y%m%d_%H%M%S"))
+            print("*"*50)
+
+        if pool is not None:
+            pool.shutdown()
+
+        # Update station archive
+        if len(rfkeys) > 0:
+            try:
+                archive.RFArchive(datapath).update(rfkeys, rfstreams)
+            except Exception as e:
+                print("Warning: Unable to update RF archive: " + str(e))
 
 
 if __name__ == "__main__":
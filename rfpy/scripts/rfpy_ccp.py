@@ -29,7 +29,7 @@ import pickle
 import stdb
 from obspy.clients.fdsn import Client
 from obspy.core import Stream, UTCDateTime
-from rfpy import binning, plotting, CCPimage
+from rfpy import binning, plotting, archive, CCPimage
 from pathlib import Path
 from argparse import ArgumentParser
 from os.path import exists as exist
@@ -218,6 +218,14 @@ def get_ccp_arguments(argv=None):
         default=40,
         help="Specify integer number of slowness bins to consider. " +
         "[Default 40]")
+    PreGroup.add_argument(
+        "--workers",
+        action="store",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Specify integer number of processes used to prepare the " +
+        "stations in parallel. [Default 1]")
     PreGroup.add_argument(
         "--wlen",
         action="store",
@@ -394,6 +402,10 @@ def get_ccp_arguments(argv=None):
             "Error: needs at least one CCP Setting (--load, --prep, " +
             "--prestack, --ccp or --gccp")
 
+    if args.workers < 1:
+        parser.error(
+            "Error: --workers should be a positive integer")
+
     if args.linear and args.pws:
         parser.error(
             "Error: cannot use --linear and --pws at the same time")
@@ -510,40 +522,44 @@ def main():
 
                 rfRstream = Stream()
 
-                datafiles = [x for x in datapath.iterdir() if x.is_dir()]
+                # Read from station archive if up to date with event folders
+                rfarchive = archive.RFArchive(datapath)
+                if rfarchive.is_current():
+                    datafiles = []
+                    index = rfarchive.query(
+                        phases=args.listphase, snr=args.snr, snrh=args.snrh,
+                        cc=args.cc)
+                    rfRstream = rfarchive.read(
+                        index, component=1).to_stream()
+
+                else:
+                    datafiles = [
+                        x for x in datapath.iterdir() if x.is_dir() and
+                        not x.name.startswith('.') and
+                        x.name != 'RF_ARCHIVE']
+
                 for folder in datafiles:
 
                     # Skip hidden folders
                     if folder.name.startswith('.'):
                         continue
 
-                    # Load meta data
-                    filename = folder / "Meta_Data.pkl"
+                    # Load the RF data
+                    filename = folder / "RF_Data.pkl"
                     if not filename.is_file():
                         continue
-                    metafile = open(filename, 'rb')
-                    meta = pickle.load(metafile)
-                    metafile.close()
-
-                    # Skip data not in list of phases
-                    if meta.phase not in args.listphase:
+                    file = open(filename, "rb")
+                    rfdata = pickle.load(file)
+                    file.close()
+
+                    # Phase and QC thresholding on the header values
+                    # stored with the RF data, as in the station archive
+                    if not archive.accept(
+                            rfdata, phases=args.listphase, snr=args.snr,
+                            snrh=args.snrh, cc=args.cc):
                         continue
 
-                    # QC Thresholding
-                    if meta.snrh < args.snrh:
-                        continue
-                    if meta.snr < args.snr:
-                        continue
-                    if meta.cc < args.cc:
-                        continue
-
-                    # If everything passed, load the RF data
-                    filename = folder / "RF_Data.pkl"
-                    if filename.is_file():
-                        file = open(filename, "rb")
-                        rfdata = pickle.load(file)
-                        rfRstream.append(rfdata[1])
-                        file.close()
+                    rfRstream.append(rfdata[1])
 
                 if len(rfRstream) == 0:
                     continue
@@ -611,6 +627,8 @@ def main():
                 print("| Binning: ")
                 print("|     nbaz  = {0}".format(str(args.nbaz)))
                 print("|     nslow = {0}".format(str(args.nslow)))
+                print("| Processes: ")
+                print("|     workers = {0}".format(str(args.workers)))
                 print()
 
                 ccpfile = open(load_file, "rb")
@@ -618,7 +636,8 @@ def main():
                 ccpfile.close()
                 ccpimage.prep_data(f1=args.f1, f2ps=args.f2ps,
                                    f2pps=args.f2pps, f2pss=args.f2pss,
-                                   nbaz=args.nbaz, nslow=args.nslow)
+                                   nbaz=args.nbaz, nslow=args.nslow,
+                                   workers=args.workers)
                 ccpimage.is_ready_for_prestack = True
                 ccpimage.save(prep_file)
                 print()
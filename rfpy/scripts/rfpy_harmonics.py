@@ -29,7 +29,7 @@ import pickle
 import stdb
 from obspy.clients.fdsn import Client
 from obspy.core import Stream, UTCDateTime
-from rfpy import binning, plotting, Harmonics
+from rfpy import binning, plotting, archive, Harmonics
 from pathlib import Path
 from argparse import ArgumentParser
 from os.path import exists as exist
@@ -428,7 +428,21 @@ def main():
         rfRstream = Stream()
         rfTstream = Stream()
 
-        datafiles = [x for x in datapath.iterdir() if x.is_dir()]
+        # Read from station archive if up to date with event folders
+        rfarchive = archive.RFArchive(datapath)
+        if rfarchive.is_current():
+            datafiles = []
+            index = rfarchive.query(
+                snr=args.snr, snrh=args.snrh, cc=args.cc,
+                tstart=tstart, tend=tend)
+            rfRstream = rfarchive.read(index, component=1).to_stream()
+            rfTstream = rfarchive.read(index, component=2).to_stream()
+
+        else:
+            datafiles = [x for x in datapath.iterdir() if x.is_dir() and
+                         not x.name.startswith('.') and
+                         x.name != 'RF_ARCHIVE']
+
         for folder in datafiles:
 
             # Skip hidden folders
@@ -447,9 +461,9 @@ def main():
                 if filename.is_file():
                     file = open(filename, "rb")
                     rfdata = pickle.load(file)
-                    if rfdata[0].stats.snrh > args.snrh and \
-                            rfdata[0].stats.snr and \
-                            rfdata[0].stats.cc > args.cc:
+                    # Same selection as RFArchive.query
+                    if archive.accept(rfdata, snr=args.snr,
+                                      snrh=args.snrh, cc=args.cc):
 
                         rfRstream.append(rfdata[1])
                         rfTstream.append(rfdata[2])
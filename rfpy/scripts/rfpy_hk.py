@@ -29,7 +29,7 @@ import pickle
 import stdb
 from obspy.clients.fdsn import Client
 from obspy.core import Stream, UTCDateTime
-from rfpy import binning, plotting, HkStack
+from rfpy import binning, plotting, archive, HkStack
 from pathlib import Path
 from argparse import ArgumentParser
 from os.path import exists as exist
@@ -312,6 +312,39 @@ def get_hk_arguments(argv=None):
         dest="dip",
         default=None,
         help="Specify the dip of dipping Moho. [Default None]")
+    ModelGroup.add_argument(
+        "--search-dip",
+        action="store_true",
+        dest="search_dip",
+        default=False,
+        help="Set this option to search for the strike and dip of the " +
+        "Moho over a grid of orientations, instead of specifying them " +
+        "a priori. [Default False]")
+    ModelGroup.add_argument(
+        "--dstrike",
+        action="store",
+        type=float,
+        dest="dstrike",
+        default=10.,
+        help="Specify search interval for strike (degrees), used with " +
+        "--search-dip. [Default 10.]")
+    ModelGroup.add_argument(
+        "--dipbound",
+        action="store",
+        type=str,
+        dest="dipbound",
+        default=None,
+        help="Specify a list of two floats with minimum and maximum " +
+        "bounds on dip (degrees), used with --search-dip. " +
+        "[Default [0., 30.]]")
+    ModelGroup.add_argument(
+        "--ddip",
+        action="store",
+        type=float,
+        dest="ddip",
+        default=5.,
+        help="Specify search interval for dip (degrees), used with " +
+        "--search-dip. [Default 5.]")
 
     PlotGroup = parser.add_argument_group(
         title='Settings for plotting results',
@@ -377,7 +410,11 @@ def get_hk_arguments(argv=None):
     else:
         args.endT = None
 
-    if args.strike is None and args.dip is None:
+    if args.search_dip:
+        if args.strike is not None or args.dip is not None:
+            parser.error("Cannot specify strike and dip with --search-dip")
+        args.calc_dip = True
+    elif args.strike is None and args.dip is None:
         args.calc_dip = False
         args.nbaz = None
     elif args.strike is None or args.dip is None:
@@ -386,6 +423,16 @@ def get_hk_arguments(argv=None):
     else:
         args.calc_dip = True
 
+    if args.dipbound is None:
+        args.dipbound = [0., 30.]
+    else:
+        args.dipbound = [float(val) for val in args.dipbound.split(',')]
+        args.dipbound = sorted(args.dipbound)
+        if (len(args.dipbound)) != 2:
+            parser.error(
+                "Error: --dipbound should contain 2 " +
+                "comma-separated floats")
+
     if args.bp is None:
         args.bp = [0.05, 0.5]
     else:
@@ -578,7 +625,20 @@ def main():
 
         rfRstream = Stream()
 
-        datafiles = [x for x in datapath.iterdir() if x.is_dir()]
+        # Read from station archive if up to date with event folders
+        rfarchive = archive.RFArchive(datapath)
+        if rfarchive.is_current():
+            datafiles = []
+            index = rfarchive.query(
+                phases=args.listphase, snr=args.snr, snrh=args.snrh,
+                cc=args.cc, tstart=tstart, tend=tend)
+            rfRstream = rfarchive.read(index, component=1).to_stream()
+
+        else:
+            datafiles = [x for x in datapath.iterdir() if x.is_dir() and
+                         not x.name.startswith('.') and
+                         x.name != 'RF_ARCHIVE']
+
         for folder in datafiles:
 
             # Skip hidden folders
@@ -593,38 +653,22 @@ def main():
 
             if dateUTC > tstart and dateUTC < tend:
 
-                # Load meta data
-                metafile = folder / "Meta_Data.pkl"
-                if not metafile.is_file():
-                    continue
-                meta = pickle.load(open(metafile, 'rb'))
-
-                # Skip data not in list of phases
-                if meta.phase not in args.listphase:
-                    continue
-
-                # QC Thresholding
-                if meta.snrh < args.snrh:
-                    continue
-                if meta.snr < args.snr:
+                # Load the RF data
+                filename = folder / "RF_Data.pkl"
+                if not filename.is_file():
                     continue
-                if meta.cc < args.cc:
+                file = open(filename, "rb")
+                rfdata = pickle.load(file)
+                file.close()
+
+                # Phase and QC thresholding on the header values stored
+                # with the RF data, as in the station archive
+                if not archive.accept(
+                        rfdata, phases=args.listphase, snr=args.snr,
+                        snrh=args.snrh, cc=args.cc):
                     continue
 
-                ''' # Check bounds on data
-                # if meta.slow < args.slowbound[0] and meta.slow > args.slowbound[1]:
-                #     continue
-                # if meta.baz < args.bazbound[0] and meta.baz > args.bazbound[1]:
-                #     continue
-                '''
-
-                # If everything passed, load the RF data
-                filename = folder / "RF_Data.pkl"
-                if filename.is_file():
-                    file = open(filename, "rb")
-                    rfdata = pickle.load(file)
-                    rfRstream.append(rfdata[1])
-                    file.close()
+                rfRstream.append(rfdata[1])
                 if rfdata[0].stats.npts != 1451:
                     print(folder)
 
@@ -710,9 +754,16 @@ def main():
         hkstack.dh = args.dh
         hkstack.dk = args.dk
         hkstack.weights = args.weights
+        hkstack.dstrike = args.dstrike
+        hkstack.dipbound = args.dipbound
+        hkstack.ddip = args.ddip
 
         # Stack with or without dip
-        if args.calc_dip:
+        if args.search_dip:
+            hkstack.search_dip(typ=args.typ)
+            print("Best-fitting strike: {0:5.1f}; dip: {1:4.1f}".format(
+                hkstack.strike, hkstack.dip))
+        elif args.calc_dip:
             hkstack.stack_dip()
         else:
             hkstack.stack()
@@ -28,7 +28,7 @@ import numpy as np
 import pickle
 import stdb
 from obspy import Stream, UTCDateTime
-from rfpy import binning, plotting
+from rfpy import binning, plotting, archive
 from pathlib import Path
 from argparse import ArgumentParser
 from os.path import exists as exist
@@ -401,53 +401,52 @@ def main():
         rfRstream = Stream()
         rfTstream = Stream()
 
-        datafiles = [x for x in datapath.iterdir() if x.is_dir()]
+        # Read from station archive if up to date with event folders
+        rfarchive = archive.RFArchive(datapath)
+        if rfarchive.is_current():
+            datafiles = []
+            index = rfarchive.query(
+                phases=args.listphase, snr=args.snr, snrh=args.snrh,
+                cc=args.cc, slowbound=args.slowbound,
+                bazbound=args.bazbound)
+            rfRstream = rfarchive.read(index, component=1).to_stream()
+            rfTstream = rfarchive.read(index, component=2).to_stream()
+
+        else:
+            datafiles = [x for x in datapath.iterdir() if x.is_dir() and
+                         not x.name.startswith('.') and
+                         x.name != 'RF_ARCHIVE']
+
         for folder in datafiles:
 
             # Skip hidden folders
             if folder.name.startswith('.'):
                 continue
 
-            # Load meta data
-            filename = folder / "Meta_Data.pkl"
+            # Load the RF data
+            filename = folder / "RF_Data.pkl"
             if not filename.is_file():
                 continue
-            metafile = open(filename, 'rb')
-            meta = pickle.load(metafile)
-            metafile.close()
-
-            # Skip data not in list of phases
-            if meta.phase not in args.listphase:
+            file = open(filename, "rb")
+            rfdata = pickle.load(file)
+            file.close()
+
+            # Phase, QC thresholding and bounds on the header values
+            # stored with the RF data, as in the station archive
+            if not archive.accept(
+                    rfdata, phases=args.listphase, snr=args.snr,
+                    snrh=args.snrh, cc=args.cc, slowbound=args.slowbound,
+                    bazbound=args.bazbound):
                 continue
 
-            # QC Thresholding
-            if meta.snrh < args.snrh:
-                continue
-            if meta.snr < args.snr:
-                continue
-            if meta.cc < args.cc:
-                continue
-
-            # Check bounds on data
-            if meta.slow < args.slowbound[0] or meta.slow > args.slowbound[1]:
-                continue
-            if meta.baz < args.bazbound[0] or meta.baz > args.bazbound[1]:
-                continue
-
-            # If everything passed, load the RF data
-            filename = folder / "RF_Data.pkl"
-            if filename.is_file():
-                file = open(filename, "rb")
-                rfdata = pickle.load(file)
-                if args.phase in ['P', 'PP', 'allP']:
-                    Rcmp = 1
-                    Tcmp = 2
-                elif args.phase in ['S', 'SKS', 'allS']:
-                    Rcmp = 1
-                    Tcmp = 2
-                rfRstream.append(rfdata[Rcmp])
-                rfTstream.append(rfdata[Tcmp])
-                file.close()
+            if args.phase in ['P', 'PP', 'allP']:
+                Rcmp = 1
+                Tcmp = 2
+            elif args.phase in ['S', 'SKS', 'allS']:
+                Rcmp = 1
+                Tcmp = 2
+            rfRstream.append(rfdata[Rcmp])
+            rfTstream.append(rfdata[Tcmp])
 
         if len(rfRstream) == 0:
             continue
@@ -29,7 +29,14 @@ from os.path import exists as exist
 import numpy as np
 import pickle
 import stdb
-from rfpy import RFData
+import time
+from io import StringIO
+from contextlib import redirect_stdout
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from rfpy import RFData, archive
+from rfpy.rfdata import deconvolve
 from pathlib import Path
 
 
@@ -82,6 +89,14 @@ def get_recalc_arguments(argv=None):
         "Default behaviour uses short key form (NET.STN) for the folder " +
         "names, regardless of the key type of the database."
     )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        dest="workers",
+        default=1,
+        help="Specify integer number of processes used to re-calculate " +
+        "the receiver functions of each station in parallel. [Default 1]")
 
     # Constants Settings
     ConstGroup = parser.add_argument_group(
@@ -210,6 +225,10 @@ def get_recalc_arguments(argv=None):
     if args.phase not in ['P', 'PP', 'allP', 'S', 'SKS', 'allS']:
         parser.error(
             "Error: choose between 'P', 'PP', 'allP', 'S', 'SKS' and 'allS'.")
+
+    if args.workers < 1:
+        parser.error(
+            "Error: --workers should be a positive integer")
     if args.phase == 'allP':
         args.listphase = ['P', 'PP']
     elif args.phase == 'allS':
@@ -241,6 +260,176 @@ def get_recalc_arguments(argv=None):
     return args
 
 
+def _prepare_event_(folder, sta, stkey, args):
+    """
+    Loads the data of one event folder, rotates them and calculates the
+    SNR.
+
+    Returns
+    -------
+    rfdata : :class:`~rfpy.rfdata.RFData`
+        Event data ready for deconvolution (``None`` if skipped)
+
+    """
+
+    # Re-initialize RFData object
+    rfdata = RFData(sta)
+
+    # Load meta data
+    metafile = folder / "Meta_Data.pkl"
+    if not metafile.is_file():
+        return None
+    rfdata.meta = pickle.load(open(metafile, 'rb'))
+
+    # Skip data not in list of phases
+    if rfdata.meta.phase not in args.listphase:
+        return None
+
+    if args.verb:
+        print("* Station: {0}; folder: {1}".format(stkey, folder))
+
+    if args.Z12:
+        try:
+            # Try loading Z12_Data
+            Z12file = folder / "Z12_Data.pkl"
+            rfdata.data = pickle.load(open(Z12file, 'rb'))
+            # Remove rotated flag and snr flag
+            rfdata.meta.rotated = False
+            rfdata.rotate(align='ZNE')
+        except:
+
+            print("Z12_Data.pkl not available - using ZNE_Data.pkl")
+            # Load ZNE data
+            ZNEfile = folder / "ZNE_Data.pkl"
+            rfdata.data = pickle.load(open(ZNEfile, 'rb'))
+    else:
+        # Load ZNE data
+        ZNEfile = folder / "ZNE_Data.pkl"
+        rfdata.data = pickle.load(open(ZNEfile, 'rb'))
+
+    # Resample if requested
+    if args.resample:
+        rfdata.data.resample(
+            args.resample, no_filter=False)
+
+    # Remove rotated flag and snr flag
+    rfdata.meta.rotated = False
+    rfdata.meta.snr = None
+
+    # Rotate from ZNE to 'align' ('ZRT', 'LQT', or 'PVH')
+    rfdata.rotate(vp=args.vp, vs=args.vs, align=args.align)
+
+    # Calculate SNR
+    rfdata.calc_snr(dt=args.dt_snr, fmin=args.fmin, fmax=args.fmax)
+
+    if args.verb:
+        print("* SNR: {}".format(rfdata.meta.snr))
+
+    return rfdata
+
+
+def _save_event_(rfdata, folder, args):
+    """
+    Calculates the CC of the deconvolved data of one event folder and
+    saves the receiver functions to disk.
+
+    Returns
+    -------
+    rfstream : :class:`~obspy.core.Stream`
+        Receiver functions (``None`` if rejected)
+
+    """
+
+    # Get cross-correlation QC
+    rfdata.calc_cc()
+
+    if args.verb:
+        print("* CC: {}".format(rfdata.meta.cc))
+
+    # Convert to Stream
+    rfstream = rfdata.to_stream()
+
+    # Save RF Traces
+    RFfile = folder / "RF_Data.pkl"
+    pickle.dump(rfstream, open(RFfile, "wb"))
+
+    # Save Meta data
+    metafile = folder / "Meta_Data.pkl"
+    pickle.dump(rfdata.meta, open(metafile, 'wb'))
+
+    # Update
+    if args.verb:
+        print("* Output files written")
+        print("**************************************************")
+
+    return rfstream
+
+
+def _recalc_events_(folders, sta, stkey, args):
+    """
+    Re-calculates the receiver functions of a list of event folders, such
+    that it can run in a separate process. All events are deconvolved
+    together with :func:`~rfpy.rfdata.deconvolve`. Printed output is
+    returned instead of printed, and errors are reported without
+    interrupting the other events.
+
+    Returns
+    -------
+    results : list
+        List of tuples ``(done, rfstream, log)`` for each folder, where
+        ``done`` is whether the output files have been written,
+        ``rfstream`` contains the receiver functions (``None`` if
+        rejected) and ``log`` is the printed output
+
+    """
+
+    logs = [StringIO() for folder in folders]
+    rfdatas = [None]*len(folders)
+
+    def _error_(i, e):
+        print("* Station: {0}; folder: {1}".format(stkey, folders[i]))
+        print("* Error: {0}".format(e))
+        rfdatas[i] = None
+
+    # Load, rotate and calculate SNR
+    for i, folder in enumerate(folders):
+        with redirect_stdout(logs[i]):
+            try:
+                rfdatas[i] = _prepare_event_(folder, sta, stkey, args)
+            except Exception as e:
+                _error_(i, e)
+
+    # Deconvolve all events at once, or one at a time if that fails
+    decon = dict(vp=args.vp, vs=args.vs, align=args.align,
+                 method=args.method, gfilt=args.gfilt, wlevel=args.wlevel,
+                 pre_filt=args.pre_filt)
+    try:
+        deconvolve([rfdata for rfdata in rfdatas if rfdata], **decon)
+    except Exception:
+        for i, rfdata in enumerate(rfdatas):
+            if rfdata and not hasattr(rfdata, 'rf'):
+                with redirect_stdout(logs[i]):
+                    try:
+                        rfdata.deconvolve(**decon)
+                    except Exception as e:
+                        _error_(i, e)
+
+    # Calculate CC and save
+    results = []
+    for i, folder in enumerate(folders):
+        done, rfstream = False, None
+        if rfdatas[i]:
+            with redirect_stdout(logs[i]):
+                try:
+                    rfstream = _save_event_(rfdatas[i], folder, args)
+                    done = True
+                except Exception as e:
+                    _error_(i, e)
+        results.append((done, rfstream, logs[i].getvalue()))
+
+    return results
+
+
 def main():
 
     print()
@@ -265,6 +454,12 @@ def main():
     # Track processed folders
     procfold = []
 
+    # Pool of processes shared by all stations
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+    else:
+        pool = None
+
     # Loop over station keys
     for stkey in list(stkeys):
 
@@ -314,97 +509,71 @@ def main():
             print('  {0} already processed...skipping   '.format(stfld))
             continue
 
-        datafiles = [x for x in datapath.iterdir() if x.is_dir()]
-        for folder in datafiles:
-
-            # Skip hidden folders
-            if folder.name.startswith('.'):
-                continue
-
-            # Re-initialize RFData object
-            rfdata = RFData(sta)
-
-            # Load meta data
-            metafile = folder / "Meta_Data.pkl"
-            if not metafile.is_file():
-                continue
-            rfdata.meta = pickle.load(open(metafile, 'rb'))
-
-            # Skip data not in list of phases
-            if rfdata.meta.phase not in args.listphase:
-                continue
-
-            if args.verb:
-                print("* Station: {0}; folder: {1}".format(stkey, folder))
-
-            if args.Z12:
-                try:
-                    # Try loading Z12_Data
-                    Z12file = folder / "Z12_Data.pkl"
-                    rfdata.data = pickle.load(open(Z12file, 'rb'))
-                    # Remove rotated flag and snr flag
-                    rfdata.meta.rotated = False
-                    rfdata.rotate(align='ZNE')
-                except:
-
-                    print("Z12_Data.pkl not available - using ZNE_Data.pkl")
-                    # Load ZNE data
-                    ZNEfile = folder / "ZNE_Data.pkl"
-                    rfdata.data = pickle.load(open(ZNEfile, 'rb'))
-            else:
-                # Load ZNE data
-                ZNEfile = folder / "ZNE_Data.pkl"
-                rfdata.data = pickle.load(open(ZNEfile, 'rb'))
-
-            # Resample if requested
-            if args.resample:
-                rfdata.data.resample(
-                    args.resample, no_filter=False)
-
-            # Remove rotated flag and snr flag
-            rfdata.meta.rotated = False
-            rfdata.meta.snr = None
-
-            # Rotate from ZNE to 'align' ('ZRT', 'LQT', or 'PVH')
-            rfdata.rotate(vp=args.vp, vs=args.vs, align=args.align)
-
-            # Calculate SNR
-            rfdata.calc_snr(dt=args.dt_snr, fmin=args.fmin, fmax=args.fmax)
-
-            if args.verb:
-                print("* SNR: {}".format(rfdata.meta.snr))
-
-            # Deconvolve data
-            rfdata.deconvolve(
-                vp=args.vp, vs=args.vs,
-                align=args.align, method=args.method,
-                gfilt=args.gfilt, wlevel=args.wlevel,
-                pre_filt=args.pre_filt)
-
-            # Get cross-correlation QC
-            rfdata.calc_cc()
-
-            if args.verb:
-                print("* CC: {}".format(rfdata.meta.cc))
-
-            # Convert to Stream
-            rfstream = rfdata.to_stream()
-
-            # Save RF Traces
-            RFfile = folder / "RF_Data.pkl"
-            pickle.dump(rfstream, open(RFfile, "wb"))
-
-            # Save Meta data
-            metafile = folder / "Meta_Data.pkl"
-            pickle.dump(rfdata.meta, open(metafile, 'wb'))
-
-            # Update
-            if args.verb:
-                print("* Output files written")
-                print("**************************************************")
-
-            # Update processed folders
-            procfold.append(stfld)
+        datafiles = [x for x in datapath.iterdir() if x.is_dir() and
+                     not x.name.startswith('.') and x.name != 'RF_ARCHIVE']
+
+        # Re-calculate receiver functions in chunks of at most 50 events,
+        # in parallel if requested. Output files are written as soon as
+        # each chunk is processed, and memory use does not grow with the
+        # number of events of the station
+        recalc = partial(_recalc_events_, sta=sta, stkey=stkey, args=args)
+        t0 = time.time()
+        nchunk = 50
+        if pool is not None:
+            nchunk = max(1, min(nchunk, len(datafiles)//(4*args.workers)))
+        chunks = [datafiles[i:i+nchunk]
+                  for i in range(0, len(datafiles), nchunk)]
+        if pool is not None:
+            results = pool.map(recalc, chunks)
+        else:
+            results = map(recalc, chunks)
+        results = (result for chunk in results for result in chunk)
+
+        # Receiver functions to add to station archive
+        rfkeys = []
+        rfstreams = []
+
+        nres = 0
+        try:
+            for folder, (done, rfstream, log) in zip(datafiles, results):
+                nres += 1
+                print(log, end='')
+                if done:
+                    rfkeys.append(folder.name)
+                    rfstreams.append(rfstream)
+
+        # A worker process died (e.g., killed when out of memory): the
+        # chunks without results are lost, but the events already
+        # processed are kept, and a new pool is started for the next
+        # station
+        except BrokenProcessPool as e:
+            lost = chunks[nres//nchunk:]
+            print("* Error: {0}".format(e))
+            print("* {0} chunks lost ({1} events), run again to ".format(
+                len(lost), len(datafiles) - nres) + "process them:")
+            for chunk in lost:
+                print("*   " + ", ".join([folder.name for folder in chunk]))
+            print("*"*50)
+            pool.shutdown()
+            pool = ProcessPoolExecutor(max_workers=args.workers)
+
+        # Update processed folders
+        procfold.append(stfld)
+
+        dt = time.time() - t0
+        print("|  {0:d} events processed in {1:.1f} s ".format(
+            len(rfkeys), dt) +
+            "({0:.2f} events/s)".format(len(rfkeys)/max(dt, 1.e-6)))
+
+        # Update station archive
+        if len(rfkeys) > 0:
+            try:
+                archive.RFArchive(datapath).update(rfkeys, rfstreams)
+            except Exception as e:
+                print("Warning: Unable to update RF archive: " + str(e))
+
+    if pool is not None:
+        pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+# Copyright 2019 Pascal Audet
+#
+# This file is part of RfPy.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Functions to shift seismograms in time using the Fourier time-shift
+theorem. The spectrum of each trace is calculated once and stored in a
+:class:`~rfpy.shift.Shifter` object, such that the same trace can be
+shifted by many travel times at once, or sampled at a given lag without
+an inverse Fourier transform. For many traces and travel times,
+:func:`~rfpy.shift.analytic` and :func:`~rfpy.shift.sample` approximate
+the same shifts by linear interpolation of oversampled analytic signals.
+
+"""
+
+import numpy as np
+from scipy.signal import hilbert, resample
+
+
+class Shifter(object):
+    """
+    A Shifter object contains the Fourier spectra of one or more
+    equal-length seismograms. Positive travel times ``tt`` advance the
+    seismograms, i.e., the shifted seismogram at time ``t`` is the original
+    seismogram at time ``t + tt``. Shifts are circular, as implied by the
+    Fourier time-shift theorem.
+
+    Parameters
+    ----------
+    data : :class:`~numpy.ndarray`
+        Seismogram (shape ``npts``) or array of seismograms
+        (shape ``ntr, npts``)
+    dt : float
+        Sampling interval (sec)
+
+    Other Parameters
+    ----------------
+    nt : int
+        Number of samples of each seismogram
+    freq : :class:`~numpy.ndarray`
+        Frequencies of the discrete Fourier transform
+    ftrace : :class:`~numpy.ndarray`
+        Fourier spectra of the seismograms (same shape as ``data``)
+
+    """
+
+    def __init__(self, data, dt):
+
+        data = np.asarray(data)
+
+        self.nt = data.shape[-1]
+        self.dt = dt
+        self.freq = np.fft.fftfreq(self.nt, d=dt)
+        self.ftrace = np.fft.fft(data, axis=-1)
+
+    def shift(self, tt):
+        """
+        Method to shift the seismograms by one or several travel times.
+
+        Parameters
+        ----------
+        tt : float or :class:`~numpy.ndarray`
+            Travel time(s) (sec). Must broadcast against the leading
+            dimensions of ``data`` (e.g., shape ``nshift, ntr``).
+
+        Returns
+        -------
+        rtrace : :class:`~numpy.ndarray`
+            Shifted seismograms (shape ``tt.shape + (npts,)`` for a
+            single seismogram, or the broadcast shape of ``tt`` and
+            ``ntr`` followed by ``npts`` otherwise)
+
+        """
+
+        ramp = np.exp(2.*np.pi*1j*self.freq*np.asarray(tt)[..., None])
+
+        return np.real(np.fft.ifft(self.ftrace*ramp, axis=-1))
+
+    def sample(self, tt, it=0):
+        """
+        Method to obtain the sample of index ``it`` of the seismograms
+        shifted by travel times ``tt``, which is calculated directly
+        from the spectra without inverse Fourier transform.
+
+        Parameters
+        ----------
+        tt : float or :class:`~numpy.ndarray`
+            Travel time(s) (sec). Must broadcast against the leading
+            dimensions of ``data``.
+        it : int
+            Index of the sample to return
+
+        Returns
+        -------
+        amp : float or :class:`~numpy.ndarray`
+            Amplitude of the shifted seismograms at sample ``it``
+
+        """
+
+        tt = np.asarray(tt) + it*self.dt
+        ramp = np.exp(2.*np.pi*1j*self.freq*tt[..., None])
+
+        return np.real(np.sum(self.ftrace*ramp, axis=-1))/self.nt
+
+
+def shift(data, dt, tt):
+    """
+    Function to shift seismograms in time given travel time(s)
+
+    Parameters
+    ----------
+    data : :class:`~numpy.ndarray`
+        Seismogram (shape ``npts``) or array of seismograms
+        (shape ``ntr, npts``)
+    dt : float
+        Sampling interval (sec)
+    tt : float or :class:`~numpy.ndarray`
+        Travel time(s) (sec)
+
+    Returns
+    -------
+    rtrace : :class:`~numpy.ndarray`
+        Shifted seismograms (see :meth:`~rfpy.shift.Shifter.shift`)
+
+    """
+
+    return Shifter(data, dt).shift(tt)
+
+
+def analytic(data, dt, nover=8):
+    """
+    Function to calculate the analytic signals of seismograms, oversampled
+    ``nover`` times by Fourier interpolation, such that subsequent linear
+    interpolation with :func:`~rfpy.shift.sample` approximates a Fourier
+    time shift.
+
+    Parameters
+    ----------
+    data : :class:`~numpy.ndarray`
+        Array of seismograms (shape ``ntr, npts``)
+    dt : float
+        Sampling interval (sec)
+    nover : int
+        Oversampling factor
+
+    Returns
+    -------
+    asig : :class:`~numpy.ndarray`
+        Oversampled analytic signals (shape ``ntr, nover*npts``)
+    dt : float
+        Sampling interval of the oversampled signals (sec)
+
+    """
+
+    data = np.asarray(data)
+    nt = data.shape[-1]
+    data = resample(data, nover*nt, axis=-1)
+
+    return hilbert(data, axis=-1), dt/nover
+
+
+def sample(asig, tt, dt):
+    """
+    Function to sample signals at travel times ``tt`` by linear
+    interpolation. Times are wrapped around the trace length, consistent
+    with a circular (Fourier) time shift. Travel times that are not finite
+    return NaN.
+
+    Parameters
+    ----------
+    asig : :class:`~numpy.ndarray`
+        Array of (analytic) signals (shape ``ntr, npts``)
+    tt : :class:`~numpy.ndarray`
+        Travel times (sec). The last axis corresponds to the traces in
+        ``asig`` (shape ``..., ntr``).
+    dt : float
+        Sampling interval of ``asig`` (sec)
+
+    Returns
+    -------
+    samp : :class:`~numpy.ndarray`
+        Sampled signals (same shape as ``tt``)
+
+    """
+
+    nt = asig.shape[-1]
+    itr = np.arange(asig.shape[0])
+
+    # Fractional sample index
+    x = np.asarray(tt)/dt
+    valid = np.isfinite(x)
+    x = np.where(valid, x, 0.)
+    i0 = np.floor(x)
+    w = x - i0
+    i0 = i0.astype(int) % nt
+    i1 = (i0 + 1) % nt
+
+    samp = (1. - w)*asig[itr, i0] + w*asig[itr, i1]
+    samp[~valid] = np.nan
+
+    return samp
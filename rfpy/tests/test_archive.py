@@ -0,0 +1,98 @@
+import os
+import pickle
+import numpy as np
+from obspy.core import Stream
+from rfpy.archive import RFArchive, accept
+
+
+def _demo_():
+    file = open(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "examples/data", "demo_streams.pkl"), 'rb')
+    rfRstream = pickle.load(file)
+    rfTstream = pickle.load(file)
+    file.close()
+    return rfRstream, rfTstream
+
+
+def _save_(datapath, key, rfstream):
+    folder = datapath / key
+    folder.mkdir(exist_ok=True)
+    file = open(folder / "RF_Data.pkl", "wb")
+    pickle.dump(rfstream, file)
+    file.close()
+
+
+def _assert_rewritten_(archive, tmp_path):
+    # Same content as an archive written from scratch
+    ref = RFArchive(archive.datapath)
+    ref.path = tmp_path / 'REF'
+    ref.migrate()
+    assert archive.is_current()
+    assert np.array_equal(archive.read_meta(), ref.read_meta())
+    assert np.array_equal(np.load(archive.path / 'data.npy'),
+                          np.load(ref.path / 'data.npy'))
+
+
+def test_update_rows_in_place(tmp_path):
+    rfR, rfT = _demo_()
+    datapath = tmp_path / 'NY.MMPY'
+    datapath.mkdir()
+    streams = [Stream(traces=[rfR[i], rfT[i]]) for i in range(5)]
+    keys = ['20140630_1955{0:02d}'.format(i) for i in range(5)]
+    for key, st in zip(keys, streams):
+        _save_(datapath, key, st)
+    archive = RFArchive(datapath)
+    archive.migrate()
+
+    # Modified event is overwritten in place (the archive must not be
+    # rewritten, so disable write)
+    streams[2][0].data = streams[2][0].data*2.
+    streams[2][0].stats.snr = 99.
+    _save_(datapath, keys[2], streams[2])
+    archive.write = None
+    archive.update([keys[2]], [streams[2]])
+    _assert_rewritten_(archive, tmp_path)
+
+    # New event is appended
+    key = '20140701_000000'
+    st = Stream(traces=[rfR[5], rfT[5]])
+    _save_(datapath, key, st)
+    archive.update([key], [st])
+    _assert_rewritten_(archive, tmp_path)
+
+    # Rejected event requires a rewrite
+    del archive.write
+    _save_(datapath, keys[0], None)
+    archive.update([keys[0]], [None])
+    _assert_rewritten_(archive, tmp_path)
+    assert len(archive.read_meta()) == 5
+
+
+def test_accept_matches_query(tmp_path):
+    rfR, rfT = _demo_()
+    datapath = tmp_path / 'NY.MMPY'
+    datapath.mkdir()
+    keys = ['20140630_1955{0:02d}'.format(i) for i in range(8)]
+    rfstreams = []
+    for i, key in enumerate(keys):
+        st = Stream(traces=[rfR[i], rfT[i]])
+        st[0].stats.snr = [5., 10., None, 12., 10., 7., 20., 10.][i]
+        st[0].stats.cc = [0.5, 0.2, 0.9, 0.6, 0.6, 0.8, 0.7, 0.3][i]
+        if i == 7:
+            del st[0].stats.snrh
+        _save_(datapath, key, st)
+        rfstreams.append(st)
+    archive = RFArchive(datapath)
+    archive.migrate()
+
+    criteria = [dict(snr=10., cc=0.6), dict(snr=5., snrh=1.),
+                dict(phases=['P'], cc=0.5, slowbound=[0.04, 0.06],
+                     bazbound=[0., 250.]), dict()]
+    for crit in criteria:
+        index = archive.query(**crit)
+        select = [i for i, st in enumerate(rfstreams)
+                  if accept(st, **crit)]
+        assert list(index) == select
+    assert list(archive.query(snr=10., cc=0.6)) == [3, 4, 6]
+    assert not accept(None)
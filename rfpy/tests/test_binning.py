@@ -0,0 +1,88 @@
+import os
+import pickle
+import numpy as np
+from scipy.signal import hilbert
+from rfpy import binning
+
+
+def _demo_():
+    file = open(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "examples/data", "demo_streams.pkl"), 'rb')
+    rfRstream = pickle.load(file)
+    rfTstream = pickle.load(file)
+    file.close()
+    return rfRstream, rfTstream
+
+
+def _ref_bin_(stream, inbin, pws):
+    # Baseline stack of the traces that fall in one bin
+    nb = 0
+    array = np.zeros(len(stream[0].data))
+    weight = np.zeros(len(stream[0].data), dtype=complex)
+    for k, tr in enumerate(stream):
+        if inbin[k]:
+            nb += 1
+            array += tr.data
+            hilb = hilbert(tr.data)
+            phase = np.arctan2(hilb.imag, hilb.real)
+            weight += np.exp(1j*phase)
+    if nb == 0:
+        return 0, None
+    array /= nb
+    if pws:
+        array *= np.real(abs(weight/nb))
+    return nb, array
+
+
+def _assert_binned_(binned, ref):
+    assert len(binned) == len(ref)
+    for tr, (stats, nb, array) in zip(binned, ref):
+        assert tr.stats.nbin == nb
+        for key in stats:
+            assert tr.stats[key] == stats[key]
+        assert np.allclose(tr.data, array, rtol=1.e-10, atol=1.e-12)
+
+
+def test_bin_matches_loop():
+    rfR, rfT = _demo_()
+    for typ, key in [('baz', 'baz'), ('slow', 'slow')]:
+        stat = np.array([tr.stats[key] for tr in rfR])
+        if typ == 'baz':
+            bins = np.linspace(0, 360, 37)
+        else:
+            bins = np.linspace(stat.min(), stat.max(), 37)
+        ind = np.digitize(stat, bins)
+        for pws in [False, True]:
+            binned = binning.bin(rfR, rfT, typ=typ, nbin=37, pws=pws)
+            assert len(binned) == 2
+            for stream, binned_stream in zip([rfR, rfT], binned):
+                ref = []
+                for i in range(37):
+                    nb, array = _ref_bin_(stream, ind == i, pws)
+                    if nb > 0:
+                        ref.append(({key: bins[i]}, nb, array))
+                _assert_binned_(binned_stream, ref)
+
+
+def test_bin_baz_slow_matches_loop():
+    rfR, rfT = _demo_()
+    nbaz, nslow = 37, 21
+    baz_bins = np.linspace(0, 360, nbaz)
+    slow_bins = np.linspace(0.04, 0.08, nslow)
+    ibaz = np.digitize([tr.stats.baz for tr in rfR], baz_bins)
+    islow = np.digitize([tr.stats.slow for tr in rfR], slow_bins)
+    for pws in [False, True]:
+        binned = binning.bin_baz_slow(
+            rfR, rfT, nbaz=nbaz, nslow=nslow, pws=pws)
+        assert len(binned) == 2
+        for stream, binned_stream in zip([rfR, rfT], binned):
+            ref = []
+            for i in range(nbaz):
+                for j in range(nslow):
+                    nb, array = _ref_bin_(
+                        stream, (ibaz == i) & (islow == j), pws)
+                    if nb > 0:
+                        ref.append(({'baz': baz_bins[i],
+                                     'slow': slow_bins[j]}, nb, array))
+            _assert_binned_(binned_stream, ref)
@@ -0,0 +1,99 @@
+import os
+import pickle
+import numpy as np
+from rfpy import CCPimage
+from rfpy.ccp import raypath, raypaths, ttime, ppoint_distance, ppoint
+from rfpy.ccp import haversine, _nearest_
+
+
+def _demo_(ntr=10):
+    file = open(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "examples/data", "demo_streams.pkl"), 'rb')
+    rfRstream = pickle.load(file)
+    file.close()
+    return rfRstream[0:ntr]
+
+
+def _ref_raypath_(tr, dep, vp, vs):
+    # Scalar sums over the layers above each depth
+    delta_z = dep[1] - dep[0]
+    ref = np.zeros((5, len(dep)))
+    for iz in range(len(dep)):
+        dtps = dtpps = dtpss = delta_x = 0.
+        for i in range(iz):
+            dtps += ttime(tr, delta_z, vp[i], vs[i], 'Ps')
+            dtpps += ttime(tr, delta_z, vp[i], vs[i], 'Pps')
+            dtpss += ttime(tr, delta_z, vp[i], vs[i], 'Pss')
+            delta_x += ppoint_distance(tr, delta_z, vs[i])
+        plo, pla = ppoint(tr, delta_x)
+        ref[:, iz] = [dtps, dtpps, dtpss, plo, pla]
+    return ref
+
+
+def test_raypaths_match_raypath():
+    rfstream = _demo_()
+    ccpimage = CCPimage()
+    dep, vp, vs = ccpimage.zarray, ccpimage.vp, ccpimage.vs
+    paths = np.array(raypaths(rfstream, dep=dep, vp=vp, vs=vs))
+    for itr, tr in enumerate(rfstream):
+        ref = _ref_raypath_(tr, dep, vp, vs)
+        assert np.allclose(paths[:, itr, :], ref, rtol=1.e-10, atol=1.e-10)
+        assert np.allclose(raypath(tr, dep=dep, vp=vp, vs=vs), ref,
+                           rtol=1.e-10, atol=1.e-10)
+
+
+def test_nearest_matches_haversine():
+    rng = np.random.default_rng(0)
+    xs_lat = np.linspace(60., 64., 50)
+    xs_lon = np.linspace(-134., -128., 50)
+    lat = rng.uniform(59., 65., (20, 30))
+    lon = rng.uniform(-135., -127., (20, 30))
+    ind = _nearest_(xs_lat, xs_lon, lat, lon)
+    assert ind.shape == lat.shape
+    for i, j in np.ndindex(lat.shape):
+        dist = haversine(xs_lat, xs_lon, lat[i, j], lon[i, j])
+        assert ind[i, j] == np.argmin(dist)
+
+
+
+def test_ccp_matches_cell_loop():
+    rng = np.random.default_rng(0)
+    ccpimage = CCPimage(coord_start=[61., -133.], coord_end=[64., -129.],
+                        dep=np.array([0., 20., 40.]),
+                        vp=np.array([6.0, 6.5, 7.0]), dx=10., dz=4.)
+    nz, nx, ntr = ccpimage.nz, ccpimage.nx, 40
+    lat = rng.uniform(61., 64., (nz, ntr))
+    lon = rng.uniform(-133., -129., (nz, ntr))
+    amps = {}
+    for phase in ['ps', 'pps', 'pss']:
+        amps[phase] = rng.normal(size=(nz, ntr))
+        setattr(ccpimage, 'amp_'+phase+'_depth', amps[phase].copy())
+    ccpimage.lat_depth = lat.copy()
+    ccpimage.lon_depth = lon.copy()
+    ccpimage.n_traces = ntr
+    ccpimage.is_ready_for_prestack = True
+    ccpimage.prestack()
+    ccpimage.ccp()
+
+    # Per-cell loop over piercing points
+    xs_lat = np.linspace(61., 64., nx)
+    xs_lon = np.linspace(-133., -129., nx)
+    cells = [[[] for ix in range(nx)] for iz in range(nz)]
+    for iz in range(nz):
+        for itr in range(ntr):
+            dist = haversine(xs_lat, xs_lon, lat[iz, itr], lon[iz, itr])
+            cells[iz][np.argmin(dist)].append(itr)
+
+    for phase in amps:
+        avg = getattr(ccpimage, 'xs_'+phase+'_avg')
+        for iz in range(nz):
+            for ix in range(nx):
+                ref = amps[phase][iz, cells[iz][ix]]
+                assert ccpimage.xs_count[iz, ix] == len(ref)
+                assert np.array_equal(
+                    ccpimage.cell_amplitudes(iz, ix, phase), ref)
+                if len(ref) > 0:
+                    assert np.isclose(avg[iz, ix], np.mean(ref))
+                else:
+                    assert avg[iz, ix] == 0.
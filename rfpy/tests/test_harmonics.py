@@ -0,0 +1,136 @@
+import os
+import pickle
+import numpy as np
+from rfpy import Harmonics
+from rfpy.harmonics import _resample_, _observations_, _design_, _bazs_
+
+
+def _demo_():
+    file = open(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "examples/data", "demo_streams.pkl"), 'rb')
+    rfRstream = pickle.load(file)
+    rfTstream = pickle.load(file)
+    file.close()
+    return rfRstream, rfTstream
+
+
+def _resample_ones_(harmonics, azim):
+    rfR, rfT = harmonics.radialRF, harmonics.transvRF
+    delta = rfR[0].stats.delta
+    OBS = _observations_(rfR, rfT)
+    H = _design_(_bazs_(rfR), _bazs_(rfT), 0.)
+    return _resample_(np.ones((1, len(rfR))), H, OBS, True, azim,
+                      int(harmonics.xmin/delta), int(harmonics.xmax/delta))
+
+
+def test_resample_ones_matches_find_azim():
+    rfR, rfT = _demo_()
+    harmonics = Harmonics(rfR, rfT)
+    harmonics.dcomp_find_azim()
+    CC, azims = _resample_ones_(harmonics, harmonics.azim)
+    assert azims[0] == harmonics.azim
+    hdata = np.array([tr.data for tr in harmonics.hstream])
+    assert np.allclose(CC[0], hdata, atol=1.e-10)
+
+    # Equivalent azimuth 180 degrees away: same ambiguity resolution
+    azim = (harmonics.azim + 180.) % 360.
+    CC, azims = _resample_ones_(harmonics, azim)
+    assert azims[0] == azim
+    assert np.allclose(CC[0, 1:3], -hdata[1:3], atol=1.e-10)
+
+
+def test_bootstrap_azim_unimodal():
+    rfR, rfT = _demo_()
+    harmonics = Harmonics(rfR, rfT)
+    harmonics.dcomp_find_azim()
+    harmonics.bootstrap(nboot=100, seed=0)
+    dev = (harmonics.azim_boot - harmonics.azim + 180.) % 360. - 180.
+    assert np.all(np.abs(dev) < 90.)
+
+
+def _ref_design_(rfR, rfT, azim):
+    # Baseline rows of the design matrix, one trace at a time
+    deg2rad = np.pi/180.
+    shift = 90.
+    H = np.zeros((len(rfR) + len(rfT), 5))
+    for irow, trace in enumerate(rfR):
+        baz = trace.stats.baz
+        H[irow] = [1.0,
+                   np.cos(deg2rad*(baz-azim)),
+                   np.sin(deg2rad*(baz-azim)),
+                   np.cos(2.*deg2rad*(baz-azim)),
+                   np.sin(2.*deg2rad*(baz-azim))]
+    for irow, trace in enumerate(rfT):
+        baz = trace.stats.baz
+        H[irow+len(rfR)] = [0.0,
+                            np.cos(deg2rad*(baz+shift-azim)),
+                            np.sin(deg2rad*(baz+shift-azim)),
+                            np.cos(2.*deg2rad*(baz+shift/2.0-azim)),
+                            np.sin(2.*deg2rad*(baz+shift/2.0-azim))]
+    return H
+
+
+def test_find_azim_matches_reference():
+    rfR, rfT = _demo_()
+    harmonics = Harmonics(rfR, rfT)
+    harmonics.dcomp_find_azim()
+
+    # Truncated SVD solution for each azimuth, as in the baseline loop
+    naz = 180
+    daz = float(360/naz)
+    delta = rfR[0].stats.delta
+    indmin = int(harmonics.xmin/delta)
+    indmax = int(harmonics.xmax/delta)
+    OBS = np.array([tr.data for tr in rfR] + [tr.data for tr in rfT])
+    CC = np.zeros((naz, 5, OBS.shape[1]))
+    for iaz in range(naz):
+        u, s, v = np.linalg.svd(_ref_design_(rfR, rfT, iaz*daz))
+        s[s < 0.001] = 0.
+        CC[iaz] = np.linalg.solve(s[:, None]*v, u.T.dot(OBS)[:5])
+    C1var = np.sqrt(np.mean(np.square(CC[:, 1, indmin:indmax]), axis=-1))
+    indaz = np.argmin(C1var)
+
+    assert harmonics.azim == indaz*daz
+    hdata = np.array([tr.data for tr in harmonics.hstream])
+    assert np.allclose(hdata, CC[indaz], atol=1.e-10)
+    assert np.allclose(harmonics.var, np.sqrt(np.mean(
+        np.square(CC[indaz, :, indmin:indmax]), axis=-1)))
+
+
+def test_forward_matches_reference():
+    rfR, rfT = _demo_()
+    harmonics = Harmonics(rfR, rfT)
+    harmonics.dcomp_find_azim()
+    baz_list = [0., 45., 133.3, 270.]
+    harmonics.forward(baz_list)
+
+    # Baseline product B = H*X, one back-azimuth and sample at a time
+    deg2rad = np.pi/180.
+    shift = 90.
+    azim = harmonics.azim
+    X = np.array([tr.data for tr in harmonics.hstream])
+    for ibaz, baz in enumerate(baz_list):
+        H = np.array([
+            [1.0,
+             np.cos(deg2rad*(baz-azim)),
+             np.sin(deg2rad*(baz-azim)),
+             np.cos(2.*deg2rad*(baz-azim)),
+             np.sin(2.*deg2rad*(baz-azim))],
+            [0.0,
+             np.cos(deg2rad*(baz+shift-azim)),
+             np.sin(deg2rad*(baz+shift-azim)),
+             np.cos(2.*deg2rad*(baz+shift/2.0-azim)),
+             np.sin(2.*deg2rad*(baz+shift/2.0-azim))]])
+        for iz in range(X.shape[1]):
+            B = np.dot(H, X[:, iz])
+            assert np.isclose(harmonics.radial_forward[ibaz].data[iz], B[0])
+            assert np.isclose(harmonics.transv_forward[ibaz].data[iz], -B[1])
+        assert harmonics.radial_forward[ibaz].stats.baz == baz
+
+    # Dense output holds the same data
+    radial = np.array([tr.data for tr in harmonics.radial_forward])
+    transv = np.array([tr.data for tr in harmonics.transv_forward])
+    harmonics.forward(baz_list, dense=True)
+    assert np.array_equal(harmonics.radial_forward, radial)
+    assert np.array_equal(harmonics.transv_forward, transv)
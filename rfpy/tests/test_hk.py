@@ -0,0 +1,155 @@
+import os
+import pickle
+import numpy as np
+from scipy.signal import hilbert
+from rfpy import HkStack
+
+
+def _demo_(ntr=20):
+    file = open(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "examples/data", "demo_streams.pkl"), 'rb')
+    rfRstream = pickle.load(file)
+    file.close()
+    rfRstream = rfRstream[0:ntr]
+    return rfRstream
+
+
+def _hkstack_(rfV1, rfV2=None):
+    hkstack = HkStack(rfV1, rfV2)
+    hkstack.hbound = [30., 40.]
+    hkstack.dh = 2.
+    hkstack.kbound = [1.6, 1.9]
+    hkstack.dk = 0.1
+    hkstack.strikebound = [0., 360.]
+    hkstack.dstrike = 120.
+    hkstack.dipbound = [0., 20.]
+    hkstack.ddip = 10.
+    return hkstack
+
+
+def _ref_shift_(trace, tt):
+    # Scalar Fourier time shift
+    freq = np.fft.fftfreq(trace.stats.npts, d=trace.stats.delta)
+    ftrace = np.fft.fft(trace.data)
+    for i in range(len(freq)):
+        ftrace[i] = ftrace[i]*np.exp(2.*np.pi*1j*freq[i]*tt)
+    return np.real(np.fft.ifft(ftrace))
+
+
+def _ref_dtime_(trace, z, r, vp, ph):
+    slow = trace.stats.slow
+    c1 = np.sqrt((r/vp)**2 - slow**2)
+    c2 = np.sqrt((1./vp)**2 - slow**2)
+    if ph == 'ps':
+        return z*(c1 - c2)
+    elif ph == 'pps':
+        return z*(c1 + c2)
+    return 2.*z*c1
+
+
+def _ref_dtime_dip_(trace, z, r, vp, ph, strike, dip):
+    ai = 8.1
+    br = vp/r
+    a = vp*vp
+    dip = dip*np.pi/180.
+    strike = strike*np.pi/180.
+    n = [np.sin(strike)*np.sin(dip), -np.cos(strike)*np.sin(dip),
+         np.cos(dip)]
+    theta = trace.stats.baz*np.pi/180. + np.pi
+    slow = trace.stats.slow
+    pinc = [slow*np.cos(theta), slow*np.sin(theta),
+            -np.sqrt(1./(ai*ai) - slow*slow)]
+    c1 = n[2]
+    ndotpi = sum(n[i]*pinc[i] for i in range(3))
+    c2 = 1./(ai*ai) - ndotpi**2
+    if ph == 'ps':
+        return z*(c1*(np.sqrt(r*r/a - c2) - np.sqrt(1./a - c2)))
+    qp = np.sqrt(1./a - c2)
+    pref = [pinc[i] - ndotpi*n[i] - qp*n[i] for i in range(3)]
+    if ph == 'pps':
+        pref[2] = -pref[2]
+        ndotpr = sum(n[i]*pref[i] for i in range(3))
+        c4 = 1./a - ndotpr**2
+        return z*(c1*(np.sqrt(r*r/a - c4) + np.sqrt(1./a - c4)))
+    pref[2] = np.sqrt(1./(br*br) - pref[0]*pref[0] - pref[1]*pref[1])
+    ndotpr = sum(n[i]*pref[i] for i in range(3))
+    c6 = 1./(br*br) - ndotpr**2
+    return z*(2.*c1*np.sqrt(r*r/a - c6))
+
+
+def _ref_stack_(hkstack, vp, dtime):
+    # Scalar reference loop over grid cells, phases and traces, with
+    # the phase weight reset for each cell and phase
+    H = np.arange(hkstack.hbound[0], hkstack.hbound[1] + hkstack.dh,
+                  hkstack.dh)
+    k = np.arange(hkstack.kbound[0], hkstack.kbound[1] + hkstack.dk,
+                  hkstack.dk)
+    ntr = len(hkstack.rfV1)
+    pws = np.zeros((len(H), len(k), len(hkstack.phases)))
+    sig = np.zeros((len(H), len(k), len(hkstack.phases)))
+    for ih in range(len(H)):
+        for ik, kk in enumerate(k):
+            for ip, ph in enumerate(hkstack.phases):
+                if hkstack.rfV2 and (ph == 'pps' or ph == 'pss'):
+                    rfV = hkstack.rfV2
+                else:
+                    rfV = hkstack.rfV1
+                weight = 0.
+                amp = np.zeros(ntr)
+                for i in range(ntr):
+                    tt = dtime(rfV[i], H[ih], kk, vp, ph)
+                    trace = _ref_shift_(rfV[i], tt)
+                    thilb = hilbert(trace)
+                    weight += np.exp(1j*np.angle(thilb[0]))
+                    amp[i] = trace[0]
+                weight = abs(weight/ntr)**4
+                sig[ih, ik, ip] = np.var(amp)*weight
+                pws[ih, ik, ip] = np.median(amp)*weight
+    return sig, pws
+
+
+def _assert_close_(stack, ref):
+    # Oversampled linear interpolation approximates the Fourier shift
+    for ip in range(ref.shape[-1]):
+        scale = np.abs(ref[..., ip]).max()
+        assert np.allclose(stack[..., ip], ref[..., ip], rtol=0.,
+                           atol=0.02*scale)
+
+
+def test_stack_matches_reference():
+    rfV1 = _demo_()
+    rfV2 = rfV1.copy().filter('lowpass', freq=0.5, zerophase=True)
+    hkstack = _hkstack_(rfV1, rfV2)
+    hkstack.stack(vp=6.)
+    sig, pws = _ref_stack_(hkstack, 6., _ref_dtime_)
+    _assert_close_(hkstack.pws, pws)
+    _assert_close_(hkstack.sig, sig)
+
+
+def test_stack_dip_matches_reference():
+    rfV1 = _demo_()
+    rfV2 = rfV1.copy().filter('lowpass', freq=0.5, zerophase=True)
+    hkstack = _hkstack_(rfV1, rfV2)
+    hkstack.stack_dip(vp=6., strike=215., dip=15.)
+
+    def dtime(trace, z, r, vp, ph):
+        return _ref_dtime_dip_(trace, z, r, vp, ph, 215., 15.)
+
+    sig, pws = _ref_stack_(hkstack, 6., dtime)
+    _assert_close_(hkstack.pws, pws)
+    _assert_close_(hkstack.sig, sig)
+
+
+def test_search_dip_matches_stack_dip():
+    rfV1 = _demo_()
+    hkstack = _hkstack_(rfV1)
+    hkstack.search_dip(vp=6.)
+    pws_dip = hkstack.pws_dip.copy()
+    sig_dip = hkstack.sig_dip.copy()
+    for istr in range(1, len(hkstack.strikes)):
+        for idip in range(1, len(hkstack.dips)):
+            hkstack.stack_dip(vp=6., strike=hkstack.strikes[istr],
+                              dip=hkstack.dips[idip])
+            assert np.allclose(pws_dip[:, :, istr, idip, :], hkstack.pws)
+            assert np.allclose(sig_dip[:, :, istr, idip, :], hkstack.sig)
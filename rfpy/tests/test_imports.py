@@ -9,8 +9,15 @@ def test_rfpy_modules():
     from rfpy import RFData
     from rfpy import HkStack
     from rfpy import Harmonics
+    from rfpy import CCPimage
+    from rfpy import CCPvolume
+    from rfpy import RFArray
     from rfpy import plotting
     from rfpy import binning
     from rfpy import ccp
+    from rfpy import shift
+    from rfpy import rfarray
+    from rfpy import archive
+    from rfpy import traveltime
     import matplotlib
     matplotlib.use('Agg')
@@ -0,0 +1,27 @@
+import numpy as np
+from obspy.taup import TauPyModel
+from rfpy.traveltime import TravelTimeTable
+
+
+def test_interp_matches_taup():
+    rng = np.random.default_rng(0)
+    gac = rng.uniform(30., 90., 12)
+    dep = rng.uniform(0., 200., 12)
+    table = TravelTimeTable(phase='P', model='iasp91', cachedir=False)
+    time, rayp, inc = table.interp(gac, dep)
+
+    model = TauPyModel(model='iasp91')
+    for i in range(len(gac)):
+        arrival = model.get_travel_times(
+            source_depth_in_km=dep[i], distance_in_degree=gac[i],
+            phase_list=['P'])[0]
+        assert abs(time[i] - arrival.time) < 0.02
+        assert abs(rayp[i] - arrival.ray_param_sec_degree) < 0.01
+        assert abs(inc[i] - arrival.incident_angle) < 0.05
+
+
+def test_interp_outside_grid():
+    table = TravelTimeTable(phase='P', model='iasp91', cachedir=False)
+    time, rayp, inc = table.interp([60., 200.], [900., 10.])
+    assert np.all(np.isnan(time))
+    assert not np.any(table.done)
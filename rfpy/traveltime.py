@@ -0,0 +1,315 @@
+# Copyright 2019 Pascal Audet
+#
+# This file is part of RfPy.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Functions to obtain teleseismic travel times, ray parameters and incidence
+angles from tables precomputed with :mod:`obspy.taup`. Each
+:class:`~rfpy.traveltime.TravelTimeTable` object holds a grid of
+distances and source depths for one phase and velocity model. Depths of
+the grid are calculated when first needed, stored on disk and
+interpolated bilinearly. Queries that fall near grid nodes without a
+single arrival (e.g., triplications or shadow zones) are calculated
+exactly.
+
+"""
+
+import os
+import numpy as np
+from pathlib import Path
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _model_(model):
+    """
+    Returns the (cached) :class:`~obspy.taup.TauPyModel` object of a
+    velocity model.
+
+    """
+
+    from obspy.taup import TauPyModel
+
+    return TauPyModel(model=model)
+
+
+class TravelTimeTable(object):
+    """
+    A TravelTimeTable object contains travel times, ray parameters and
+    incidence angles of one phase on a grid of epicentral distances and
+    source depths.
+
+    Parameters
+    ----------
+    phase : str
+        Phase name (e.g., 'P', 'PP', 'S', 'SKS')
+    model : str
+        Name of velocity model known to :mod:`obspy.taup`
+    ddist : float
+        Distance interval of the grid (degree)
+    ddep : float
+        Depth interval of the grid (km). Discontinuities of the velocity
+        model are added to the depths of the grid.
+    cachedir : str or :class:`~pathlib.Path`
+        Folder where the table is stored. Default is ``~/.cache/rfpy``.
+        Set to ``False`` to disable the on-disk cache.
+
+    Other Parameters
+    ----------------
+    dist : :class:`~numpy.ndarray`
+        Epicentral distances of the grid (degree)
+    dep : :class:`~numpy.ndarray`
+        Source depths of the grid (km)
+    time : :class:`~numpy.ndarray`
+        Travel times (sec, shape ``ndep, ndist``)
+    rayp : :class:`~numpy.ndarray`
+        Ray parameters (sec/degree)
+    inc : :class:`~numpy.ndarray`
+        Incidence angles (degree)
+    narr : :class:`~numpy.ndarray`
+        Number of arrivals of the phase
+    done : :class:`~numpy.ndarray`
+        Whether each depth of the grid has been calculated
+
+    """
+
+    def __init__(self, phase='P', model='iasp91', ddist=1., ddep=10.,
+                 cachedir=None, maxdep=800.):
+
+        self.phase = phase
+        self.model = model
+
+        # Grid of distances and depths, including discontinuities
+        disc = _model_(model).model.s_mod.v_mod.get_discontinuity_depths()
+        self.dist = np.arange(0., 180.+0.5*ddist, ddist)
+        self.dep = np.unique(np.concatenate((
+            np.arange(0., maxdep+0.5*ddep, ddep), disc[disc <= maxdep])))
+
+        shape = (len(self.dep), len(self.dist))
+        self.time = np.full(shape, np.nan)
+        self.rayp = np.full(shape, np.nan)
+        self.inc = np.full(shape, np.nan)
+        self.narr = np.zeros(shape, dtype=int)
+        self.done = np.zeros(len(self.dep), dtype=bool)
+
+        if cachedir is None:
+            cachedir = Path.home() / '.cache' / 'rfpy'
+        if cachedir is False:
+            self.file = None
+        else:
+            self.file = Path(cachedir) / 'traveltimes_{0}_{1}.npz'.format(
+                model, phase)
+            self._load_()
+
+    def _load_(self):
+        """
+        Loads calculated depths from the on-disk cache, if the grids match.
+
+        """
+
+        if not self.file.is_file():
+            return
+        try:
+            cache = np.load(self.file)
+            if not (np.array_equal(cache['dist'], self.dist) and
+                    np.array_equal(cache['dep'], self.dep)):
+                return
+            for name in ['time', 'rayp', 'inc', 'narr', 'done']:
+                setattr(self, name, cache[name])
+        except Exception:
+            return
+
+    def _save_(self):
+        """
+        Saves the table to the on-disk cache, if possible.
+
+        """
+
+        if self.file is None:
+            return
+        try:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.file.parent / ('.{0}.{1}.npz'.format(
+                self.file.stem, os.getpid()))
+            np.savez(tmp, dist=self.dist, dep=self.dep, time=self.time,
+                     rayp=self.rayp, inc=self.inc, narr=self.narr,
+                     done=self.done)
+            os.replace(tmp, self.file)
+        except OSError:
+            return
+
+    def _calc_(self, ideps):
+        """
+        Calculates the travel times at all distances for depths of indices
+        ``ideps`` that have not been calculated yet.
+
+        """
+
+        from obspy.taup.seismic_phase import SeismicPhase
+
+        ideps = [i for i in np.unique(ideps) if not self.done[i]]
+        if len(ideps) == 0:
+            return
+
+        tau_model = _model_(self.model).model
+        for idep in ideps:
+            phase = SeismicPhase(
+                self.phase, tau_model.depth_correct(self.dep[idep]))
+            for idist, dist in enumerate(self.dist):
+                arrivals = phase.calc_time(dist)
+                self.narr[idep, idist] = len(arrivals)
+                if len(arrivals) > 0:
+                    self.time[idep, idist] = arrivals[0].time
+                    self.rayp[idep, idist] = \
+                        arrivals[0].ray_param_sec_degree
+                    self.inc[idep, idist] = arrivals[0].incident_angle
+            self.done[idep] = True
+
+        self._save_()
+
+    def interp(self, gac, dep):
+        """
+        Method to interpolate travel times, ray parameters and incidence
+        angles at given distances and depths. Values are NaN where any of
+        the surrounding grid nodes has no or several arrivals, or outside
+        of the grid, in which case exact values should be calculated with
+        :func:`~rfpy.traveltime.arrival`.
+
+        Parameters
+        ----------
+        gac : float or :class:`~numpy.ndarray`
+            Epicentral distances (degree)
+        dep : float or :class:`~numpy.ndarray`
+            Source depths (km)
+
+        Returns
+        -------
+        time : :class:`~numpy.ndarray`
+            Travel times (sec)
+        rayp : :class:`~numpy.ndarray`
+            Ray parameters (sec/degree)
+        inc : :class:`~numpy.ndarray`
+            Incidence angles (degree)
+
+        """
+
+        gac, dep = np.broadcast_arrays(
+            np.asarray(gac, dtype=float), np.asarray(dep, dtype=float))
+        inside = (gac >= self.dist[0]) & (gac <= self.dist[-1]) & \
+            (dep >= self.dep[0]) & (dep <= self.dep[-1])
+
+        # Cells containing each query
+        ix = np.clip(np.searchsorted(self.dist, gac, side='right') - 1,
+                     0, len(self.dist) - 2)
+        iz = np.clip(np.searchsorted(self.dep, dep, side='right') - 1,
+                     0, len(self.dep) - 2)
+        self._calc_(np.concatenate((iz[inside], iz[inside] + 1)))
+
+        wx = (gac - self.dist[ix])/(self.dist[ix+1] - self.dist[ix])
+        wz = (dep - self.dep[iz])/(self.dep[iz+1] - self.dep[iz])
+
+        # Bilinear weights of the four corners
+        corners = [(iz, ix, (1.-wz)*(1.-wx)), (iz, ix+1, (1.-wz)*wx),
+                   (iz+1, ix, wz*(1.-wx)), (iz+1, ix+1, wz*wx)]
+
+        single = inside.copy()
+        for jz, jx, w in corners:
+            single &= self.narr[jz, jx] == 1
+
+        values = []
+        for table in [self.time, self.rayp, self.inc]:
+            value = sum(w*table[jz, jx] for jz, jx, w in corners)
+            values.append(np.where(single, value, np.nan))
+
+        return tuple(values)
+
+
+@lru_cache(maxsize=None)
+def get_table(phase='P', model='iasp91'):
+    """
+    Function to obtain the (cached) travel-time table of a phase, which is
+    shared by all queries in the current process.
+
+    Parameters
+    ----------
+    phase : str
+        Phase name
+    model : str
+        Name of velocity model
+
+    Returns
+    -------
+    table : :class:`~rfpy.traveltime.TravelTimeTable`
+        Travel-time table
+
+    """
+
+    return TravelTimeTable(phase=phase, model=model)
+
+
+def arrival(gac, dep, phase='P', model='iasp91', exact=False):
+    """
+    Function to obtain the travel time, ray parameter and incidence angle
+    of a phase for one source-receiver geometry. Values are interpolated
+    from the travel-time table of the phase, or calculated exactly with
+    :meth:`~obspy.taup.TauPyModel.get_travel_times` where the table cannot
+    be interpolated.
+
+    Parameters
+    ----------
+    gac : float
+        Epicentral distance (degree)
+    dep : float
+        Source depth (km)
+    phase : str
+        Phase name
+    model : str
+        Name of velocity model
+    exact : bool
+        Whether to always calculate exact values
+
+    Returns
+    -------
+    values : tuple
+        Travel time (sec), ray parameter (sec/degree) and incidence angle
+        (degree) of the first arrival, or ``None`` if the phase does not
+        exist at this distance
+
+    """
+
+    if not exact:
+        time, rayp, inc = get_table(phase, model).interp(gac, dep)
+        if np.isfinite(time):
+            return float(time), float(rayp), float(inc)
+
+    # Get Travel times (Careful: here dep is in meters)
+    arrivals = _model_(model).get_travel_times(
+        distance_in_degree=gac,
+        source_depth_in_km=dep,
+        phase_list=[phase])
+    if len(arrivals) > 1:
+        print("arrival has many entries: ", len(arrivals))
+    elif len(arrivals) == 0:
+        print("no arrival found")
+        return None
+
+    return (arrivals[0].time, arrivals[0].ray_param_sec_degree,
+            arrivals[0].incident_angle)
@@ -3,6 +3,7 @@ from obspy import UTCDateTime
 from numpy import nan, isnan, abs
 import numpy as np
 from obspy.core import Stream, read
+from rfpy import shift
 
 
 def floor_decimal(n, decimals=0):
@@ -10,27 +11,21 @@ def floor_decimal(n, decimals=0):
     return math.floor(n * multiplier) / multiplier
 
 
-def traceshift(trace, tt):
+def traceshift(trace, tt, shifter=None):
     """
-    Function to shift traces in time given travel time
+    Function to shift traces in time given travel time. To shift the
+    same trace by several travel times, pass a
+    :class:`~rfpy.shift.Shifter` object of the trace, such that its
+    spectrum is calculated only once.
 
     """
 
-    # Define frequencies
-    nt = trace.stats.npts
-    dt = trace.stats.delta
-    freq = np.fft.fftfreq(nt, d=dt)
+    if shifter is None:
+        shifter = shift.Shifter(trace.data, trace.stats.delta)
 
-    # Fourier transform
-    ftrace = np.fft.fft(trace.data)
-
-    # Shift
-    for i in range(len(freq)):
-        ftrace[i] = ftrace[i]*np.exp(-2.*np.pi*1j*freq[i]*tt)
-
-    # Back Fourier transform and return as trace
+    # Shift and return as trace
     rtrace = trace.copy()
-    rtrace.data = np.real(np.fft.ifft(ftrace))
+    rtrace.data = shifter.shift(-tt)
 
     # Update start time
     rtrace.stats.starttime -= tt
@@ -38,10 +33,105 @@ def traceshift(trace, tt):
     return rtrace
 
 
-def list_local_data_stn(lcldrs=list, sta=None, net=None, dtype='SAC', altnet=[]):
+def _scan_local_(lcldr, cachedir=None):
+    """
+    Function to list all files under a local data directory. The listing
+    of each folder is stored in an on-disk cache along with the
+    modification time of the folder, such that only the folders where
+    files were added or removed since the last call are read again.
+
+    Parameters
+    ----------
+    lcldr : str
+        Local data directory
+    cachedir : str or :class:`~pathlib.Path`
+        Folder where the listing is stored. Default is ``~/.cache/rfpy``.
+        Set to ``False`` to disable the on-disk cache.
+
+    Returns
+    -------
+    listing : List
+        List of tuples with the path to each folder and the names of the
+        files it contains
+
+    """
+    import os
+    import pickle
+    from hashlib import md5
+    from pathlib import Path
+
+    if cachedir is None:
+        cachedir = Path.home() / '.cache' / 'rfpy'
+    if cachedir is False:
+        cache = None
+    else:
+        root = os.path.abspath(lcldr)
+        cache = Path(cachedir) / 'localdata_{0}.pkl'.format(
+            md5(root.encode()).hexdigest())
+
+    # Listings from previous call, keyed by path relative to lcldr
+    folders = {}
+    if cache is not None and cache.is_file():
+        try:
+            file = open(cache, "rb")
+            folders = pickle.load(file)
+            file.close()
+        except Exception:
+            folders = {}
+
+    scanned = {}
+    changed = False
+    stack = ['']
+    while len(stack) > 0:
+        rel = stack.pop()
+        folder = os.path.join(lcldr, rel) if rel else lcldr
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            continue
+        if rel in folders and folders[rel][0] == mtime:
+            entry = folders[rel]
+        else:
+            # Same as os.walk: symbolic links to folders are not followed
+            subdirs = []
+            filenames = []
+            try:
+                for item in os.scandir(folder):
+                    if item.is_dir():
+                        if not item.is_symlink():
+                            subdirs.append(item.name)
+                    else:
+                        filenames.append(item.name)
+            except OSError:
+                continue
+            entry = (mtime, subdirs, filenames)
+            changed = True
+        scanned[rel] = entry
+        stack.extend([os.path.join(rel, name) for name in entry[1]])
+
+    if cache is not None and (changed or len(scanned) != len(folders)):
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.parent / ('.{0}.{1}.pkl'.format(
+                cache.stem, os.getpid()))
+            file = open(tmp, "wb")
+            pickle.dump(scanned, file)
+            file.close()
+            os.replace(tmp, cache)
+        except OSError:
+            pass
+
+    return [(os.path.join(lcldr, rel) if rel else lcldr, entry[2])
+            for rel, entry in scanned.items()]
+
+
+def list_local_data_stn(lcldrs=list, sta=None, net=None, dtype='SAC',
+                        altnet=[], cachedir=None):
     """
     Function to take the list of local directories and recursively
-    find all data that matches the station name
+    find all data that matches the station name. The directory listings
+    are cached on disk and only re-read for folders that were modified
+    since the last call (see :func:`~rfpy.utils._scan_local_`).
 
     Parameters
     ----------
@@ -53,19 +143,22 @@ def list_local_data_stn(lcldrs=list, sta=None, net=None, dtype='SAC', altnet=[])
         Network name
     altnet : List
         List of alternative networks
+    cachedir : str or :class:`~pathlib.Path`
+        Folder where the directory listings are stored. Default is
+        ``~/.cache/rfpy``. Set to ``False`` to disable the on-disk cache.
 
     Returns
     -------
-    fpathmatch : List
-        Sorted list of matched directories
+    fpathmatch : :class:`~rfpy.utils.LocalIndex`
+        Sorted list of matched files, indexed for look up by
+        :func:`~rfpy.utils.parse_localdata_for_comp`
 
     """
     from fnmatch import filter
-    from os import walk
     from os.path import join
 
     if sta is None:
-        return []
+        return LocalIndex()
     else:
         if net is None:
             sstrings = ['*.{0:s}.*.{1:s}'.format(sta, dtype)]
@@ -79,16 +172,345 @@ def list_local_data_stn(lcldrs=list, sta=None, net=None, dtype='SAC', altnet=[])
     fpathmatch = []
     # Loop over all local data directories
     for lcldr in lcldrs:
-        # Recursiely walk through directory
-        for root, dirnames, filenames in walk(lcldr):
+        # Recursively list directory
+        for root, filenames in _scan_local_(lcldr, cachedir=cachedir):
             # Keep paths only for those matching the station
             for sstring in sstrings:
                 for filename in filter(filenames, sstring):
                     fpathmatch.append(join(root, filename))
 
-    fpathmatch.sort()
+    return LocalIndex(fpathmatch)
+
+
+class LocalIndex(list):
+    """
+    A LocalIndex object is a sorted list of paths to local day files,
+    which are also indexed by network, station, channel, year and julian
+    day, such that the files for a given component and day are found
+    without scanning the whole list. File names must follow the
+    convention ``YYYY.JJJ.NET.STA.LOC.CHN.dtype``, where the location
+    code may be empty; other files are kept in the list but not indexed.
+
+    Parameters
+    ----------
+    paths : List
+        List of paths to local day files
+
+    Other Parameters
+    ----------------
+    files : Dict
+        Lists of paths keyed by ``(network, station, channel, year,
+        julday)``
+    channels : Dict
+        Sorted lists of channels keyed by ``(network, station, year,
+        julday)``
+
+    """
+
+    def __init__(self, paths=[]):
+
+        from os.path import basename
+
+        super(LocalIndex, self).__init__(sorted(paths))
+
+        self.files = {}
+        self.channels = {}
+        for path in self:
+            parts = basename(path).split('.')
+            if len(parts) < 7:
+                continue
+            yr, jd, net, sta, chn = parts[0], parts[1], parts[2], \
+                parts[3], parts[-2]
+            key = (net, sta, chn, yr, jd)
+            if key not in self.files:
+                self.files[key] = []
+                self.channels.setdefault((net, sta, yr, jd), []).append(chn)
+            self.files[key].append(path)
+        for chns in self.channels.values():
+            chns.sort()
+
+    def lookup(self, networks, station, channel, comp, year, julday,
+               dtype='SAC'):
+        """
+        Method to find the files of a given component and day. Files
+        recorded on ``channel`` (band and instrument codes) are returned
+        if any, otherwise files of any channel ending with ``comp``.
+
+        Parameters
+        ----------
+        networks : List
+            List of network names
+        station : str
+            Station name
+        channel : str
+            Channel name (only the first two letters are used)
+        comp : str
+            Component (one letter only)
+        year : str
+            Year (four digits)
+        julday : str
+            Julian day (three digits)
+        dtype : str
+            File extension
+
+        Returns
+        -------
+        lclfiles : List
+            List of paths
+
+        """
+
+        ext = '.' + dtype
+
+        # Format 1
+        lclfiles = []
+        for net in networks:
+            lclfiles.extend([path for path in self.files.get(
+                (net, station, channel[0:2]+comp, year, julday), [])
+                if path.endswith(ext)])
+
+        # Format 2
+        if len(lclfiles) == 0:
+            for net in networks:
+                netfiles = []
+                for chn in self.channels.get((net, station, year, julday), []):
+                    if chn.endswith(comp):
+                        netfiles.extend([path for path in self.files[
+                            (net, station, chn, year, julday)]
+                            if path.endswith(ext)])
+                lclfiles.extend(sorted(netfiles))
+
+        return lclfiles
+
+
+def _local_files_(stdata, sta, comp, year, julday, dtype):
+    """
+    Function to find the local files of a component for one day, first
+    for the station network and then for its alternate networks.
+
+    """
+
+    lclfiles = stdata.lookup(
+        [sta.network.upper()], sta.station.upper(), sta.channel.upper(),
+        comp.upper(), year, julday, dtype=dtype)
+
+    # Alternate Nets (for CN/PO issues)
+    if len(lclfiles) == 0:
+        lclfiles = stdata.lookup(
+            [anet.upper() for anet in sta.altnet], sta.station.upper(),
+            sta.channel.upper(), comp.upper(), year, julday, dtype=dtype)
+
+    return lclfiles
+
 
-    return fpathmatch
+class _DayCache(object):
+    """
+    Cache of local day files. The headers of each file are kept, such
+    that the time coverage of a file is known without decoding its data.
+    On first access, only the samples (SAC) or records (MiniSEED)
+    overlapping the requested window are decoded. Files accessed again
+    (e.g., by several events on the same day) are decoded whole and kept
+    in a least-recently-used cache, bounded by the number of bytes of
+    waveform data.
+
+    """
+
+    def __init__(self, maxbytes=512*1024**2):
+
+        from collections import OrderedDict
+
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.streams = OrderedDict()
+        self.headers = {}
+        self.seen = set()
+
+    def _key_(self, path):
+
+        import os
+
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def header(self, path, dtype='SAC'):
+        """
+        Method to read the headers of a day file, without its data.
+
+        Returns
+        -------
+        header : :class:`~obspy.core.Stream`
+            Traces without data
+        byteorder : str
+            Byte order of an evenly sampled SAC file (``None`` otherwise)
+
+        """
+
+        key = self._key_(path)
+        if path in self.headers and self.headers[path][0] == key:
+            return self.headers[path][1:]
+
+        header, byteorder = None, None
+        if dtype.upper() == 'SAC':
+            from obspy.io.sac import SACTrace
+            try:
+                sac = SACTrace.read(path, headonly=True)
+                # Windowed reads only for evenly sampled time series
+                if sac.leven and sac.iftype == 'itime':
+                    byteorder = sac.byteorder
+                header = Stream([sac.to_obspy_trace()])
+            except Exception:
+                header = None
+        if header is None:
+            header = read(path, headonly=True)
+
+        self.headers[path] = (key, header, byteorder)
+
+        return header, byteorder
+
+    def coverage(self, path, dtype='SAC'):
+        """
+        Method to obtain the time coverage of a day file from its headers.
+
+        Returns
+        -------
+        starttime : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            Time of first sample (``None`` if the file is empty)
+        endtime : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            Time of last sample (``None`` if the file is empty)
+        delta : float
+            Sampling interval (``None`` if the file is empty)
+
+        """
+
+        header, byteorder = self.header(path, dtype)
+        if len(header) == 0:
+            return None, None, None
+
+        return (min([tr.stats.starttime for tr in header]),
+                max([tr.stats.endtime for tr in header]),
+                header[0].stats.delta)
+
+    def read(self, path, dtype='SAC', starttime=None, endtime=None):
+        """
+        Method to read a day file, or the part of a day file covering
+        ``starttime`` to ``endtime`` plus one sample on each side, from
+        the cache if the file was already decoded and has not been
+        modified since.
+
+        """
+
+        key = self._key_(path)
+        window = starttime is not None and endtime is not None
+
+        if key in self.streams:
+            self.streams.move_to_end(key)
+            st = self.streams[key][0]
+            if window:
+                delta = st[0].stats.delta
+                return st.slice(starttime-delta, endtime+delta).copy()
+            return st.copy()
+
+        # First access: decode the window only
+        if window and (key not in self.seen or self.maxbytes <= 0):
+            self.seen.add(key)
+            header, byteorder = self.header(path, dtype)
+            if len(header) > 0:
+                delta = header[0].stats.delta
+                if dtype.upper() == 'SAC' and byteorder is not None:
+                    return _read_sac_window_(
+                        path, header[0], byteorder, starttime-delta,
+                        endtime+delta)
+                elif dtype.upper() == 'MSEED':
+                    st = read(path, format='MSEED',
+                              starttime=starttime-delta,
+                              endtime=endtime+delta)
+                    if len(st) > 1:
+                        st.merge(method=1, interpolation_samples=-1,
+                                 fill_value=-123456789)
+                    return st
+
+        st = read(path)
+        if dtype.upper() == 'MSEED':
+            if len(st) > 1:
+                st.merge(method=1, interpolation_samples=-1,
+                         fill_value=-123456789)
+
+        nbytes = sum([tr.data.nbytes for tr in st])
+        if nbytes <= self.maxbytes:
+            self.streams[key] = (st.copy(), nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.maxbytes:
+                key, (old, oldbytes) = self.streams.popitem(last=False)
+                self.nbytes -= oldbytes
+
+        if window and len(st) > 0:
+            delta = st[0].stats.delta
+            st = st.slice(starttime-delta, endtime+delta)
+
+        return st
+
+    def clear(self):
+        """
+        Method to empty the cache.
+
+        """
+
+        self.streams.clear()
+        self.headers.clear()
+        self.seen.clear()
+        self.nbytes = 0
+
+
+def _read_sac_window_(path, header, byteorder, starttime, endtime):
+    """
+    Function to read the samples of an evenly sampled SAC file between
+    ``starttime`` and ``endtime`` directly from disk, given the headers
+    of the file.
+
+    """
+
+    stats = header.stats
+    npts = stats.npts
+    i0 = max(0, int(math.floor((starttime - stats.starttime)/stats.delta)))
+    i1 = min(npts, int(math.ceil((endtime - stats.starttime)/stats.delta))+1)
+    i1 = max(i0, i1)
+
+    # Data follow the 632-byte header as 4-byte floats
+    dtype = np.dtype(np.float32).newbyteorder(
+        '<' if byteorder == 'little' else '>')
+    data = np.fromfile(path, dtype=dtype, count=i1-i0, offset=632+4*i0)
+
+    tr = header.copy()
+    tr.data = data.astype(np.float32)
+    tr.stats.starttime = stats.starttime + i0*stats.delta
+    tr.stats._format = 'SAC'
+
+    return Stream([tr])
+
+
+_day_cache_ = _DayCache()
+
+
+def set_day_cache(maxbytes):
+    """
+    Function to set the maximum size of the cache of day files read by
+    :func:`~rfpy.utils.parse_localdata_for_comp`. Day files read more
+    than once are decoded whole and reused for all events falling on the
+    same day, as long as they remain in the cache; otherwise only the
+    requested window is decoded. The cache is held by each process.
+
+    Parameters
+    ----------
+    maxbytes : int
+        Maximum number of bytes of waveform data kept in memory. Set to
+        0 to disable the cache.
+
+    """
+
+    _day_cache_.maxbytes = maxbytes
+    while _day_cache_.nbytes > maxbytes:
+        key, (st, nbytes) = _day_cache_.streams.popitem(last=False)
+        _day_cache_.nbytes -= nbytes
 
 
 def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
@@ -100,8 +522,9 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
     ----------
     comp : str
         Channel for seismogram (one letter only)
-    stdata : List
-        Station list
+    stdata : :class:`~rfpy.utils.LocalIndex` or List
+        List of local files for the station (e.g., from
+        :func:`~rfpy.utils.list_local_data_stn`)
     sta : Dict
         Station metadata from :mod:`~StDb` data base
     start : :class:`~obspy.core.utcdatetime.UTCDateTime`
@@ -120,7 +543,8 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
 
     """
 
-    from fnmatch import filter
+    if not isinstance(stdata, LocalIndex):
+        stdata = LocalIndex(stdata)
 
     # Get start and end parameters
     styr = start.strftime("%Y")
@@ -137,47 +561,7 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
 
     # Time Window Spans Single Day
     if stjd == edjd:
-        # Format 1
-        lclfiles = list(filter(
-            stdata,
-            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.{4:2s}{5:1s}.{6:s}'.format(
-                styr, stjd, sta.network.upper(
-                ), sta.station.upper(), sta.channel.upper()[0:2],
-                comp.upper(), dtype)))
-        # Format 2
-        if len(lclfiles) == 0:
-            lclfiles = list(filter(
-                stdata,
-                '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.*{4:1s}.{5:s}'.format(
-                    styr, stjd, sta.network.upper(), sta.station.upper(),
-                    comp.upper(), dtype)))
-
-        # Alternate Nets (for CN/PO issues) Format 1
-        if len(lclfiles) == 0:
-            lclfiles = []
-            for anet in sta.altnet:
-                lclfiles.extend(
-                    list(
-                        filter(
-                            stdata,
-                            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.' +
-                            '{4:2s}{5:1s}.{6:s}'.format(
-                                styr, stjd, anet.upper(), sta.station.upper(),
-                                sta.channel.upper()[0:2], comp.upper(), dtype))))
-
-        # Alternate Nets (for CN/PO issues) Format 2
-        if len(lclfiles) == 0:
-            # Check Alternate Networks
-            lclfiles = []
-            for anet in sta.altnet:
-                lclfiles.extend(
-                    list(
-                        filter(
-                            stdata,
-                            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.*' +
-                            '{4:1s}.{5:s}'.format(
-                                styr, stjd, sta.network.upper(),
-                                sta.station.upper(), comp.upper(), dtype))))
+        lclfiles = _local_files_(stdata, sta, comp, styr, stjd, dtype)
 
         # If still no Local files stop
         if len(lclfiles) == 0:
@@ -186,14 +570,13 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
 
         # Process the local Files
         for sacfile in lclfiles:
-            # Read File
-            st = read(sacfile)
-            # st = read(sacfile, format="SAC")
+            # Check time coverage from headers before decoding
+            tst, ted, delta = _day_cache_.coverage(sacfile, dtype)
+            if tst is None or tst > start or ted < end:
+                continue
 
-            if dtype.upper() == 'MSEED':
-                if len(st) > 1:
-                    st.merge(method=1, interpolation_samples=-
-                             1, fill_value=-123456789)
+            # Read window only (from cache if already decoded)
+            st = _day_cache_.read(sacfile, dtype, start, end)
 
             # Should only be one component, otherwise keep reading If more
             # than 1 component, error
@@ -244,83 +627,8 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
 
     # Time Window spans Multiple days
     else:
-        # Day 1 Format 1
-        lclfiles1 = list(
-            filter(stdata,
-                   '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.{4:2s}{5:1s}.{6:s}'.format(
-                       styr, stjd, sta.network.upper(), sta.station.upper(),
-                       sta.channel.upper()[0:2], comp.upper(), dtype)))
-        # Day 1 Format 2
-        if len(lclfiles1) == 0:
-            lclfiles1 = list(
-                filter(stdata,
-                       '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.*{4:1s}.{5:s}'.format(
-                           styr, stjd, sta.network.upper(),
-                           sta.station.upper(), comp.upper(), dtype)))
-        # Day 1 Alternate Nets (for CN/PO issues) Format 1
-        if len(lclfiles1) == 0:
-            lclfiles1 = []
-            for anet in sta.altnet:
-                lclfiles1.extend(
-                    list(
-                        filter(
-                            stdata,
-                            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.' +
-                            '{4:2s}{5:1s}.{6:s}'.format(
-                                styr, stjd, anet.upper(), sta.station.upper(
-                                ), sta.channel.upper()[0:2],
-                                comp.upper(), dtype))))
-        # Day 1 Alternate Nets (for CN/PO issues) Format 2
-        if len(lclfiles1) == 0:
-            lclfiles1 = []
-            for anet in sta.altnet:
-                lclfiles1.extend(
-                    list(
-                        filter(
-                            stdata,
-                            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.*{4:1s}.{5:s}'.format(
-                                styr, stjd, anet.upper(),
-                                sta.station.upper(), comp.upper(), dtype))))
-
-        # Day 2 Format 1
-        lclfiles2 = list(
-            filter(stdata,
-                   '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.{4:2s}{5:1s}.{6:s}'.format(
-                       edyr, edjd, sta.network.upper(
-                       ), sta.station.upper(), sta.channel.upper()[0:2],
-                       comp.upper(), dtype)))
-        # Day 2 Format 2
-        if len(lclfiles2) == 0:
-            lclfiles2 = list(
-                filter(stdata,
-                       '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.*' +
-                       '{4:1s}.{5:s}'.format(
-                           edyr, edjd, sta.network.upper(),
-                           sta.station.upper(),
-                           comp.upper(), dtype)))
-        # Day 2 Alternate Nets (for CN/PO issues) Format 1
-        if len(lclfiles2) == 0:
-            lclfiles2 = []
-            for anet in sta.altnet:
-                lclfiles2.extend(
-                    list(
-                        filter(
-                            stdata,
-                            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.' +
-                            '{4:2s}{5:1s}.{6:s}'.format(
-                                edyr, edjd, anet.upper(), sta.station.upper(),
-                                sta.channel.upper()[0:2], comp.upper(), dtype))))
-        # Day 2 Alternate Nets (for CN/PO issues) Format 2
-        if len(lclfiles2) == 0:
-            lclfiles2 = []
-            for anet in sta.altnet:
-                lclfiles2.extend(
-                    list(
-                        filter(
-                            stdata,
-                            '*/{0:4s}.{1:3s}.{2:s}.{3:s}.*.*{4:1s}.{5:s}'.format(
-                                edyr, edjd, anet.upper(), sta.station.upper(),
-                                comp.upper(), dtype))))
+        lclfiles1 = _local_files_(stdata, sta, comp, styr, stjd, dtype)
+        lclfiles2 = _local_files_(stdata, sta, comp, edyr, edjd, dtype)
 
         # If still no Local files stop
         if len(lclfiles1) == 0 and len(lclfiles2) == 0:
@@ -331,23 +639,26 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
         if len(lclfiles1) > 0 and len(lclfiles2) > 0:
             # Loop over first day file options
             for sacf1 in lclfiles1:
-                st1 = read(sacf1)
-                if dtype.upper() == 'MSEED':
-                    if len(st1) > 1:
-                        st1.merge(method=1, interpolation_samples=-
-                                  1, fill_value=-123456789)
+                tst1, ted1, delta1 = _day_cache_.coverage(sacf1, dtype)
+                if tst1 is None:
+                    continue
 
                 # Loop over second day file options
                 for sacf2 in lclfiles2:
-                    st2 = read(sacf2)
-                    if dtype.upper() == 'MSEED':
-                        if len(st2) > 1:
-                            st2.merge(
-                                method=1, interpolation_samples=-1, fill_value=-123456789)
-
-                    # Check time overlap of the two files.
-                    if st1[0].stats.endtime >= \
-                            st2[0].stats.starttime-st2[0].stats.delta:
+                    tst2, ted2, delta2 = _day_cache_.coverage(sacf2, dtype)
+                    if tst2 is None:
+                        continue
+
+                    # Check time overlap of the two files from headers
+                    if ted1 >= tst2-delta2:
+
+                        # Skip files that cannot cover the window
+                        if min(tst1, tst2) > start or max(ted1, ted2) < end:
+                            continue
+
+                        # Read window only from each day
+                        st1 = _day_cache_.read(sacf1, dtype, start, end)
+                        st2 = _day_cache_.read(sacf2, dtype, start, end)
                         # eddt1 = False
                         # eddt2 = False
                         # if dtype.upper() == 'SAC':
@@ -399,7 +710,7 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
                                             "*          !!! Missing Data Present !!! " +
                                             "Skipping (MSEED fill)")
                                     else:
-                                        if (eddt1 or eddt2) and (ndval == 0.0):
+                                        if eddt and (ndval == 0.0):
                                             if any(st[0].data == 0.0):
                                                 print(
                                                     "*          !!! Missing " +
@@ -413,19 +724,19 @@ def parse_localdata_for_comp(comp='Z', stdata=[], dtype='SAC', sta=None,
 
                                         # Processed succesfully...Finish
                                         print(("*          {1:3s}.{2:2s}  - " +
-                                               "From Disk".format(
+                                               "From Disk").format(
                                                    st[0].stats.station,
                                                    st[0].stats.channel.upper(),
-                                                   tloc)))
+                                                   tloc))
                                         return False, st
 
                         except:
                             pass
                     else:
-                        st2ot = st2[0].stats.endtime-st2[0].stats.delta
+                        st2ot = ted2-delta2
                         print("*                 - Merge Failed: No " +
                               "Overlap {0:s} - {1:s}".format(
-                                  st1[0].stats.endtime.strftime(
+                                  ted1.strftime(
                                       "%Y-%m-%d %H:%M:%S"),
                                   st2ot.strftime("%Y-%m-%d %H:%M:%S")))
 
@@ -455,8 +766,9 @@ def download_data(client=None, sta=None, start=UTCDateTime, end=UTCDateTime,
         Start time for request
     end : :class:`~obspy.core.utcdatetime.UTCDateTime`
         End time for request
-    stdata : List
-        Station list
+    stdata : :class:`~rfpy.utils.LocalIndex` or List
+        List of local files for the station (e.g., from
+        :func:`~rfpy.utils.list_local_data_stn`)
     ndval : float or nan
         Default value for missing data
 
@@ -488,6 +800,9 @@ def download_data(client=None, sta=None, start=UTCDateTime, end=UTCDateTime,
 
     # Check if there is local data
     if len(stdata) > 0:
+        # Index files once for all components
+        if not isinstance(stdata, LocalIndex):
+            stdata = LocalIndex(stdata)
         # Only a single day: Search for local data
         # Get Z localdata
         errZ, stZ = parse_localdata_for_comp(
@@ -41,4 +41,5 @@ setup(
     'rfpy_plot=rfpy.scripts.rfpy_plot:main',
     'rfpy_harmonics=rfpy.scripts.rfpy_harmonics:main',
     'rfpy_hk=rfpy.scripts.rfpy_hk:main',
-    'rfpy_ccp=rfpy.scripts.rfpy_ccp:main']})
+    'rfpy_ccp=rfpy.scripts.rfpy_ccp:main',
+    'rfpy_archive=rfpy.scripts.rfpy_archive:main']})